@@ -0,0 +1,9 @@
+"""
+    Benchmarks for python-OBD's query path
+
+    Run them from the root of the repository with:
+
+        python -m benchmarks [-k <filter>] [--compare] [--save]
+
+    See benchmarks/README.md
+"""
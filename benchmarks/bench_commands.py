@@ -0,0 +1,119 @@
+"""
+    OBDCommand.__call__() (ECU filtering, __constrain_message_data, the
+    response object) and each family of decoders on its own
+"""
+
+from binascii import unhexlify
+
+from obd import commands
+from obd.formulas import define
+from obd.protocols import ECU
+from obd.protocols.protocol import Frame, Message
+
+from .harness import register
+
+VIN_DATA = "490201" "575030" "5A5A5A39395A5453333932313234"
+
+# (benchmark name, command, message data)
+DECODERS = [
+    ("pid", commands.PIDS_A, "4100BE3FA813"),
+    ("status", commands.STATUS, "41018307FF00"),
+    ("single_dtc", commands.FREEZE_DTC, "41020104"),
+    ("fuel_status", commands.FUEL_STATUS, "41030100"),
+    ("percent", commands.ENGINE_LOAD, "41047F"),
+    ("temp", commands.COOLANT_TEMP, "41057B"),
+    ("percent_centered", commands.SHORT_FUEL_TRIM_1, "410680"),
+    ("pressure", commands.INTAKE_PRESSURE, "410B65"),
+    ("uas", commands.RPM, "410C1AF8"),
+    ("timing_advance", commands.TIMING_ADVANCE, "410E80"),
+    ("air_status", commands.AIR_STATUS, "411201"),
+    ("o2_sensors", commands.O2_SENSORS, "411333"),
+    ("obd_compliance", commands.OBD_COMPLIANCE, "411C01"),
+    ("sensor_voltage_big", commands.O2_S1_WR_VOLTAGE, "41248000B000"),
+    ("evap_pressure", commands.EVAP_VAPOR_PRESSURE, "4132FFF0"),
+    ("fuel_type", commands.FUEL_TYPE, "415101"),
+    ("fuel_rate", commands.FUEL_RATE, "415E0140"),
+    ("dtc", commands.GET_DTC, "4303010401130133"),
+    ("monitor", commands.MONITOR_O2_B1S1, "4601010A0BB00BB00BB0"),
+    ("encoded_string", commands.VIN, VIN_DATA),
+    ("cvn", commands.CVN, "490601" "11223344"),
+]
+
+
+def _messages(data, ecu=ECU.ENGINE):
+    message = Message([Frame("")])
+    message.data = bytearray(unhexlify(data))
+    message.ecu = ecu
+    return [message]
+
+
+def _decoder(cmd, data):
+    def setup():
+        messages = _messages(data)
+        decode = cmd.decode
+        return lambda: decode(messages)
+    return setup
+
+
+def _call(cmd, data, ecus=1):
+    def setup():
+        raw = bytearray(unhexlify(data))
+        messages = _messages(data, ECU.ENGINE) + \
+            sum([_messages(data, ECU.UNKNOWN) for _ in range(ecus - 1)], [])
+
+        def op():
+            for m in messages:
+                m.data = raw[:]  # __constrain_message_data works in place
+            cmd(messages)
+        return op
+    return setup
+
+
+def _elm_voltage():
+    messages = [Message([Frame("12.6V")])]
+    decode = commands.ELM_VOLTAGE.decode
+    return lambda: decode(messages)
+
+
+for name, cmd, data in DECODERS:
+    register("decoder.%s" % name, _decoder(cmd, data))
+register("decoder.elm_voltage", _elm_voltage)
+
+# the same decoders, compiled from formulas (see obd/formulas.py)
+FORMULA_TEMP = define({"name": "TEMP", "command": "0105", "formula": "A-40", "unit": "degC"})
+FORMULA_RPM = define({"name": "RPM", "command": "010C", "formula": "((A*256)+B)/4", "unit": "rpm"})
+register("decoder.formula.table", _decoder(FORMULA_TEMP, "41057B"))
+register("decoder.formula.2byte", _decoder(FORMULA_RPM, "410C1AF8"))
+
+register("command.call.exact", _call(commands.RPM, "410C1AF8"))
+register("command.call.padded", _call(commands.RPM, "410C1A"))
+register("command.call.trimmed", _call(commands.RPM, "410C1AF80000"))
+register("command.call.8ecu", _call(commands.RPM, "410C1AF8", ecus=8))
+register("command.call.vin", _call(commands.VIN, VIN_DATA))
+
+
+def _dispatch(data):
+    def setup():
+        (message,) = _messages(data)
+        dispatch = commands.dispatch
+        return lambda: dispatch(message)
+    return setup
+
+
+def _for_response(data):
+    def setup():
+        data_ = bytearray(unhexlify(data))
+        for_response = commands.for_response
+        return lambda: for_response(data_)
+    return setup
+
+
+def _has_command():
+    last = commands.modes[9][-1]
+    has_command = commands.has_command
+    return lambda: has_command(last)
+
+
+register("command.for_response", _for_response("410C1AF8"))
+register("command.dispatch", _dispatch("410C1AF8"))
+register("command.has_command", _has_command)
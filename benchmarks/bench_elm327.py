@@ -0,0 +1,56 @@
+"""
+    ELM327.__read(): accumulating the adapter's output, and splitting it into lines
+"""
+
+from obd.elm327 import ELM327
+from obd.utils import OBDStatus
+
+from .fixtures import BENCH_REQUEST, ECU_COUNTS, PAYLOAD_SIZES, adapter_output, ecus
+from .harness import register
+
+
+class FakePort(object):
+    """ returns the same output for every read, in chunks of the given size """
+
+    def __init__(self, output, chunk_size):
+        self.output = output
+        self.chunk_size = chunk_size
+        self.position = 0
+
+    @property
+    def in_waiting(self):
+        return min(self.chunk_size, len(self.output) - self.position)
+
+    def read(self, size=1):
+        data = self.output[self.position:self.position + size]
+        self.position += len(data)
+        return data
+
+
+def _elm(port):
+    elm = ELM327.__new__(ELM327)  # skips the connection process
+    elm._ELM327__port = port
+    elm._ELM327__status = OBDStatus.CAR_CONNECTED
+    return elm
+
+
+def _setup(output, chunk_size):
+    def setup():
+        port = FakePort(output, chunk_size)
+        read = getattr(_elm(port), "_ELM327__read")
+
+        def op():
+            port.position = 0
+            read()
+        return op
+    return setup
+
+
+for n in ECU_COUNTS:
+    output = adapter_output("6", "0100", ecus("6", n))
+    register("elm327.read.can.%decu" % n, _setup(output, 4096))
+
+for size in PAYLOAD_SIZES:
+    output = adapter_output("6", BENCH_REQUEST, ecus("6", 1, size))
+    register("elm327.read.can.%dbytes" % size, _setup(output, 4096))
+    register("elm327.read.can.%dbytes.chunked" % size, _setup(output, 32))
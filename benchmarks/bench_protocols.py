@@ -0,0 +1,33 @@
+"""
+    Protocol.__call__(): parsing lines into frames, and assembling messages
+"""
+
+from obd.protocols import ISO_15765_4_11bit_500k, ISO_15765_4_29bit_500k, SAE_J1850_VPW
+
+from .fixtures import BENCH_REQUEST, ECU_COUNTS, PAYLOAD_SIZES, adapter_lines, ecus
+from .harness import register
+
+PROTOCOLS = [
+    ("can11", "6", ISO_15765_4_11bit_500k),
+    ("can29", "7", ISO_15765_4_29bit_500k),
+    ("legacy", "2", SAE_J1850_VPW),
+]
+
+
+def _setup(cls, lines_0100, lines):
+    def setup():
+        protocol = cls(lines_0100)
+        return lambda: protocol(lines)
+    return setup
+
+
+for label, elm_id, cls in PROTOCOLS:
+    for n in ECU_COUNTS:
+        lines = adapter_lines(elm_id, "0100", ecus(elm_id, n))
+        register("protocol.%s.sf.%decu" % (label, n), _setup(cls, lines, lines))
+
+    for size in PAYLOAD_SIZES:
+        layout = ecus(elm_id, 1, size)
+        lines_0100 = adapter_lines(elm_id, "0100", layout)
+        lines = adapter_lines(elm_id, BENCH_REQUEST, layout)
+        register("protocol.%s.mf.%dbytes" % (label, size), _setup(cls, lines_0100, lines))
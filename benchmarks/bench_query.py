@@ -0,0 +1,71 @@
+"""
+    OBD.query() and Async throughput, end to end against the emulator
+    (without latency, so that only the host side is measured)
+"""
+
+import threading
+
+from obd import Async, commands
+
+from .fixtures import ECU_COUNTS, PAYLOAD_SIZES, bench_command, connect
+from .harness import register
+
+ASYNC_COMMANDS = [commands.RPM, commands.SPEED, commands.COOLANT_TEMP, commands.ENGINE_LOAD]
+ASYNC_WINDOW = 0.05  # seconds of Async polling per operation
+
+
+def _query(count=1, payload_size=None, cmd=commands.COOLANT_TEMP, **kwargs):
+    def setup():
+        connection, close = connect(count=count, payload_size=payload_size, **kwargs)
+        c = cmd if payload_size is None else bench_command(payload_size)
+
+        def op():
+            if connection.query(c, force=True).is_null():
+                raise RuntimeError("%s returned a null response" % c.name)
+        return op, close
+    return setup
+
+
+def _async(count=1):
+    def setup():
+        connection, close = connect(count=count, cls=Async, delay_cmds=0)
+        received = [0]
+        lock = threading.Lock()
+
+        def callback(r):
+            with lock:
+                received[0] += 1
+
+        for cmd in ASYNC_COMMANDS:
+            connection.watch(cmd, callback=callback)
+        connection.start()
+
+        done = threading.Event()
+
+        def op():
+            # responses per window: timed as a batch of that many operations
+            start = received[0]
+            done.wait(ASYNC_WINDOW)
+            return received[0] - start
+
+        def stop():
+            connection.stop()
+            close()
+
+        return op, stop
+    return setup
+
+
+for n in ECU_COUNTS:
+    register("query.%decu" % n, _query(count=n))
+
+for size in PAYLOAD_SIZES:
+    register("query.%dbytes" % size, _query(payload_size=size))
+
+register("query.slow", _query(fast=False))
+register("query.traced", _query(trace=True))
+register("query.vin", _query(cmd=commands.VIN))
+register("query.vin.cached", _query(cmd=commands.VIN, cache=True))
+
+for n in [1, 8]:
+    register("async.%decu" % n, _async(count=n))
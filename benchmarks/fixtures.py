@@ -0,0 +1,65 @@
+"""
+    Adapter output and connections shared by the benchmarks, generated
+    with the emulator so that they match what a real ELM327 prints
+"""
+
+import itertools
+import re
+
+import obd
+from obd import OBDCommand
+from obd.decoders import noop
+from obd.emulator import Emulator, default_ecus
+from obd.protocols import ECU
+
+ECU_COUNTS = [1, 2, 4, 8]
+PAYLOAD_SIZES = [20, 62, 254]  # bytes, all multi-frame on CAN
+
+BENCH_REQUEST = "09F0"  # answered with a payload of the requested size
+
+_names = itertools.count()
+
+
+def ecus(protocol="6", count=1, payload_size=None):
+    """ the default ECUs, answering BENCH_REQUEST with payload_size bytes when given """
+    layout = default_ecus(protocol, count)
+    if payload_size is not None:
+        payload = bytearray([0x49, 0xF0]) + bytearray(range(payload_size - 2))
+        for ecu in layout:
+            ecu.responses[BENCH_REQUEST] = bytes(payload)
+    return layout
+
+
+def adapter_output(protocol, request, layout):
+    """ returns the raw bytes printed by the adapter in response to a request """
+    e = Emulator(protocol=protocol, ecus=layout, timeout=0.0)
+    e.feed(("ATE0\rATH1\rATSP%s\r" % protocol).encode())
+    return b"".join([chunk for _, chunk in e.feed((request + "\r").encode())])
+
+
+def adapter_lines(protocol, request, layout):
+    """ returns the output of a request, split into lines as ELM327.__read() does """
+    raw = adapter_output(protocol, request, layout).decode()
+    raw = raw.rstrip(">")
+    return [s.strip() for s in re.split("[\r\n]", raw) if bool(s)]
+
+
+def bench_command(payload_size):
+    """ a command for BENCH_REQUEST, accepting any ECU """
+    return OBDCommand("BENCH_%d" % payload_size, "Benchmark payload",
+                      BENCH_REQUEST.encode(), payload_size, noop, ECU.ALL, True)
+
+
+def connect(protocol="6", count=1, payload_size=None, cls=obd.OBD, **kwargs):
+    """ opens a connection to a new emulator without latency """
+    emulator = Emulator(protocol=protocol, ecus=ecus(protocol, count, payload_size),
+                        timeout=0.0, name="bench-%d" % next(_names))
+    connection = cls("emulator://" + emulator.name, protocol=protocol, **kwargs)
+    if not connection.is_connected():
+        raise RuntimeError("could not connect to the emulator")
+
+    def close():
+        connection.close()
+        emulator.close()
+
+    return connection, close
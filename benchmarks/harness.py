@@ -0,0 +1,229 @@
+"""
+    Registry, timer and baseline comparison for the benchmarks
+
+    A benchmark is a setup function registered with @benchmark(name). The
+    setup does any expensive preparation, and returns the operation to be
+    timed, or a tuple of (operation, cleanup). The operation may return
+    the number of operations it performed (when it's a batch, or a
+    throughput measurement), otherwise each call counts as one.
+
+    Timings are also reported relative to a calibration loop of plain
+    Python, and baselines store that ratio, which makes them comparable
+    across machines of different speeds.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+
+import obd
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+MODULES = [
+    "bench_elm327",
+    "bench_protocols",
+    "bench_commands",
+    "bench_query",
+]
+
+_benchmarks = []  # (name, setup)
+
+
+def benchmark(name):
+    """ decorator registering a benchmark setup function """
+    def decorator(setup):
+        register(name, setup)
+        return setup
+    return decorator
+
+
+def register(name, setup):
+    if name in [n for n, _ in _benchmarks]:
+        raise ValueError("duplicate benchmark name: %s" % name)
+    _benchmarks.append((name, setup))
+
+
+def benchmarks():
+    """ imports the benchmark modules, returns the list of (name, setup) """
+    import importlib
+    for module in MODULES:
+        importlib.import_module("benchmarks." + module)
+    return list(_benchmarks)
+
+
+def _calibration():
+    def loop():
+        total = 0
+        for i in range(1000):
+            total += i * 2
+        return 1
+    return loop
+
+
+class Result(object):
+    """ the timing of a single benchmark """
+
+    def __init__(self, name, per_op, ops, calibration):
+        self.name = name
+        self.per_op = per_op  # seconds per operation (best run)
+        self.ops = ops  # number of operations timed per run
+        self.relative = per_op / calibration
+
+    def as_dict(self):
+        return {
+            "us_per_op": round(self.per_op * 1e6, 3),
+            "relative": round(self.relative, 4),
+        }
+
+
+def _run(fn, number):
+    ops = 0
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(number):
+            n = fn()
+            ops += n if isinstance(n, int) and n > 0 else 1
+        elapsed = time.perf_counter() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return elapsed, ops
+
+
+def measure(fn, min_time=0.1, repeat=5):
+    """
+        returns (seconds per operation, operations per run) for fn, timed
+        in runs of at least min_time seconds, keeping the fastest of
+        repeat runs
+    """
+    number = 1
+    while True:
+        elapsed, ops = _run(fn, number)
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed <= 0 else max(2, int(min_time / elapsed * 1.2))
+
+    best = elapsed / ops
+    for _ in range(repeat - 1):
+        elapsed, ops = _run(fn, number)
+        best = min(best, elapsed / ops)
+
+    return best, ops
+
+
+def run(pattern=None, min_time=0.1, repeat=5, out=sys.stdout):
+    """ runs the benchmarks whose names contain the pattern, returns a list of Result """
+    calibration, _ = measure(_calibration(), min_time, repeat)
+
+    results = []
+    for name, setup in benchmarks():
+        if pattern and pattern not in name:
+            continue
+
+        prepared = setup()
+        fn, cleanup = prepared if isinstance(prepared, tuple) else (prepared, None)
+        try:
+            per_op, ops = measure(fn, min_time, repeat)
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+        result = Result(name, per_op, ops, calibration)
+        results.append(result)
+        if out is not None:
+            out.write("%-45s %12.2f us %14.0f ops/s %10.3f\n" %
+                      (name, per_op * 1e6, 1.0 / per_op, result.relative))
+            out.flush()
+
+    # calibrate again, in case the machine was busy at the start
+    again, _ = measure(_calibration(), min_time, repeat)
+    if again < calibration:
+        for r in results:
+            r.relative = r.per_op / again
+
+    return results
+
+
+def load_baselines(path=BASELINES):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get("benchmarks", {})
+
+
+def save_baselines(results, path=BASELINES):
+    baselines = load_baselines(path)
+    for r in results:
+        baselines[r.name] = r.as_dict()
+
+    with open(path, "w") as f:
+        json.dump({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "obd": obd.__version__,
+            "benchmarks": baselines,
+        }, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results, baselines, tolerance=0.5):
+    """
+        returns a list of (result, baseline ratio) for the results slower
+        than their baseline by more than the given fraction
+    """
+    regressions = []
+    for r in results:
+        baseline = baselines.get(r.name)
+        if baseline is None:
+            continue
+        ratio = r.relative / baseline["relative"]
+        if ratio > 1.0 + tolerance:
+            regressions.append((r, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Benchmarks for python-OBD's query path")
+    parser.add_argument("-k", dest="pattern", default=None,
+                        help="only run the benchmarks whose names contain this string")
+    parser.add_argument("--min-time", type=float, default=0.1,
+                        help="minimum duration of each timed run, in seconds (default: 0.1)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of timed runs, the fastest is kept (default: 5)")
+    parser.add_argument("--save", action="store_true",
+                        help="store the results as the new baselines")
+    parser.add_argument("--compare", action="store_true",
+                        help="fail if a benchmark regressed against its baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed slowdown before failing --compare (default: 0.5 = 50%%)")
+    parser.add_argument("--baselines", default=BASELINES,
+                        help="path of the baselines file")
+    args = parser.parse_args(argv)
+
+    obd.logger.setLevel(obd.logging.CRITICAL)  # keep the library quiet while timing
+
+    results = run(args.pattern, args.min_time, args.repeat)
+
+    if args.save:
+        save_baselines(results, args.baselines)
+        print("saved %d baselines to %s" % (len(results), args.baselines))
+
+    if args.compare:
+        baselines = load_baselines(args.baselines)
+        regressions = compare(results, baselines, args.tolerance)
+        for r, ratio in regressions:
+            print("REGRESSION %s: %.2fx its baseline" % (r.name, ratio))
+        missing = [r.name for r in results if r.name not in baselines]
+        if missing:
+            print("no baseline for: %s" % ", ".join(missing))
+        return 1 if regressions else 0
+
+    return 0
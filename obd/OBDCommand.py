@@ -35,10 +35,40 @@ from .protocols import ECU, ECU_HEADER
 from .OBDResponse import OBDResponse
 
 import logging
+from collections import namedtuple
 
 logger = logging.getLogger(__name__)
 
 
+class CommandDescriptor(namedtuple("CommandDescriptor", ["key", "mode", "pid", "wire", "hash", "bytes"])):
+    """
+        What the queries need to know about a command, worked out once
+        (see OBDCommand.descriptor): the (header, command) key and its
+        hash, the mode and PID (None for AT commands), the bytes sent to
+        the adapter (wire[n] asks for n frames, wire[0] doesn't say), and
+        the expected number of data bytes.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def of(cls, command, header, _bytes):
+        mode = pid = None
+        if isHex(command.decode()):
+            if len(command) >= 2:
+                mode = int(command[:2], 16)
+            if len(command) > 2:
+                pid = int(command[2:], 16)
+        # the ELM takes the number of frames to wait for as a single hex digit
+        wire = (command,) + tuple([command + (b"%X" % n) for n in range(1, 0x10)])
+        key = (header, command)
+        return cls(key, mode, pid, wire, hash(key), _bytes)
+
+    def request(self, count=None):
+        """ the bytes sent to the adapter, waiting for count (1 to 15) frames if given """
+        return self.wire[count or 0]
+
+
 class OBDCommand:
     def __init__(self,
                  name,
@@ -51,12 +81,42 @@ class OBDCommand:
                  header=ECU_HEADER.ENGINE):
         self.name = name  # human readable name (also used as key in commands dict)
         self.desc = desc  # human readable description
-        self.command = command  # command string
-        self.bytes = _bytes  # number of bytes expected in return
+        self._command = command  # command string
+        self._bytes = _bytes  # number of bytes expected in return
         self.decode = decoder  # decoding function
         self.ecu = ecu  # ECU ID from which this command expects messages from
         self.fast = fast  # can an extra digit be added to the end of the command? (to make the ELM return early)
-        self.header = header  # ECU header used for the queries
+        self._header = header  # ECU header used for the queries
+        self.descriptor = CommandDescriptor.of(command, header, _bytes)
+
+    # changing the command, header or bytes rebuilds the descriptor
+
+    @property
+    def command(self):
+        return self._command
+
+    @command.setter
+    def command(self, command):
+        self._command = command
+        self.descriptor = CommandDescriptor.of(command, self._header, self._bytes)
+
+    @property
+    def header(self):
+        return self._header
+
+    @header.setter
+    def header(self, header):
+        self._header = header
+        self.descriptor = CommandDescriptor.of(self._command, header, self._bytes)
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+    @bytes.setter
+    def bytes(self, _bytes):
+        self._bytes = _bytes
+        self.descriptor = CommandDescriptor.of(self._command, self._header, _bytes)
 
     def clone(self):
         return OBDCommand(self.name,
@@ -70,26 +130,24 @@ class OBDCommand:
 
     @property
     def mode(self):
-        if len(self.command) >= 2 and isHex(self.command.decode()):
-            return int(self.command[:2], 16)
-        else:
-            return None
+        return self.descriptor.mode
 
     @property
     def pid(self):
-        if len(self.command) > 2 and isHex(self.command.decode()):
-            return int(self.command[2:], 16)
-        else:
-            return None
+        return self.descriptor.pid
 
     def __call__(self, messages):
 
         # filter for applicable messages (from the right ECU(s))
-        messages = [m for m in messages if (self.ecu & m.ecu) > 0]
+        ecu = self.ecu
+        messages = [m for m in messages if (ecu & m.ecu) > 0]
 
         # guarantee data size for the decoder
-        for m in messages:
-            self.__constrain_message_data(m)
+        expected = self.descriptor.bytes
+        if expected > 0:
+            for m in messages:
+                if len(m.data) != expected:
+                    self.__constrain_message_data(m, expected)
 
         # create the response object with the raw data received
         # and reference to original command
@@ -101,24 +159,23 @@ class OBDCommand:
 
         return r
 
-    def __constrain_message_data(self, message):
+    def __constrain_message_data(self, message, expected):
         """ pads or chops the data field to the size specified by this command """
         len_msg_data = len(message.data)
-        if self.bytes > 0:
-            if len_msg_data > self.bytes:
-                # chop off the right side
-                message.data = message.data[:self.bytes]
-                logger.debug(
-                    "Message was longer than expected (%s>%s). " +
-                    "Trimmed message: %s", len_msg_data, self.bytes,
-                    repr(message.data))
-            elif len_msg_data < self.bytes:
-                # pad the right with zeros
-                message.data += (b'\x00' * (self.bytes - len_msg_data))
-                logger.debug(
-                    "Message was shorter than expected (%s<%s). " +
-                    "Padded message: %s", len_msg_data, self.bytes,
-                    repr(message.data))
+        if len_msg_data > expected:
+            # chop off the right side
+            message.data = message.data[:expected]
+            logger.debug(
+                "Message was longer than expected (%s>%s). " +
+                "Trimmed message: %s", len_msg_data, expected,
+                repr(message.data))
+        elif len_msg_data < expected:
+            # pad the right with zeros
+            message.data += (b'\x00' * (expected - len_msg_data))
+            logger.debug(
+                "Message was shorter than expected (%s<%s). " +
+                "Padded message: %s", len_msg_data, expected,
+                repr(message.data))
 
     def __str__(self):
         if self.header != ECU_HEADER.ENGINE:
@@ -144,10 +201,10 @@ class OBDCommand:
 
     def __hash__(self):
         # needed for using commands as keys in a dict (see async.py)
-        return hash(self.header + self.command)
+        return self.descriptor.hash
 
     def __eq__(self, other):
         if isinstance(other, OBDCommand):
-            return self.command == other.command and self.header == other.header
+            return self.descriptor.key == other.descriptor.key
         else:
             return False
@@ -52,7 +52,15 @@ class OBDResponse:
         self.command = command
         self.messages = messages if messages else []
         self.value = None
-        self.time = time.time()
+        self.time = time.time()  # replaced by received_time, when it's known
+
+        # when the request finished being sent, and when the adapter's
+        # prompt was received: as given by time.monotonic() (for intervals,
+        # immune to clock changes), and by time.time()
+        self.sent_monotonic = None
+        self.sent_time = None
+        self.received_monotonic = None
+        self.received_time = None
 
     @property
     def unit(self):
@@ -65,6 +73,13 @@ class OBDResponse:
         else:
             return str(type(self.value))
 
+    @property
+    def latency(self):
+        """ seconds between the end of the request and the end of the response, or None """
+        if (self.sent_monotonic is None) or (self.received_monotonic is None):
+            return None
+        return self.received_monotonic - self.sent_monotonic
+
     def is_null(self):
         return (not self.messages) or (self.value == None)
 
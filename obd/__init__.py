@@ -40,14 +40,28 @@
 from .__version__ import __version__
 from .obd import OBD
 from .asynchronous import Async
+from .fleet import FleetPoller  # noqa: F401
 from .commands import commands
+from .interfaces import register_interface
 from .OBDCommand import OBDCommand
 from .OBDResponse import OBDResponse
 from .protocols import ECU
+from .socketcan import SocketCAN
+from .doip import DoIP
+from .supervisor import Supervisor  # noqa: F401
 from .utils import scan_serial, OBDStatus
 from .UnitsAndScaling import Unit
 
 import logging
+import serial
+
+# makes the record:// and replay:// URLs available to pyserial
+if "obd.urlhandler" not in serial.protocol_handler_packages:
+    serial.protocol_handler_packages.append("obd.urlhandler")
+
+# native transports, chosen by the scheme of the port string
+register_interface("socketcan", SocketCAN)
+register_interface("doip", DoIP)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.WARNING)
@@ -47,10 +47,15 @@ class Async(OBD):
 
     def __init__(self, portstr=None, baudrate=None, protocol=None, fast=True,
                  timeout=0.1, check_voltage=True, start_low_power=False,
-                 delay_cmds=0.25):
+                 delay_cmds=0.25, reconnect=False, physical_addressing=False,
+                 cache=False, trace=False):
         self.__thread = None
         super(Async, self).__init__(portstr, baudrate, protocol, fast,
-                                    timeout, check_voltage, start_low_power)
+                                    timeout, check_voltage, start_low_power,
+                                    reconnect=reconnect,
+                                    physical_addressing=physical_addressing,
+                                    cache=cache,
+                                    trace=trace)
         self.__commands = {}   # key = OBDCommand, value = Response
         self.__callbacks = {}  # key = OBDCommand, value = list of Functions
         self.__running = False
@@ -196,6 +201,18 @@ class Async(OBD):
         else:
             return OBDResponse()
 
+    def __recover(self):
+        """
+            Waits for the supervisor (if any) to restore the connection,
+            for up to its max_attempts (None = until stop() is called).
+            The watched commands and callbacks are kept as they are, so the
+            loop picks up where it left off.
+        """
+        if self.supervisor is None:
+            return False
+
+        return self.supervisor.recover(keep_going=lambda: self.__running)
+
     def run(self):
         """ Daemon thread """
 
@@ -204,11 +221,13 @@ class Async(OBD):
 
             if len(self.__commands) > 0:
                 # loop over the requested commands, send, and collect the response
-                for c in self.__commands:
-                    if not self.is_connected():
-                        logger.info("Async thread terminated because device disconnected")
-                        self.__running = False
-                        self.__thread = None
+                # commands are grouped by header, to avoid needless 'AT SH' switches
+                for c in self.schedule(self.__commands):
+                    if not self.is_connected() and not self.__recover():
+                        if self.__running:  # otherwise, stop() was called during the recovery
+                            logger.info("Async thread terminated because device disconnected")
+                            self.__running = False
+                            self.__thread = None
                         return
 
                     # force, since commands are checked for support in watch()
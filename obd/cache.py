@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# cache.py                                                             #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+
+import logging
+import time
+
+from .commands import commands
+
+logger = logging.getLogger(__name__)
+
+FOREVER = float("inf")  # cached until explicitly invalidated (reconnect, CLEAR_DTC)
+
+
+def default_policies():
+    """
+        returns the default time-to-live (in seconds) for the
+        builtin commands, keyed by command
+    """
+    policies = {}
+
+    # constant for as long as we stay connected to the car
+    for name in ["VIN_MESSAGE_COUNT", "VIN",
+                 "CALIBRATION_ID_MESSAGE_COUNT", "CALIBRATION_ID",
+                 "CVN_MESSAGE_COUNT", "CVN",
+                 "FUEL_TYPE", "OBD_COMPLIANCE",
+                 "ELM_VERSION"]:
+        policies[commands[name]] = FOREVER
+
+    for c in commands.pid_getters():
+        policies[c] = FOREVER
+
+    # slow changing
+    for name in ["STATUS", "STATUS_DRIVE_CYCLE", "FREEZE_DTC",
+                 "GET_DTC", "GET_CURRENT_DTC"]:
+        policies[commands[name]] = 5.0
+
+    return policies
+
+
+class ResponseCache(object):
+    """
+        Time-to-live cache of OBDResponses, with a policy per command.
+        Commands without a policy are never cached.
+    """
+
+    def __init__(self, policies=None):
+        self.__policies = default_policies() if policies is None else dict(policies)
+        self.__entries = {}  # key = OBDCommand, value = (monotonic timestamp, OBDResponse)
+        self.hits = 0
+        self.misses = 0
+
+    def set_policy(self, cmd, ttl):
+        """ sets the time-to-live for a command, in seconds. A ttl of None stops caching it """
+        if ttl is None:
+            self.__policies.pop(cmd, None)
+            self.__entries.pop(cmd, None)
+        else:
+            self.__policies[cmd] = ttl
+
+    def policy(self, cmd):
+        """ returns the time-to-live for a command, or None if it isn't cached """
+        return self.__policies.get(cmd)
+
+    def get(self, cmd):
+        """ returns the cached response for the command, or None if there's no fresh one """
+        ttl = self.__policies.get(cmd)
+        if ttl is None:
+            return None
+
+        entry = self.__entries.get(cmd)
+        if (entry is not None) and (time.monotonic() - entry[0] < ttl):
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        return None
+
+    def put(self, cmd, response):
+        """ stores a response, if the command has a policy and the response holds a value """
+        if (cmd in self.__policies) and not response.is_null():
+            self.__entries[cmd] = (time.monotonic(), response)
+
+    def invalidate(self, cmd=None):
+        """ drops the cached response for the given command, or every response when None """
+        if cmd is None:
+            logger.debug("Invalidating all cached responses")
+            self.__entries = {}
+        else:
+            self.__entries.pop(cmd, None)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, cmd):
+        return cmd in self.__entries
+
+    def stats(self):
+        """ returns a dict of the hit and miss counters """
+        return {
+            "entries": len(self.__entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -31,10 +31,12 @@
 ########################################################################
 
 import logging
+from binascii import unhexlify
 
 from .OBDCommand import OBDCommand
 from .decoders import *
-from .protocols import ECU
+from .protocols import ECU, ECU_HEADER
+from .uds import read_did
 
 logger = logging.getLogger(__name__)
 
@@ -327,14 +329,46 @@ class Commands():
             __mode9__,
         ]
 
+        # Mode 22 (UDS ReadDataByIdentifier) commands, by DID (see add_dids())
+        self.dids = {}
+
+        # commands of the modes without a table, by mode and PID (see add_commands())
+        self.pids = {0x22: self.dids}
+
+        # indexes, kept up to date by __index()
+        self.__by_request = {}  # key = header + request, value = command
+        self.__by_response = {}  # key = header, value = {response SID + PID bytes: command}
+        self.__key_lengths = {}  # key = response SID, value = lengths of its response keys, longest first
+        self.__pid_getters = []
+
         # allow commands to be accessed by name
         for m in self.modes:
             for c in m:
                 if c is not None:
                     self.__dict__[c.name] = c
+                    self.__index(c)
 
         for c in __misc__:
             self.__dict__[c.name] = c
+            self.__index(c)
+
+    def __index(self, c):
+        """ adds a command to the indexes """
+        self.__by_request[c.header + c.command.upper()] = c
+
+        if (c.decode == pid) and (c not in self.__pid_getters):
+            self.__pid_getters.append(c)
+
+        # the response echoes the request, with 0x40 added to the SID
+        mode = c.mode
+        if (mode is None) or (mode >= 0xC0):
+            return  # AT commands, or no response SID
+        key = bytes(bytearray([mode + 0x40]) + unhexlify(c.command[2:]))
+        self.__by_response.setdefault(c.header, {})[key] = c
+        lengths = self.__key_lengths.setdefault(key[0], [])
+        if len(key) not in lengths:
+            lengths.append(len(key))
+            lengths.sort(reverse=True)
 
     def __getitem__(self, key):
         """
@@ -343,6 +377,8 @@ class Commands():
             obd.commands.RPM
             obd.commands["RPM"]
             obd.commands[1][12] # mode 1, PID 12 (RPM)
+            obd.commands[0x22][0x028C] # a DID added with add_dids()
+            obd.commands[0x21][0x05] # a command added with add_commands()
         """
 
         try:
@@ -351,6 +387,8 @@ class Commands():
             basestring = str
 
         if isinstance(key, int):
+            if key in self.pids:
+                return self.pids[key]
             return self.modes[key]
         elif isinstance(key, basestring):
             return self.__dict__[key]
@@ -359,12 +397,39 @@ class Commands():
 
     def __len__(self):
         """ returns the number of commands supported by python-OBD """
-        return sum([len(mode) for mode in self.modes])
+        return sum([len(mode) for mode in self.modes]) + \
+            sum([len(pids) for pids in self.pids.values()])
 
     def __contains__(self, name):
         """ calls has_name(s) """
         return self.has_name(name)
 
+    def add_dids(self, dids, header=ECU_HEADER.ENGINE, ecu=ECU.ALL):
+        """
+            registers a Mode 22 command for each of the given DIDs (see
+            uds.py), by name and by DID. Returns the list of commands.
+        """
+        return self.add_commands([read_did(d, header, ecu) for d in dids])
+
+    def add_commands(self, cmds):
+        """
+            registers the given commands (ie: compiled by formulas.py) by
+            name, and by mode and PID for the modes without a table (such
+            as Mode 22, by DID). Returns the list of commands.
+        """
+        added = []
+        for c in cmds:
+            if self.has_name(c.name) and (self.__dict__[c.name] != c):
+                logger.warning("Replacing the command %s" % c.name)
+            self.__dict__[c.name] = c
+            mode = c.mode
+            if (mode is not None) and (c.pid is not None) and \
+                    ((mode >= len(self.modes)) or not self.modes[mode]):
+                self.pids.setdefault(mode, {})[c.pid] = c
+            self.__index(c)
+            added.append(c)
+        return added
+
     def base_commands(self):
         """
             returns the list of commands that should always be
@@ -383,14 +448,41 @@ class Commands():
 
     def pid_getters(self):
         """ returns a list of PID GET commands """
-        getters = []
-        for mode in self.modes:
-            getters += [cmd for cmd in mode if (cmd and cmd.decode == pid)]
-        return getters
+        return list(self.__pid_getters)
 
     def has_command(self, c):
         """ checks for existance of a command by OBDCommand object """
-        return c in self.__dict__.values()
+        return self.__by_request.get(c.header + c.command.upper()) == c
+
+    def for_request(self, request, header=ECU_HEADER.ENGINE):
+        """ returns the command sending the given request (bytes, ie: b"010C") with the given header, or None """
+        return self.__by_request.get(header + request.upper())
+
+    def for_response(self, data, header=ECU_HEADER.ENGINE):
+        """
+            returns the command answered by the given response data (starting
+            with the response SID, ie: 41 0C ...) among the commands sent with
+            the given header, or None
+        """
+        index = self.__by_response.get(header)
+        if (index is None) or not data:
+            return None
+        for n in self.__key_lengths.get(data[0], ()):
+            c = index.get(bytes(data[:n]))
+            if c is not None:
+                return c
+        return None
+
+    def dispatch(self, message, header=ECU_HEADER.ENGINE):
+        """
+            decodes a Message (ie: received in monitor mode, or read from a
+            log) with the command it answers. Returns the OBDResponse, or
+            None for messages that no command answers.
+        """
+        c = self.for_response(message.data, header)
+        if c is None:
+            return None
+        return c([message])
 
     def has_name(self, name):
         """ checks for existance of a command by name """
@@ -401,6 +493,8 @@ class Commands():
         """ checks for existance of a command by int mode and int pid """
         if (mode < 0) or (pid < 0):
             return False
+        if mode in self.pids:
+            return pid in self.pids[mode]
         if mode >= len(self.modes):
             return False
         if pid >= len(self.modes[mode]):
@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# doip.py                                                              #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+"""
+    Diagnostics over IP (ISO 13400-2) transport, in place of an ELM327:
+    a TCP connection to a DoIP entity (a gateway, or an ECU), routing
+    activation, then OBD and UDS requests carried in diagnostic messages.
+
+        connection = obd.OBD("doip://192.168.0.10")
+        connection = obd.OBD("doip://192.168.0.10:13400?source=0E80&functional=E400")
+        connection = obd.OBD("doip://emulator")  # a DoIPServer on localhost
+
+    URL parameters (addresses in hex):
+
+        source      the tester's logical address (default: 0E00)
+        functional  the functional group address for OBD requests (default: E400)
+        activation  the routing activation type (default: 00)
+        connect_timeout  seconds (default: 2)
+
+    Answers are handed to the 29-bit CAN parser, as if each ECU's logical
+    address ended in its CAN ID: the ECU at address 1010 answers like
+    18DAF110. The stand-in DoIPServer puts the emulator's ECUs (see
+    obd/emulator.py) behind a DoIP entity, for tests and benches.
+    Vehicle discovery (UDP) isn't implemented: the entity's address is
+    given.
+"""
+
+import logging
+import select
+import socket
+import struct
+import threading
+import time
+from binascii import hexlify
+
+try:
+    from urllib.parse import urlparse, parse_qs
+    import socketserver
+except ImportError:
+    from urlparse import urlparse, parse_qs
+    import SocketServer as socketserver
+
+from .interfaces import NativeInterface
+from .protocols import ISO_15765_4_29bit_500k
+from .protocols.protocol_can import isotp_segment
+from .utils import OBDStatus, isHex
+
+logger = logging.getLogger(__name__)
+
+PORT = 13400
+VERSION = 0x02
+
+# payload types
+GENERIC_NACK = 0x0000
+ROUTING_ACTIVATION_REQUEST = 0x0005
+ROUTING_ACTIVATION_RESPONSE = 0x0006
+ALIVE_CHECK_REQUEST = 0x0007
+ALIVE_CHECK_RESPONSE = 0x0008
+DIAGNOSTIC_MESSAGE = 0x8001
+DIAGNOSTIC_ACK = 0x8002
+DIAGNOSTIC_NACK = 0x8003
+
+ROUTING_SUCCESS = 0x10
+NACK_UNKNOWN_SOURCE = 0x02
+NACK_UNKNOWN_TARGET = 0x03
+
+TESTER_ADDRESS = 0x0E00
+FUNCTIONAL_ADDRESS = 0xE400
+RESPONSE_PENDING_TIME = 5.0  # P2* of ISO 14229-2, after a "response pending" negative response
+
+_HEADER = struct.Struct("!BBHI")
+_ADDRESSES = struct.Struct("!HH")
+
+
+def pack(payload_type, payload=b""):
+    """ a DoIP message: the generic header, then the payload """
+    return _HEADER.pack(VERSION, VERSION ^ 0xFF, payload_type, len(payload)) + bytes(payload)
+
+
+class Stream(object):
+    """ reads DoIP messages from a socket """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+
+    def read(self, timeout):
+        """ returns the next (payload type, payload), or None after the timeout. Raises EOFError when closed """
+        deadline = time.monotonic() + timeout
+        while True:
+            if len(self.buffer) >= _HEADER.size:
+                version, inverse, payload_type, length = _HEADER.unpack_from(self.buffer)
+                if inverse != version ^ 0xFF:
+                    raise ValueError("bad DoIP header %r" % bytes(self.buffer[:_HEADER.size]))
+                if len(self.buffer) >= _HEADER.size + length:
+                    payload = bytes(self.buffer[_HEADER.size:_HEADER.size + length])
+                    del self.buffer[:_HEADER.size + length]
+                    return payload_type, payload
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            r, _, _ = select.select([self.sock], [], [], remaining)
+            if not r:
+                return None
+            data = self.sock.recv(65536)
+            if not data:
+                raise EOFError("connection closed")
+            self.buffer += data
+
+
+class DoIPProtocol(ISO_15765_4_29bit_500k):
+    """ answers over DoIP, parsed as 29-bit CAN (and decoded like it, mode 06 included) """
+    ELM_NAME = "ISO 13400 (DoIP)"
+
+
+class DoIP(NativeInterface):
+    """
+        Handles communication with the car through a DoIP entity, with
+        the same methods as ELM327 (see obd/interfaces.py)
+    """
+
+    def __init__(self, portname, baudrate, protocol, timeout,
+                 check_voltage=True, start_low_power=False):
+        """
+            Connects, and activates routing. The timeout is the time to
+            wait for an answer after the acknowledgement, and for more
+            answers to functional requests after the last one. baudrate,
+            protocol, check_voltage and start_low_power don't apply to DoIP.
+        """
+
+        NativeInterface.__init__(self, portname, timeout)
+        self.__sock = None
+        self.__stream = None
+        self.__server = None
+        self.__addresses = {}  # key = low byte of an ECU's address, value = its logical address
+        self.entity_address = None  # logical address of the DoIP entity, given by the routing activation
+
+        url = urlparse(portname)
+        options = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        self.source = int(options.get("source", "%04X" % TESTER_ADDRESS), 16)
+        self.functional = int(options.get("functional", "%04X" % FUNCTIONAL_ADDRESS), 16)
+        activation = int(options.get("activation", "00"), 16)
+        connect_timeout = float(options.get("connect_timeout", 2.0))
+
+        host, port = url.hostname, url.port or PORT
+        if host == "emulator":
+            self.__server = DoIPServer()
+            host, port = self.__server.address
+
+        logger.info("Initializing DoIP: HOST=%s PORT=%d SOURCE=%04X" % (host, port, self.source))
+
+        try:
+            self.__sock = socket.create_connection((host, port), timeout=connect_timeout)
+            self.__sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.__sock.settimeout(None)
+            self.__stream = Stream(self.__sock)
+        except (OSError, socket.error) as e:
+            logger.error("Failed to connect to %s:%d: %s" % (host, port, e))
+            self._close()
+            return
+
+        # ------------------------- routing activation -------------------------
+        try:
+            self.__sock.sendall(pack(ROUTING_ACTIVATION_REQUEST,
+                                     struct.pack("!HB4x", self.source, activation)))
+            r = self.__read(connect_timeout, [ROUTING_ACTIVATION_RESPONSE])
+        except (OSError, EOFError, ValueError) as e:
+            logger.error("Routing activation failed: %s" % e)
+            self._close()
+            return
+
+        if r is None or len(r[1]) < 5 or r[1][4] != ROUTING_SUCCESS:
+            logger.error("Routing activation was refused (%s)" % (r and hexlify(r[1])))
+            self._close()
+            return
+
+        self.entity_address = struct.unpack_from("!H", r[1], 2)[0]
+        self._status = OBDStatus.OBD_CONNECTED
+
+        # ---------------------------- 0100 (ECUs) -----------------------------
+        self._protocol = DoIPProtocol([])
+        r0100 = self._request(bytearray(b"\x01\x00"))
+        if any([isHex(line) for line in r0100]):
+            self._protocol = DoIPProtocol(r0100)
+            self._status = OBDStatus.CAR_CONNECTED
+            logger.info("Connected Successfully: HOST=%s ENTITY=%04X" % (host, self.entity_address))
+        else:
+            self._protocol = None
+            logger.error("Routing activated, but no ECU answered")
+
+    def __read(self, timeout, types):
+        """ returns the next message of one of the given types, answering alive checks on the way """
+        deadline = time.monotonic() + timeout
+        while True:
+            r = self.__stream.read(max(deadline - time.monotonic(), 0))
+            if r is None:
+                return None
+            payload_type, payload = r
+            if payload_type == ALIVE_CHECK_REQUEST:
+                self.__sock.sendall(pack(ALIVE_CHECK_RESPONSE, struct.pack("!H", self.source)))
+            elif payload_type == GENERIC_NACK:
+                logger.warning("DoIP entity sent a generic NACK: %s" % hexlify(payload))
+            elif payload_type in types:
+                return r
+
+    def _target(self, header):
+        """
+            turns an 'AT SH' header into a logical address: 4 digits are
+            an address, 6 digits are 29-bit CAN headers (DAxxF1 physical,
+            DB33F1 functional), 3 digits (11-bit headers) are functional
+        """
+        if not header or not isHex(header):
+            raise ValueError(header)
+        header = header.upper()
+        if len(header) == 4:
+            address = int(header, 16)
+            return None if address == self.functional else address
+        elif len(header) == 6 and header.startswith("DA"):
+            low = int(header[2:4], 16)
+            return self.__addresses.get(low, 0x1000 | low)
+        elif len(header) in (3, 6):
+            return None
+        raise ValueError(header)
+
+    def _version(self):
+        return "DoIP %04X" % (self.entity_address or 0)
+
+    def _request(self, payload, count=None, trace=None):
+        """ sends a diagnostic message, returns the answers as the ELM's 29-bit CAN lines """
+        physical = self._target_address is not None
+        target = self._target_address if physical else self.functional
+
+        if trace is not None:
+            trace.mark("write_start")
+        try:
+            self.__sock.sendall(pack(DIAGNOSTIC_MESSAGE, _ADDRESSES.pack(self.source, target) + bytes(payload)))
+            now = time.monotonic()
+            self._sent = (now, time.time())
+            self._received = (None, None)
+            if trace is not None:
+                trace.mark("write_flushed", now)
+
+            ack = self.__read(max(self.timeout, 1.0), [DIAGNOSTIC_ACK, DIAGNOSTIC_NACK])
+            if ack is None or ack[0] == DIAGNOSTIC_NACK:
+                logger.info("Diagnostic message to %04X was not acknowledged" % target)
+                return ["NO DATA"]
+
+            lines = []
+            deadline = time.monotonic() + self.timeout
+            while True:
+                r = self.__read(max(deadline - time.monotonic(), 0), [DIAGNOSTIC_MESSAGE])
+                if r is None:
+                    break
+                source, _ = _ADDRESSES.unpack_from(r[1])
+                data = bytearray(r[1][_ADDRESSES.size:])
+                header = "18DAF1%02X" % (source & 0xFF)
+                if not data or not self._accepts(header):
+                    continue
+                now = time.monotonic()
+                if len(data) >= 3 and data[0] == 0x7F and data[2] == 0x78:
+                    deadline = now + RESPONSE_PENDING_TIME  # response pending
+                    continue
+
+                if not lines and trace is not None:
+                    trace.mark("first_byte", now)
+                self.__addresses[source & 0xFF] = source
+                lines.extend([header + hexlify(bytes(f)).decode().upper() for f in isotp_segment(data)])
+                self._received = (now, time.time())
+                deadline = now + self.timeout
+
+                if physical or (count is not None and len(lines) >= count):
+                    break
+        except (OSError, EOFError, ValueError) as e:
+            logger.critical("DoIP connection lost: %s" % e)
+            self._status = OBDStatus.NOT_CONNECTED
+            self._close()
+            return []
+
+        if trace is not None:
+            trace.mark("prompt", self._received[0])
+        return lines or ["NO DATA"]
+
+    def _close(self):
+        if self.__sock is not None:
+            self.__sock.close()
+            self.__sock = None
+        if self.__server is not None:
+            self.__server.close()
+            self.__server = None
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """ one tester connection to the DoIPServer """
+
+    def handle(self):
+        server = self.server.doip
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        stream = Stream(sock)
+        tester = None  # source address, once routing is activated
+
+        while not server.closed:
+            try:
+                r = stream.read(0.2)
+            except (OSError, EOFError, ValueError):
+                return
+            if r is None:
+                continue
+            payload_type, payload = r
+
+            if payload_type == ROUTING_ACTIVATION_REQUEST:
+                source = struct.unpack_from("!H", payload)[0]
+                tester = source
+                sock.sendall(pack(ROUTING_ACTIVATION_RESPONSE,
+                                  struct.pack("!HHB4x", source, server.logical_address, ROUTING_SUCCESS)))
+            elif payload_type == ALIVE_CHECK_REQUEST:
+                sock.sendall(pack(ALIVE_CHECK_RESPONSE, struct.pack("!H", server.logical_address)))
+            elif payload_type == DIAGNOSTIC_MESSAGE:
+                source, target = _ADDRESSES.unpack_from(payload)
+                reply = _ADDRESSES.pack(target, source)
+                if source != tester:
+                    sock.sendall(pack(DIAGNOSTIC_NACK, reply + bytearray([NACK_UNKNOWN_SOURCE])))
+                    continue
+                ecus = server.targets(target)
+                if not ecus:
+                    sock.sendall(pack(DIAGNOSTIC_NACK, reply + bytearray([NACK_UNKNOWN_TARGET])))
+                    continue
+                sock.sendall(pack(DIAGNOSTIC_ACK, reply + b"\x00"))
+
+                request = hexlify(payload[_ADDRESSES.size:]).decode().upper()
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                for address, ecu in ecus:
+                    response = ecu.respond(request)
+                    while response:
+                        sock.sendall(pack(DIAGNOSTIC_MESSAGE, _ADDRESSES.pack(address, source) + bytes(response)))
+                        # an ECU answering "response pending" is asked again for the final answer
+                        pending = len(response) >= 3 and response[0] == 0x7F and response[2] == 0x78
+                        response = ecu.respond(request) if pending else None
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class DoIPServer(object):
+    """
+        A stand-in DoIP entity on a local TCP port, with the emulator's
+        ECUs behind it (see obd/emulator.py). Each ECU's logical address
+        is 0x1000 | its tx_id (1010 for the default engine), and the
+        functional address reaches all of them.
+
+            server = DoIPServer()
+            connection = obd.OBD("doip://%s:%d" % server.address)
+    """
+
+    def __init__(self, ecus=None, host="127.0.0.1", port=0, logical_address=0x1FFF,
+                 functional=FUNCTIONAL_ADDRESS, latency=0.0):
+        from .emulator import default_ecus
+        self.ecus = ecus if ecus is not None else default_ecus("7")
+        self.logical_address = logical_address
+        self.functional = functional
+        self.latency = latency
+        self.requests = 0
+        self.closed = False
+        self.__server = _TCPServer((host, port), _Handler)
+        self.__server.doip = self
+        self.address = self.__server.server_address[:2]
+        self.__thread = threading.Thread(target=self.__server.serve_forever, kwargs={"poll_interval": 0.05})
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def targets(self, address):
+        """ returns the (logical address, ECU) pairs reached by a target address """
+        ecus = [(0x1000 | e.tx_id, e) for e in self.ecus]
+        if address == self.functional:
+            return ecus
+        return [(a, e) for a, e in ecus if a == address]
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# dynamic.py                                                           #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+"""
+    UDS DynamicallyDefineDataIdentifier (service 0x2C)
+
+    Polling many DIDs costs a round trip per request, even when batched
+    (an ELM327 fits 3 DIDs in a request). Instead, the ECU can be asked
+    to define new DIDs (F300 to F3FF), each packing the data of several
+    source DIDs:
+
+        -> 2C 01 F3 00 02 8C 01 01 04 4A 01 02   (F300 = 028C, then 044A)
+        <- 6C 01 F3 00
+        -> 22 F3 00
+        <- 62 F3 00 C8 01 F4
+
+    DynamicDIDs composes the DIDs watched into as few dynamic DIDs as
+    possible, and reads them all, with a single request per cycle for up
+    to 3 dynamic DIDs:
+
+        signals = DynamicDIDs(DIDS)
+        signals.define(connection)      # False if the ECU refused them
+        responses = signals.query(connection)
+        responses[read_did(BATTERY_SOC)].value  # 100.0 percent
+
+    The definitions are longer than a single CAN frame, which a plain
+    ELM327 can't send: the DIDs are then read with batched requests
+    instead (see uds.batch()).
+"""
+
+import logging
+
+from .OBDCommand import OBDCommand
+from .protocols import ECU, ECU_HEADER
+from .uds import DID, MAX_DIDS, NRC, ReadDataByIdentifier, derived_response, \
+    negative_response, read_did
+
+logger = logging.getLogger(__name__)
+
+
+DYNAMICALLY_DEFINE_DATA_IDENTIFIER = 0x2C
+
+# sub-functions
+DEFINE_BY_IDENTIFIER = 0x01
+CLEAR = 0x03
+
+# F300 to F3FF are the dynamically defined DIDs
+FIRST_DYNAMIC_DID = 0xF300
+LAST_DYNAMIC_DID = 0xF3FF
+
+# data bytes per dynamic DID (ECUs have their own limits)
+MAX_LENGTH = 32
+
+
+def _positive(messages):
+    """ True for a positive response to a 2C request, else the negative response code, or None """
+    for m in messages:
+        if m.data and m.data[0] == DYNAMICALLY_DEFINE_DATA_IDENTIFIER + 0x40:
+            return True
+    return negative_response(messages, DYNAMICALLY_DEFINE_DATA_IDENTIFIER)
+
+
+class DynamicDID(DID):
+    """
+        A dynamically defined DID, packing the data of its source DIDs one
+        after the other. Its value is a dict of the sources' values, keyed
+        by name.
+    """
+
+    def __init__(self, did, sources, name=None):
+        self.sources = tuple(sources)
+        super(DynamicDID, self).__init__(name or "DYNAMIC_%04X" % did,
+                                         "Dynamically defined from " +
+                                         ", ".join([s.name for s in self.sources]),
+                                         did,
+                                         sum([s.length for s in self.sources]),
+                                         self.__decode)
+
+    def __decode(self, data):
+        values = {}
+        i = 0
+        for s in self.sources:
+            values[s.name] = s.decode(data[i:i + s.length])
+            i += s.length
+        return values
+
+
+def define_command(dynamic, header=ECU_HEADER.ENGINE):
+    """ returns the command defining a dynamic DID from whole source DIDs """
+    command = b"2C%02X%04X" % (DEFINE_BY_IDENTIFIER, dynamic.did)
+    for s in dynamic.sources:
+        command += b"%04X01%02X" % (s.did, s.length)  # source, position (from 1), size
+    return OBDCommand("DEFINE_%04X" % dynamic.did, "Dynamically define data identifier",
+                      command, 0, _positive, ECU.ALL, False, header)
+
+
+def clear_command(dynamic=None, header=ECU_HEADER.ENGINE):
+    """ returns the command clearing a dynamic DID, or all of them """
+    command = b"2C%02X" % CLEAR
+    if dynamic is not None:
+        command += b"%04X" % dynamic.did
+    return OBDCommand("CLEAR_DYNAMIC", "Clear dynamically defined data identifier",
+                      command, 0, _positive, ECU.ALL, False, header)
+
+
+def compose(dids, first=FIRST_DYNAMIC_DID, max_length=MAX_LENGTH):
+    """
+        Packs the given DIDs, in order, into as few dynamic DIDs of at most
+        max_length data bytes as possible, numbered from first. A DID
+        longer than max_length gets a dynamic DID of its own.
+    """
+    groups = []
+    length = 0
+    for d in dids:
+        if not groups or (length + d.length > max_length):
+            groups.append([])
+            length = 0
+        groups[-1].append(d)
+        length += d.length
+
+    if first + len(groups) - 1 > LAST_DYNAMIC_DID:
+        raise ValueError("Too many DIDs for the dynamic DIDs from %04X" % first)
+    return [DynamicDID(first + i, g) for i, g in enumerate(groups)]
+
+
+class DynamicDIDs(object):
+    """
+        A set of DIDs read through dynamic DIDs, defined on a single ECU.
+        Until they're defined (or if the ECU refuses them), the DIDs are
+        read with batched ReadDataByIdentifier requests.
+    """
+
+    def __init__(self, dids, header=ECU_HEADER.ENGINE, ecu=ECU.ALL,
+                 first=FIRST_DYNAMIC_DID, max_length=MAX_LENGTH, max_dids=MAX_DIDS):
+        self.dids = tuple(dids)
+        self.header = header
+        self.ecu = ecu
+        self.max_dids = max_dids
+        self.dynamic = compose(self.dids, first, max_length)
+        self.defined = False
+
+    @property
+    def commands(self):
+        """ the ReadDataByIdentifier commands reading all of the DIDs once """
+        dids = self.dynamic if self.defined else self.dids
+        return [ReadDataByIdentifier(dids[i:i + self.max_dids], header=self.header, ecu=self.ecu)
+                for i in range(0, len(dids), self.max_dids)]
+
+    def define(self, connection):
+        """ defines the dynamic DIDs on the ECU, returns whether they all were """
+        with connection.exclusive():
+            # the definitions span several frames, and can't be broadcast: while the
+            # adapter is on its default header, have 'AT SH' address the ECU for real
+            # (29 bit buses need the ECU's own header, ie: b"DA10F1")
+            if (self.header != connection.header) or (self.header != ECU_HEADER.ENGINE) or \
+                    (connection.protocol_id() not in ["6", "8"]):
+                return self.__define(connection)
+
+            connection.forget_adapter_state()
+            try:
+                return self.__define(connection)
+            finally:
+                # back to broadcasting, or the other ECUs would stop answering
+                if connection.interface is not None:
+                    connection.interface.send_and_parse(b"AT SH 7DF")
+                connection.forget_adapter_state(ECU_HEADER.ENGINE)
+
+    def __define(self, connection):
+        self.clear(connection)
+
+        for dynamic in self.dynamic:
+            r = connection.query(define_command(dynamic, self.header), force=True)
+            if r.value is not True:
+                logger.warning("The ECU refused the dynamic DID %04X (%s), reading the DIDs one by one" %
+                               (dynamic.did, "no answer" if r.value is None else
+                                NRC.get(r.value, "%02X" % r.value)))
+                self.clear(connection)
+                return False
+
+        logger.info("Defined %d dynamic DIDs for %d DIDs" % (len(self.dynamic), len(self.dids)))
+        self.defined = True
+        return True
+
+    def clear(self, connection):
+        """ clears the dynamic DIDs on the ECU """
+        for dynamic in self.dynamic:
+            connection.query(clear_command(dynamic, self.header), force=True)
+        self.defined = False
+
+    def query(self, connection):
+        """
+            Reads all of the DIDs once. Returns a dict of OBDResponses, keyed
+            by the single DID commands (see uds.read_did()). Dynamic DIDs
+            that the ECU forgot (request out of range, after a reset or a
+            session change) are defined again.
+        """
+        responses = {}
+        for c in self.commands:
+            r = connection.query(c, force=True)
+            if self.defined and (negative_response(r.messages) == 0x31):
+                logger.info("The ECU forgot the dynamic DIDs, defining them again")
+                if self.define(connection):
+                    r = connection.query(c, force=True)
+                else:
+                    return self.query(connection)
+            responses.update(self.split(r))
+        return responses
+
+    def split(self, response):
+        """
+            Splits a response to one of the commands into one OBDResponse
+            per DID, keyed by the single DID commands (see uds.read_did())
+        """
+        responses = {}
+        for c, r in response.command.split(response).items():
+            dynamic = c.dids[0]
+            if not isinstance(dynamic, DynamicDID):
+                responses[c] = r
+                continue
+            for s in dynamic.sources:
+                value = r.value.get(s.name) if r.value is not None else None
+                sr = derived_response(read_did(s, self.header, self.ecu), r, value)
+                responses[sr.command] = sr
+        return responses
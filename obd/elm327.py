@@ -30,7 +30,9 @@
 #                                                                      #
 ########################################################################
 
+import io
 import re
+import select
 import serial
 import time
 import logging
@@ -53,6 +55,22 @@ class ELM327:
             port_name()
             protocol_name()
             ecus()
+            baudrate()
+            timestamps()
+
+        and, for driving several adapters from one thread (see fleet.py):
+
+            fileno()
+            write_nowait()
+            read_nowait()
+            parse()
+
+        and, for receiving the frames that the car sends on its own (see
+        periodic.py):
+
+            monitor_start()
+            monitor_read()
+            monitor_stop()
     """
 
     # chevron (ELM prompt character)
@@ -120,6 +138,9 @@ class ELM327:
         self.__port = None
         self.__protocol = UnknownProtocol([])
         self.__low_power = False
+        self.__sent = (None, None)  # (time.monotonic(), time.time()) at which the last command was flushed
+        self.__received = (None, None)  # (time.monotonic(), time.time()) at which its prompt was seen
+        self.__monitor = bytearray()  # partial line received in monitor mode
         self.timeout = timeout
 
         # ------------- open port -------------
@@ -361,6 +382,12 @@ class ELM327:
         else:
             return ""
 
+    def baudrate(self):
+        if self.__port is not None:
+            return self.__port.baudrate
+        else:
+            return None
+
     def status(self):
         return self.__status
 
@@ -373,6 +400,15 @@ class ELM327:
     def protocol_id(self):
         return self.__protocol.ELM_ID
 
+    def timestamps(self):
+        """
+            Returns (sent monotonic, sent wall-clock, received monotonic,
+            received wall-clock) for the last command: when it finished
+            being written, and when the adapter's prompt was received.
+            Unknown times are None.
+        """
+        return self.__sent + self.__received
+
     def low_power(self):
         """
             Enter Low Power mode
@@ -444,7 +480,7 @@ class ELM327:
             self.__port.close()
             self.__port = None
 
-    def send_and_parse(self, cmd):
+    def send_and_parse(self, cmd, trace=None):
         """
             send() function used to service all OBDCommands
 
@@ -453,6 +489,9 @@ class ELM327:
 
             An empty command string will re-trigger the previous command
 
+            The stages of the transaction are marked on the given
+            QueryTrace, if any (see obd/tracing.py)
+
             Returns a list of Message objects
         """
 
@@ -464,11 +503,117 @@ class ELM327:
         if self.__low_power == True:
             self.normal_power()
 
-        lines = self.__send(cmd)
+        lines = self.__send(cmd, trace=trace)
         messages = self.__protocol(lines)
+        if trace is not None:
+            trace.mark("parsed")
         return messages
 
-    def __send(self, cmd, delay=None, end_marker=ELM_PROMPT):
+    def fileno(self):
+        """
+            Returns the file descriptor of the port, for select() and
+            selectors, or None for ports that don't have one (such as
+            emulator:// and replay:// URLs), which have to be polled.
+        """
+        if self.__port is None:
+            return None
+        try:
+            return self.__port.fileno()
+        except (AttributeError, io.UnsupportedOperation, OSError, ValueError):
+            return None
+
+    def write_nowait(self, cmd):
+        """
+            Writes the given command string, without waiting for the
+            response, which is collected with read_nowait() and given to
+            parse(). Returns False if the adapter is disconnected.
+        """
+        if self.__status == OBDStatus.NOT_CONNECTED:
+            logger.info("cannot write_nowait() when unconnected")
+            return False
+
+        if self.__low_power == True:
+            self.normal_power()
+
+        self.__write(cmd)
+        return self.__port is not None
+
+    def read_nowait(self):
+        """
+            Returns the bytes received so far, without waiting (b"" when
+            there are none), or None if the port failed.
+        """
+        if not self.__port:
+            return None
+
+        try:
+            waiting = self.__port.in_waiting
+            data = self.__port.read(waiting) if waiting else b""
+        except Exception:
+            self.__status = OBDStatus.NOT_CONNECTED
+            self.__port.close()
+            self.__port = None
+            logger.critical("Device disconnected while reading")
+            return None
+
+        if data and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("read: %r", data)
+        return data
+
+    def parse(self, buffer):
+        """
+            Parses the output received for a command written with
+            write_nowait(), up to the prompt, into a list of Messages
+        """
+        now = time.monotonic()
+        self.__received = (now, time.time())
+        return self.__protocol(self.split_lines(buffer))
+
+    def monitor_start(self, cmd=b"AT MA"):
+        """
+            Puts the adapter in a monitor mode (AT MA by default): it
+            prints the frames it sees on the bus, without a prompt, until
+            monitor_stop(). Returns False if the adapter is disconnected.
+        """
+        self.__monitor = bytearray()
+        return self.write_nowait(cmd)
+
+    def monitor_read(self, timeout):
+        """
+            Returns the complete lines printed in monitor mode, waiting up
+            to timeout seconds for the first one, or None if the port failed
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            data = self.read_nowait()
+            if data is None:
+                return None
+            self.__monitor.extend(data)
+            if b"\r" in self.__monitor:
+                break
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            fd = self.fileno()
+            if fd is not None:
+                select.select([fd], [], [], remaining)
+            else:
+                time.sleep(min(remaining, 0.005))
+
+        complete, _, rest = bytes(self.__monitor).rpartition(b"\r")
+        self.__monitor = bytearray(rest)
+        return self.split_lines(complete)
+
+    def monitor_stop(self):
+        """ leaves monitor mode (any character does), returns the lines printed meanwhile """
+        self.__monitor = bytearray()
+        if self.__port is None:
+            return []
+        self.__write(b"")
+        return self.__read()  # up to the prompt, which may come alone
+
+    def __send(self, cmd, delay=None, end_marker=ELM_PROMPT, trace=None):
         """
             unprotected send() function
 
@@ -477,7 +622,7 @@ class ELM327:
             after an optional delay, until the end marker (by
             default, the prompt) is seen
         """
-        self.__write(cmd)
+        self.__write(cmd, trace)
 
         delayed = 0.0
         if delay is not None:
@@ -485,27 +630,34 @@ class ELM327:
             time.sleep(delay)
             delayed += delay
 
-        r = self.__read(end_marker=end_marker)
+        r = self.__read(end_marker=end_marker, trace=trace)
         while delayed < 1.0 and len(r) <= 0:
             d = 0.1
             logger.debug("no response; wait: %f seconds" % d)
             time.sleep(d)
             delayed += d
-            r = self.__read(end_marker=end_marker)
+            r = self.__read(end_marker=end_marker, trace=trace)
         return r
 
-    def __write(self, cmd):
+    def __write(self, cmd, trace=None):
         """
             "low-level" function to write a string to the port
         """
 
         if self.__port:
             cmd += b"\r"  # terminate with carriage return in accordance with ELM327 and STN11XX specifications
-            logger.debug("write: " + repr(cmd))
+            logger.debug("write: %r", cmd)
             try:
                 self.__port.flushInput()  # dump everything in the input buffer
+                if trace is not None:
+                    trace.mark("write_start")
                 self.__port.write(cmd)  # turn the string into bytes and write
                 self.__port.flush()  # wait for the output buffer to finish transmitting
+                now = time.monotonic()
+                self.__sent = (now, time.time())
+                self.__received = (None, None)
+                if trace is not None:
+                    trace.mark("write_flushed", now)
             except Exception:
                 self.__status = OBDStatus.NOT_CONNECTED
                 self.__port.close()
@@ -515,7 +667,7 @@ class ELM327:
         else:
             logger.info("cannot perform __write() when unconnected")
 
-    def __read(self, end_marker=ELM_PROMPT):
+    def __read(self, end_marker=ELM_PROMPT, trace=None):
         """
             "low-level" read function
 
@@ -545,20 +697,37 @@ class ELM327:
                 logger.warning("Failed to read port")
                 break
 
+            if (trace is not None) and not buffer:
+                trace.mark("first_byte")
+
             buffer.extend(data)
 
             # end on specified end-marker sequence
             if end_marker in buffer:
+                now = time.monotonic()
+                self.__received = (now, time.time())
+                if trace is not None:
+                    trace.mark("prompt", now)
                 break
 
         # log, and remove the "bytearray(   ...   )" part
-        logger.debug("read: " + repr(buffer)[10:-1])
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("read: " + repr(buffer)[10:-1])
+
+        return self.split_lines(buffer)
+
+    @classmethod
+    def split_lines(cls, buffer):
+        """
+            turns the raw output of the adapter (up to the prompt) into
+            the list of lines given to the protocol parsers
+        """
 
         # clean out any null characters
         buffer = re.sub(b"\x00", b"", buffer)
 
         # remove the prompt character
-        if buffer.endswith(self.ELM_PROMPT):
+        if buffer.endswith(cls.ELM_PROMPT):
             buffer = buffer[:-1]
 
         # convert bytes into a standard string
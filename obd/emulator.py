@@ -0,0 +1,1085 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# emulator.py                                                          #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+
+"""
+    An emulated ELM327 adapter, and the car behind it
+
+    The emulator answers the AT commands used by python-OBD, and the OBD
+    requests of a configurable set of ECUs, formatted for any of the ELM's
+    protocols (multi-frame ISO-TP responses included). Responses can be
+    delayed, and NO DATA answers and disconnections injected, which makes
+    it a repeatable target for tests, benchmarks and soak runs.
+
+    It can be reached through a pseudo-terminal:
+
+        emulator = Emulator(protocol="6")
+        port = emulator.serve_pty()  # "/dev/pts/N"
+        connection = obd.OBD(port)
+
+    or through the emulator:// URL handler, without a pty:
+
+        connection = obd.OBD("emulator://?protocol=6&latency=0.01")
+
+    or over TCP, like a WiFi adapter:
+
+        host, port = emulator.serve_tcp()
+        connection = obd.OBD("tcp://%s:%d" % (host, port))
+
+    It can also be run from the command line: python -m obd.emulator --help
+
+    The same ECUs can be put on an EmulatedCANBus, which stands in for a
+    native CAN interface (see obd/socketcan.py):
+
+        connection = obd.OBD("socketcan://emulator?protocol=6")
+"""
+
+import collections
+import logging
+import os
+import random
+import select
+import socket
+import threading
+import time
+from binascii import hexlify, unhexlify
+
+from .protocols.protocol_can import isotp_segment
+from .utils import isHex
+
+logger = logging.getLogger(__name__)
+
+
+PROTOCOLS = {
+    "1": "SAE J1850 PWM",
+    "2": "SAE J1850 VPW",
+    "3": "ISO 9141-2",
+    "4": "ISO 14230-4 (KWP 5BAUD)",
+    "5": "ISO 14230-4 (KWP FAST)",
+    "6": "ISO 15765-4 (CAN 11/500)",
+    "7": "ISO 15765-4 (CAN 29/500)",
+    "8": "ISO 15765-4 (CAN 11/250)",
+    "9": "ISO 15765-4 (CAN 29/250)",
+    "A": "SAE J1939 (CAN 29/250)",
+}
+
+CAN_11BIT = ["6", "8"]
+CAN_29BIT = ["7", "9", "A"]
+
+# modes whose PID 00, 20, 40... list the supported PIDs
+PID_LIST_MODES = ["01", "06", "09"]
+
+# seconds between the periodic messages, by transmission mode (slow, medium, fast)
+PERIODIC_RATES = {1: 1.0, 2: 0.2, 3: 0.05}
+
+
+def periodic_id(tx_id, bits):
+    """ the CAN ID of the periodic messages of an emulated ECU (manufacturer specific on real cars) """
+    return 0x5E8 + tx_id if bits == 11 else 0x18F2F100 | tx_id
+
+
+_emulators = {}  # named emulators, for the emulator:// URL handler
+_emulators_lock = threading.Lock()
+
+
+def get_emulator(name):
+    """ returns the emulator registered under the given name, or None """
+    with _emulators_lock:
+        return _emulators.get(name)
+
+
+def _hex(data, spaces=True):
+    s = hexlify(bytes(data)).decode().upper()
+    if spaces:
+        s = " ".join([s[i:i + 2] for i in range(0, len(s), 2)])
+    return s
+
+
+class EmulatedECU(object):
+    """
+        A single ECU on the emulated bus
+
+        responses maps requests (hex strings, ie: "010C") to the response
+        payload, starting with the response SID (ie: "410C1AF8"). Payloads
+        may be hex strings, bytes, or callables taking the request string
+        and returning either (None for no answer). The PID lists (0100,
+        0120... 0900...) are generated from the PIDs present, unless given.
+
+        dids maps UDS data identifiers (ints) to their data (hex strings or
+        bytes), which answer ReadDataByIdentifier (22) requests for one or
+        several DIDs. The periodic DIDs among them (F2xx) can be scheduled
+        with ReadDataByPeriodicIdentifier (2A) requests, after which the
+        ECU sends them at the requested rate (see periodic_messages()).
+        DynamicallyDefineDataIdentifier (2C) requests define new DIDs from
+        parts of the others.
+    """
+
+    def __init__(self, tx_id, responses=None, dids=None):
+        self.tx_id = tx_id
+        self.responses = {}
+        for request, response in (responses or {}).items():
+            self.responses[request.replace(" ", "").upper()] = response
+        self.dids = {}
+        for did, data in (dids or {}).items():
+            if isinstance(data, str):
+                data = unhexlify(data.replace(" ", ""))
+            self.dids[did] = bytes(data)
+        self.periodic = {}  # key = periodic DID (low byte), value = [transmission mode, next due time]
+        self.dynamic = {}  # key = dynamically defined DID, value = list of (source DID, position, size)
+
+    def respond(self, request):
+        """ returns the response payload to a request, as a bytearray, or None """
+        response = self.responses.get(request)
+
+        if (response is None) and request.startswith("22") and self.dids:
+            response = self.__read_dids(request)
+        elif (response is None) and request.startswith("2A") and self.dids:
+            response = self.__schedule(request)
+        elif (response is None) and request.startswith("2C") and self.dids:
+            response = self.__define(request)
+        elif response is None:
+            response = self.__pid_list(request)
+        elif callable(response):
+            response = response(request)
+
+        if response is None:
+            return None
+        elif isinstance(response, str):
+            return bytearray(unhexlify(response.replace(" ", "")))
+        else:
+            return bytearray(response)
+
+    def __read_dids(self, request):
+        """ answers a ReadDataByIdentifier request, leaving out the unknown DIDs """
+        if (len(request) < 6) or ((len(request) - 2) % 4) or not isHex(request):
+            return bytearray(b"\x7f\x22\x13")  # incorrect message length
+
+        data = bytearray([0x62])
+        for i in range(2, len(request), 4):
+            did = int(request[i:i + 4], 16)
+            if self.data(did) is not None:
+                data += bytearray([did >> 8, did & 0xFF]) + self.data(did)
+
+        if len(data) == 1:
+            return bytearray(b"\x7f\x22\x31")  # request out of range
+        return data
+
+    def __schedule(self, request):
+        """ answers a ReadDataByPeriodicIdentifier request """
+        if (len(request) < 4) or (len(request) % 2) or not isHex(request):
+            return bytearray(b"\x7f\x2a\x13")  # incorrect message length
+
+        mode = int(request[2:4], 16)
+        pdids = [int(request[i:i + 2], 16) for i in range(4, len(request), 2)]
+
+        if mode == 4:  # stop sending
+            for p in (pdids or list(self.periodic)):
+                self.periodic.pop(p, None)
+            return bytearray(b"\x6a")
+
+        # the periodic messages are single frames: the periodic DID, and 7 bytes of data
+        if (mode not in PERIODIC_RATES) or not pdids or \
+                any([len(self.data(0xF200 | p) or b"12345678") > 7 for p in pdids]):
+            return bytearray(b"\x7f\x2a\x31")  # request out of range
+
+        now = time.monotonic()
+        for p in pdids:
+            self.periodic[p] = [mode, now]
+        return bytearray(b"\x6a")
+
+    def periodic_messages(self, now):
+        """
+            Returns the periodic messages sent up to now, as a sorted list
+            of (monotonic time, data), the data being the periodic DID
+            followed by the DID's data. A backlog of more than a second is
+            dropped, like a bus nobody listens to.
+        """
+        messages = []
+        for p in sorted(self.periodic):
+            mode, due = self.periodic[p]
+            due = max(due, now - 1.0)
+            while due <= now:
+                messages.append((due, bytearray([p]) + self.data(0xF200 | p)))
+                due += PERIODIC_RATES[mode]
+            self.periodic[p][1] = due
+        messages.sort(key=lambda m: m[0])
+        return messages
+
+    def data(self, did):
+        """ returns the current data of a DID, dynamically defined or not, or None """
+        if did in self.dynamic:
+            return b"".join([self.dids[source][position - 1:position - 1 + size]
+                             for source, position, size in self.dynamic[did]])
+        return self.dids.get(did)
+
+    def __define(self, request):
+        """ answers a DynamicallyDefineDataIdentifier request (by identifier, or clearing) """
+        if (len(request) < 4) or (len(request) % 2) or not isHex(request):
+            return bytearray(b"\x7f\x2c\x13")  # incorrect message length
+
+        sub = request[2:4]
+        if sub == "03":  # clear one, or all of them
+            if len(request) == 4:
+                self.dynamic.clear()
+            elif len(request) == 8:
+                self.dynamic.pop(int(request[4:8], 16), None)
+            else:
+                return bytearray(b"\x7f\x2c\x13")
+            return bytearray(unhexlify("6C" + request[2:]))
+        elif sub != "01":
+            return bytearray(b"\x7f\x2c\x12")  # sub-function not supported
+
+        if (len(request) < 16) or (len(request) - 8) % 8:
+            return bytearray(b"\x7f\x2c\x13")
+
+        did = int(request[4:8], 16)
+        sources = []
+        for i in range(8, len(request), 8):
+            source, position, size = int(request[i:i + 4], 16), \
+                int(request[i + 4:i + 6], 16), int(request[i + 6:i + 8], 16)
+            if (source not in self.dids) or (position < 1) or (size < 1) or \
+                    (position - 1 + size > len(self.dids[source])):
+                return bytearray(b"\x7f\x2c\x31")  # request out of range
+            sources.append((source, position, size))
+        if not 0xF200 <= did <= 0xF3FF:
+            return bytearray(b"\x7f\x2c\x31")
+
+        # later definitions of the same DID add to it
+        self.dynamic.setdefault(did, []).extend(sources)
+        return bytearray(unhexlify("6C01" + request[4:8]))
+
+    def next_periodic(self):
+        """ the monotonic time of the next periodic message, or None """
+        if not self.periodic:
+            return None
+        return min([due for mode, due in self.periodic.values()])
+
+    def __pid_list(self, request):
+        """ generates the response to a PID listing command """
+        if (len(request) != 4) or (request[:2] not in PID_LIST_MODES):
+            return None
+
+        mode = request[:2]
+        base = int(request[2:], 16)
+        if base % 0x20 != 0:
+            return None
+
+        pids = [int(r[2:], 16) for r in self.responses
+                if (len(r) == 4) and (r[:2] == mode) and isHex(r)]
+
+        # the first list of mode 01 is always answered, the others when they're needed
+        if ((base != 0) or (mode != "01")) and not any([p > base for p in pids]):
+            return None
+
+        bits = 0
+        for p in pids:
+            if base < p <= base + 0x20:
+                bits |= 1 << (base + 0x20 - p)
+        if any([p > base + 0x20 for p in pids]):
+            bits |= 1  # the next list is supported
+
+        data = bytearray([0x40 + int(mode, 16), base])
+        data += bytearray([(bits >> s) & 0xFF for s in (24, 16, 8, 0)])
+        return data
+
+
+def default_ecus(protocol="6", count=2):
+    """
+        returns a list of ECUs for the given protocol: an engine, a
+        transmission, and (count - 2) more ECUs answering a few mode 01 PIDs
+    """
+    if protocol in CAN_11BIT:
+        tx_ids = [0x00, 0x01] + list(range(0x02, 0x08))
+    else:
+        tx_ids = [0x10, 0x18] + list(range(0x19, 0x1F))
+
+    if not 0 < count <= len(tx_ids):
+        raise ValueError("count must be between 1 and %d" % len(tx_ids))
+
+    engine = EmulatedECU(tx_ids[0], {
+        "0101": "4101 00 07 E5 00",  # MIL off, no DTCs
+        "0104": "4104 7F",  # engine load
+        "0105": "4105 7B",  # coolant temperature
+        "010B": "410B 65",  # intake pressure
+        "010C": "410C 1A F8",  # RPM
+        "010D": "410D 32",  # speed
+        "010F": "410F 48",  # intake temperature
+        "0110": "4110 01 F4",  # MAF
+        "0111": "4111 33",  # throttle position
+        "011C": "411C 01",  # OBD compliance
+        "0151": "4151 01",  # fuel type
+        "0902": "4902 01" + _hex(b"WP0ZZZ99ZTS392124", False),  # VIN (multi-frame)
+        "03": "4300",
+        "04": "44",
+        "07": "4700",
+    }, dids={
+        0xF190: _hex(b"WP0ZZZ99ZTS392124", False),  # VIN
+        0x028C: "C8",  # (made up) manufacturer specific signals
+        0x044A: "01 F4",
+        0x1A10: "5A",
+        0xF201: "1A F8",  # periodic DIDs
+        0xF202: "C8",
+    })
+
+    others = []
+    for tx_id in tx_ids[1:count]:
+        others.append(EmulatedECU(tx_id, {
+            "0105": "4105 7A",
+            "010D": "410D 32",
+        }))
+
+    return [engine] + others
+
+
+class Emulator(object):
+    """
+        Emulated ELM327 adapter, connected to a car with the given ECUs
+
+        protocol          the car's protocol ("1" through "A")
+        ecus              list of EmulatedECU, defaults to default_ecus(protocol)
+        latency           seconds before the first frame of each response
+        jitter            random extra latency, up to this many seconds
+        frame_time        seconds between consecutive frames
+        timeout           seconds the adapter waits for more frames (AT ST)
+        no_data_rate      probability (0.0 to 1.0) of a request going unanswered
+        disconnect_after  number of OBD requests answered before the adapter
+                          drops off (None = never). AT commands don't count.
+        voltage           battery voltage reported by AT RV
+        identity          reported by ATZ and ATI
+        stn               firmware reported by STI, making this an STN chip
+        seed              seed for the jitter and fault injection
+        name              registers the emulator for emulator://<name> URLs
+    """
+
+    def __init__(self, protocol="6", ecus=None, latency=0.0, jitter=0.0,
+                 frame_time=0.0, timeout=0.2, no_data_rate=0.0,
+                 disconnect_after=None, voltage=12.6, identity="ELM327 v1.5",
+                 stn=None, seed=None, name=None):
+
+        protocol = protocol.upper()
+        if protocol not in PROTOCOLS:
+            raise ValueError("unknown protocol: %r" % protocol)
+
+        self.protocol = protocol
+        self.ecus = ecus if ecus is not None else default_ecus(protocol)
+        self.latency = latency
+        self.jitter = jitter
+        self.frame_time = frame_time
+        self.default_timeout = timeout
+        self.no_data_rate = no_data_rate
+        self.disconnect_after = disconnect_after
+        self.voltage = voltage
+        self.identity = identity
+        self.stn = stn
+        self.name = name
+
+        self.requests = 0  # OBD requests received
+        self.at_commands = 0  # AT commands received
+        self.offline = False
+
+        self.__random = random.Random(seed)
+        self.__lock = threading.RLock()
+        self.__input = bytearray()
+        self.__pty = None  # (master, slave) file descriptors
+        self.__listener = None  # TCP server socket
+        self.__client = None  # TCP client socket being served
+        self.__thread = None
+        self.__serving = False
+
+        self.__defaults()
+
+        if name is not None:
+            with _emulators_lock:
+                _emulators[name] = self
+
+    def __defaults(self):
+        """ the adapter's state after a reset (ATZ, ATD) """
+        self.echo = True
+        self.headers = False
+        self.linefeeds = False
+        self.spaces = True
+        self.timeout = self.default_timeout
+        self.header = None  # None = the protocol's functional header
+        self.receive_filter = None
+        self.selected = "0"  # the protocol selected with AT SP/TP
+        self.auto = True
+        self.connected = False  # whether the protocol has been found
+        self.sleeping = False
+        self.monitoring = None  # monotonic time at which AT MA started, None = not monitoring
+        self.__last = ""
+
+    # ------------------------------------------------------------------
+
+    def feed(self, data):
+        """
+            Processes bytes written to the adapter. Returns a list of
+            (offset, bytes) to be sent back, where offset is the number of
+            seconds after the write at which the bytes become readable, or
+            None if the adapter is disconnected.
+        """
+        with self.__lock:
+            if self.offline:
+                return None
+
+            if self.monitoring is not None:
+                # any character stops the monitor, and is otherwise ignored
+                self.monitoring = None
+                self.__input = bytearray()
+                return [(0.0, self.__prompt())]
+
+            if self.sleeping:
+                # any character wakes the adapter, and is otherwise ignored
+                self.sleeping = False
+                self.__input = bytearray()
+                self.__last = ""
+                return [(0.0, self.__lines(["", self.identity]) + self.__prompt())]
+
+            out = []
+            t = 0.0
+            self.__input += data
+            while b"\r" in self.__input:
+                line, _, rest = bytes(self.__input).partition(b"\r")
+                self.__input = bytearray(rest)
+
+                chunks = self.__handle(line.decode("ascii", "ignore"))
+                if chunks is None:
+                    return out or None  # went offline
+                out.extend([(t + offset, chunk) for offset, chunk in chunks])
+                t = out[-1][0] if out else t
+
+            return out
+
+    def __handle(self, raw):
+        """ handles a single line, returns a list of (offset, bytes) """
+        line = raw.replace(" ", "").replace("\n", "").upper()
+
+        echo = [(0.0, (raw + "\r").encode())] if self.echo else []
+
+        if line == "":
+            line = self.__last  # an empty line repeats the last command
+        self.__last = line
+
+        if line.startswith("AT"):
+            self.at_commands += 1
+            return echo + [(0.0, self.__at(line[2:]))]
+        elif line.startswith("ST") and (self.stn is not None):
+            self.at_commands += 1
+            return echo + [(0.0, self.__st(line[2:]))]
+        elif isHex(line) and len(line) >= 2:
+            chunks = self.__query(line)
+            return None if chunks is None else echo + chunks
+        else:
+            return echo + [(0.0, self.__lines(["?"]) + self.__prompt())]
+
+    # ------------------------------------------------------------------
+
+    def __at(self, cmd):
+        """ handles an AT command, returns the bytes of the answer """
+        reply = "OK"
+        ok_flags = ["M0", "M1", "CAF0", "CAF1", "R0", "R1", "AT0", "AT1",
+                    "AT2", "AL", "NL", "KW0", "KW1", "PC", "BI", "SI", "FI",
+                    "V0", "V1", "D0", "D1", "CFC0", "CFC1"]
+
+        if cmd in ["Z", "WS"]:
+            self.__defaults()
+            return self.__lines(["", self.identity]) + self.__prompt()
+        elif cmd == "D":
+            self.__defaults()
+        elif cmd == "I":
+            reply = self.identity
+        elif cmd == "@1":
+            reply = "OBDII to RS232 Interpreter"
+        elif cmd == "RV":
+            reply = "%.1fV" % self.voltage
+        elif cmd == "DPN":
+            reply = ("A" if self.auto else "") + (self.protocol if self.connected else self.selected)
+        elif cmd == "DP":
+            name = PROTOCOLS.get(self.protocol if self.connected else self.selected, "AUTOMATIC")
+            reply = ("AUTO, " if self.auto and self.connected else "") + name
+        elif cmd == "LP":
+            self.sleeping = True
+            return self.__lines(["OK"])  # no prompt, the chip is going to sleep
+        elif cmd == "AR":
+            self.receive_filter = None
+        elif cmd == "MA":
+            self.monitoring = time.monotonic()
+            return b""  # no prompt, until a character is received
+        elif cmd in ["E0", "E1"]:
+            self.echo = cmd == "E1"
+        elif cmd in ["H0", "H1"]:
+            self.headers = cmd == "H1"
+        elif cmd in ["L0", "L1"]:
+            self.linefeeds = cmd == "L1"
+        elif cmd in ["S0", "S1"]:
+            self.spaces = cmd == "S1"
+        elif cmd in ok_flags:
+            pass
+        elif cmd[:2] in ["SP", "TP"] and len(cmd) in [3, 4]:
+            p = cmd[2:]
+            auto = (cmd[:2] == "TP") or p.startswith("A") or (p == "0")
+            p = p[-1]
+            if (p != "0") and (p not in PROTOCOLS):
+                reply = "?"
+            else:
+                self.selected = p
+                self.auto = auto
+                self.connected = False
+        elif cmd.startswith("SH") and len(cmd) in [5, 8] and isHex(cmd[2:]):
+            self.header = cmd[2:]
+        elif cmd.startswith("CRA") and len(cmd) in [6, 11]:
+            self.receive_filter = cmd[3:]
+        elif cmd.startswith("ST") and len(cmd) == 4 and isHex(cmd[2:]):
+            value = int(cmd[2:], 16)
+            self.timeout = (value * 0.004) if value else self.default_timeout
+        elif cmd.startswith("CP") and len(cmd) == 4 and isHex(cmd[2:]):
+            pass
+        else:
+            reply = "?"
+
+        return self.__lines([reply]) + self.__prompt()
+
+    def __st(self, cmd):
+        """ handles the few ST commands of STN chips """
+        if cmd == "I":
+            reply = self.stn
+        elif cmd == "DI":
+            reply = "OBDLink (emulated)"
+        else:
+            reply = "?"
+        return self.__lines([reply]) + self.__prompt()
+
+    # ------------------------------------------------------------------
+
+    def __query(self, line):
+        """ handles an OBD request, returns a list of (offset, bytes) """
+
+        count = None
+        if len(line) % 2 == 1:
+            count = int(line[-1], 16)  # the number of frames to wait for
+            line = line[:-1]
+
+        # CAN requests are single frames (7 bytes), unless an STN chip segments them
+        if (self.protocol in CAN_11BIT + CAN_29BIT) and (len(line) > 14) and (self.stn is None):
+            return [(0.0, self.__lines(["?"]) + self.__prompt())]
+
+        if (self.disconnect_after is not None) and (self.requests >= self.disconnect_after):
+            logger.info("Emulator disconnecting after %d requests" % self.requests)
+            self.disconnect()
+            return None
+
+        self.requests += 1
+        delay = self.latency
+        if self.jitter:
+            delay += self.__random.uniform(0.0, self.jitter)
+
+        lines = []
+        if self.auto and not self.connected:
+            lines.append((0.0, "SEARCHING..."))
+            self.connected = True
+        elif not self.auto:
+            if self.selected != self.protocol:
+                return [(delay + self.timeout, self.__lines(["UNABLE TO CONNECT"]) + self.__prompt())]
+            self.connected = True
+
+        frames = []
+        if not (self.no_data_rate and (self.__random.random() < self.no_data_rate)):
+            for ecu in self.__targets():
+                payload = ecu.respond(line)
+                if payload:
+                    frames.extend(self.__frames(ecu.tx_id, payload))
+
+        frames = [text for header, text in frames if self.__accepts(header)]
+        if count:
+            frames = frames[:count]
+
+        t = delay
+        for i, text in enumerate(frames):
+            t = delay + i * self.frame_time
+            lines.append((t, text))
+
+        if not frames:
+            t += self.timeout
+            lines.append((t, "NO DATA"))
+        elif not count or (len(frames) < count):
+            t += self.timeout  # waits for more, until the timeout
+
+        chunks = [(offset, self.__lines([text])) for offset, text in lines]
+        chunks.append((t, self.__prompt()))
+        return chunks
+
+    def __targets(self):
+        """ returns the ECUs addressed by the current header """
+        header = self.header
+        if (header is None) or (self.protocol not in CAN_11BIT + CAN_29BIT):
+            return self.ecus  # legacy protocols are always broadcast
+
+        if self.protocol in CAN_11BIT:
+            if len(header) != 3:
+                return []
+            h = int(header, 16)
+            if h == 0x7DF:
+                return self.ecus
+            return [e for e in self.ecus if h == 0x7E0 + e.tx_id]
+        else:
+            if len(header) != 6:
+                return []
+            if header == "DB33F1":
+                return self.ecus
+            if header.startswith("DA") and header.endswith("F1"):
+                return [e for e in self.ecus if int(header[2:4], 16) == e.tx_id]
+            return []
+
+    def __accepts(self, header):
+        """ applies the AT CRA filter to the header of a received frame """
+        f = self.receive_filter
+        if f is None:
+            return True
+        if len(f) != len(header):
+            return False
+        return all([a == "X" or a == b for a, b in zip(f, header)])
+
+    def __frames(self, tx_id, payload):
+        """
+            formats a response payload into the frames sent by the car,
+            returns a list of (header, text) where the header is a hex
+            string without spaces, and the text is what the ELM prints
+        """
+        if self.protocol in CAN_11BIT:
+            header = "%03X" % (0x7E8 + tx_id)
+            printed = header
+        elif self.protocol in CAN_29BIT:
+            header = "18DAF1%02X" % tx_id
+            printed = _hex(unhexlify(header), self.spaces)
+        else:
+            return self.__legacy_frames(tx_id, payload)
+
+        frames = isotp_segment(payload)
+
+        if self.headers:
+            sep = " " if self.spaces else ""
+            return [(header, printed + sep + _hex(f, self.spaces)) for f in frames]
+        elif len(frames) == 1:
+            return [(header, _hex(payload, self.spaces))]
+        else:
+            # the ELM prints the length, and numbers the frames
+            text = ["%03X" % len(payload)]
+            for i, f in enumerate(frames):
+                data = f[2:] if i == 0 else f[1:]
+                text.append("%X:%s%s" % (i & 0x0F, " " if self.spaces else "", _hex(data, self.spaces)))
+            return [(header, t) for t in text]
+
+    def __legacy_frames(self, tx_id, payload):
+        """ J1850 and ISO 9141/14230 frames: header, up to 7 data bytes, checksum """
+        header = bytearray([0x48, 0x6B, tx_id])
+
+        if payload[0] == 0x43:
+            # DTCs, 3 per frame, without CAN's DTC count byte
+            dtcs = payload[2:]
+            frames = []
+            for start in range(0, max(len(dtcs), 1), 6):
+                chunk = dtcs[start:start + 6]
+                frames.append(bytearray([0x43]) + chunk + bytearray(6 - len(chunk)))
+        elif len(payload) <= 7:
+            frames = [payload]
+        else:
+            # mode, PID, sequence number, and 4 bytes of data
+            data = payload[2:]
+            frames = []
+            for i, start in enumerate(range(0, len(data), 4)):
+                chunk = data[start:start + 4]
+                frames.append(payload[:2] + bytearray([i + 1]) + chunk + bytearray(4 - len(chunk)))
+
+        result = []
+        for f in frames:
+            f = header + f
+            f.append(sum(f) & 0xFF)
+            if self.headers:
+                text = _hex(f, self.spaces)
+            else:
+                text = _hex(f[3:-1], self.spaces)
+            result.append((_hex(header, False), text))
+        return result
+
+    def monitor_output(self, now=None):
+        """
+            Returns the bytes printed by AT MA (monitor all) up to now,
+            since the last call: the periodic messages sent by the ECUs.
+            Called by the transports serving the emulator.
+        """
+        with self.__lock:
+            if (self.monitoring is None) or self.offline or \
+                    (self.protocol not in CAN_11BIT + CAN_29BIT):
+                return b""
+
+            now = time.monotonic() if now is None else now
+            messages = []
+            for ecu in self.ecus:
+                messages += [(t, ecu.tx_id, data) for t, data in ecu.periodic_messages(now)
+                             if t >= self.monitoring]
+            messages.sort(key=lambda m: m[0])
+
+            lines = []
+            for t, tx_id, data in messages:
+                if self.protocol in CAN_11BIT:
+                    header = "%03X" % periodic_id(tx_id, 11)
+                    printed = header
+                else:
+                    header = "%08X" % periodic_id(tx_id, 29)
+                    printed = _hex(unhexlify(header), self.spaces)
+                if not self.__accepts(header):
+                    continue
+                if self.headers:
+                    lines.append(printed + (" " if self.spaces else "") + _hex(data, self.spaces))
+                else:
+                    lines.append(_hex(data, self.spaces))
+            return self.__lines(lines) if lines else b""
+
+    def __lines(self, lines):
+        eol = "\r\n" if self.linefeeds else "\r"
+        return "".join([line + eol for line in lines]).encode()
+
+    def __prompt(self):
+        return ("\r\n>" if self.linefeeds else "\r>").encode()
+
+    # ------------------------------------------------------------------
+
+    def disconnect(self):
+        """ drops the adapter off, as if it was unplugged """
+        with self.__lock:
+            self.offline = True
+
+    def reconnect(self):
+        """ plugs the adapter back in, freshly reset """
+        with self.__lock:
+            self.offline = False
+            self.disconnect_after = None
+            self.__input = bytearray()
+            self.__defaults()
+
+    def serve_pty(self):
+        """
+            Serves the emulator on a pseudo-terminal (POSIX only), from a
+            background thread. Returns the path of the terminal to connect to.
+        """
+        import tty
+
+        if self.__pty is not None:
+            return os.ttyname(self.__pty[1])
+
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        self.__pty = (master, slave)
+        self.__serving = True
+        self.__thread = threading.Thread(target=self.__serve, args=(master,),
+                                         name="obd-emulator")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+        path = os.ttyname(slave)
+        logger.info("Emulator serving on %s" % path)
+        return path
+
+    def __serve(self, master):
+        while self.__serving:
+            try:
+                readable, _, _ = select.select([master], [], [], self.__idle_time())
+                if not readable:
+                    os.write(master, self.monitor_output())
+                    continue
+                data = os.read(master, 1024)
+            except (OSError, ValueError):
+                break
+
+            start = time.monotonic()
+            for offset, chunk in self.feed(data) or []:
+                wait = start + offset - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                try:
+                    os.write(master, chunk)
+                except OSError:
+                    return
+
+    def __idle_time(self):
+        """ how long the serving threads wait for input, before printing what the monitor saw """
+        return 0.1 if self.monitoring is None else 0.01
+
+    def serve_tcp(self, host="127.0.0.1", port=0):
+        """
+            Serves the emulator on a TCP port, like a WiFi adapter, from a
+            background thread. One client is served at a time. Returns the
+            (host, port) address to connect to.
+        """
+        if self.__listener is not None:
+            return self.__listener.getsockname()[:2]
+
+        self.__listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__listener.bind((host, port))
+        self.__listener.listen(1)
+        self.__serving = True
+        self.__thread = threading.Thread(target=self.__serve_tcp, name="obd-emulator")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+        address = self.__listener.getsockname()[:2]
+        logger.info("Emulator serving on %s:%d" % address)
+        return address
+
+    def __serve_tcp(self):
+        while self.__serving:
+            readable, _, _ = select.select([self.__listener], [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                client, _ = self.__listener.accept()
+            except OSError:
+                break
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.__client = client
+            while self.__serving:
+                try:
+                    readable, _, _ = select.select([client], [], [], self.__idle_time())
+                    if not readable:
+                        client.sendall(self.monitor_output())
+                        continue
+                    data = client.recv(1024)
+                except (OSError, ValueError):
+                    break
+                if not data:
+                    break
+
+                start = time.monotonic()
+                try:
+                    for offset, chunk in self.feed(data) or []:
+                        wait = start + offset - time.monotonic()
+                        if wait > 0:
+                            time.sleep(wait)
+                        client.sendall(chunk)
+                except OSError:
+                    break
+            self.__client = None
+            client.close()
+
+    def drop_client(self):
+        """ closes the connection of the TCP client being served, as a WiFi adapter dropping out would """
+        client = self.__client
+        if client is not None:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def stop(self):
+        """ stops serving the pty, or the TCP port """
+        self.__serving = False
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        if self.__pty is not None:
+            for fd in self.__pty:
+                os.close(fd)
+            self.__pty = None
+        if self.__listener is not None:
+            self.__listener.close()
+            self.__listener = None
+
+    def close(self):
+        """ stops serving, and unregisters the emulator's name """
+        self.stop()
+        if self.name is not None:
+            with _emulators_lock:
+                if _emulators.get(self.name) is self:
+                    del _emulators[self.name]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class EmulatedCANBus(object):
+    """
+        A CAN bus with the given ECUs, as seen by a native CAN interface.
+        Frames are (CAN ID, data) pairs. ECUs answer ISO-TP requests,
+        send the flow control frame of multi-frame requests, and hold
+        the consecutive frames of multi-frame responses until the
+        tester's flow control frame.
+
+        Used by the "socketcan://emulator" interface, in one thread.
+    """
+
+    def __init__(self, ecus=None, bits=11, latency=0.0):
+        self.bits = bits
+        self.ecus = ecus if ecus is not None else default_ecus("6" if bits == 11 else "7")
+        self.latency = latency
+        self.requests = 0  # number of requests answered
+        self.sent = []  # frames sent by the tester
+        self.filters = None  # (CAN ID, mask) pairs given by the interface, None = all frames
+        self.__queue = collections.deque()  # (due, CAN ID, data) waiting to be received
+        self.__held = {}  # key = response ID, value = consecutive frames waiting for flow control
+        self.__incoming = {}  # key = request ID, value = [length, data] of a multi-frame request
+
+    def functional_id(self):
+        return 0x7DF if self.bits == 11 else 0x18DB33F1
+
+    def request_id(self, tx_id):
+        return 0x7E0 + tx_id if self.bits == 11 else 0x18DA00F1 | (tx_id << 8)
+
+    def response_id(self, tx_id):
+        return 0x7E8 + tx_id if self.bits == 11 else 0x18DAF100 | tx_id
+
+    def set_filters(self, filters):
+        self.filters = filters
+
+    def send(self, can_id, data):
+        self.sent.append((can_id, bytes(data)))
+        data = bytearray(data)
+        pci = data[0] & 0xF0
+        now = time.monotonic()
+
+        if pci == 0x30:  # flow control, for a held response
+            for ecu in self.ecus:
+                if self.request_id(ecu.tx_id) == can_id:
+                    rx = self.response_id(ecu.tx_id)
+                    for f in self.__held.pop(rx, []):
+                        self.__queue.append((now, rx, f))
+            return
+
+        targets = self.__targets(can_id)
+        if pci == 0x00:
+            self.__answer(targets, data[1:1 + (data[0] & 0x0F)], now)
+        elif pci == 0x10 and len(targets) == 1:
+            self.__incoming[can_id] = [((data[0] & 0x0F) << 8) | data[1], data[2:]]
+            fc = bytearray([0x30, 0x00, 0x00]) + bytearray(5)
+            self.__queue.append((now, self.response_id(targets[0].tx_id), fc))
+        elif pci == 0x20 and can_id in self.__incoming:
+            length, payload = self.__incoming[can_id]
+            payload += data[1:]
+            if len(payload) >= length:
+                del self.__incoming[can_id]
+                self.__answer(targets, payload[:length], now)
+
+    def __targets(self, can_id):
+        if can_id == self.functional_id():
+            return self.ecus
+        return [e for e in self.ecus if self.request_id(e.tx_id) == can_id]
+
+    def __answer(self, targets, payload, now):
+        request = hexlify(bytes(payload)).decode().upper()
+        self.requests += 1
+        for ecu in targets:
+            response = ecu.respond(request)
+            if not response:
+                continue
+            rx = self.response_id(ecu.tx_id)
+            frames = isotp_segment(response)
+            self.__queue.append((now + self.latency, rx, frames[0]))
+            if len(frames) > 1:
+                self.__held[rx] = frames[1:]
+
+    def recv(self, timeout):
+        """ returns the next (CAN ID, data) frame, or None after the timeout """
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            for ecu in self.ecus:
+                rx = periodic_id(ecu.tx_id, self.bits)
+                for t, data in ecu.periodic_messages(now):
+                    self.__queue.append((t, rx, data))
+
+            if self.__queue and self.__queue[0][0] <= now:
+                due, can_id, data = self.__queue.popleft()
+                if self.__passes(can_id):
+                    return can_id, bytes(data)
+                continue
+            if now >= deadline:
+                return None
+
+            wakeup = [deadline]
+            if self.__queue:
+                wakeup.append(self.__queue[0][0])
+            wakeup += [t for t in [e.next_periodic() for e in self.ecus] if t is not None]
+            time.sleep(max(min(wakeup) - now, 0.0))
+
+    def __passes(self, can_id):
+        """ applies the filters, like the kernel does for raw CAN sockets """
+        if self.filters is None:
+            return True
+        return any([(can_id & mask) == (i & mask) and ((can_id > 0x7FF) == (i > 0x7FF))
+                    for i, mask in self.filters])
+
+    def close(self):
+        self.__queue.clear()
+        self.__held.clear()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m obd.emulator",
+                                     description="Serves an emulated ELM327 on a pseudo-terminal, or a TCP port")
+    parser.add_argument("--protocol", default="6", help="the car's protocol, 1 through A (default: 6)")
+    parser.add_argument("--ecus", type=int, default=2, help="number of ECUs (default: 2)")
+    parser.add_argument("--latency", type=float, default=0.0, help="response latency, in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, in seconds")
+    parser.add_argument("--timeout", type=float, default=0.2, help="the adapter's timeout, in seconds")
+    parser.add_argument("--no-data-rate", type=float, default=0.0, help="probability of NO DATA answers")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--tcp", type=int, default=None, metavar="PORT",
+                        help="serve on this TCP port (0 = any), instead of a pty")
+    args = parser.parse_args(argv)
+
+    emulator = Emulator(protocol=args.protocol,
+                        ecus=default_ecus(args.protocol.upper(), args.ecus),
+                        latency=args.latency,
+                        jitter=args.jitter,
+                        timeout=args.timeout,
+                        no_data_rate=args.no_data_rate,
+                        seed=args.seed)
+
+    if args.tcp is None:
+        print(emulator.serve_pty())
+    else:
+        print("tcp://%s:%d" % emulator.serve_tcp(port=args.tcp))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,447 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# fleet.py                                                             #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+"""
+    Polls several ELM327 adapters from a single thread
+
+    Each obd.Async connection runs a thread of its own, which spends most
+    of its time blocked in reads. A FleetPoller waits on the ports of all
+    its adapters with one selector instead, and moves each adapter through
+    a small state machine (write the command, await the prompt, parse) as
+    the adapter's output arrives. Each adapter has its own Async-style
+    schedule of watched commands:
+
+        poller = obd.FleetPoller()
+        for port in ports:
+            connection = obd.OBD(port)
+            poller.watch(connection, obd.commands.RPM, callback)
+        poller.start()  # one thread, for all of the adapters
+
+    Connections are made (and their supported commands loaded) by obd.OBD
+    as usual. Once added to a poller, a connection shouldn't be queried
+    directly until it is removed again. Commands are sent with their own
+    ECU header: physical addressing isn't applied.
+"""
+
+import logging
+import selectors
+import threading
+import time
+
+from .OBDResponse import OBDResponse
+from .obd import group_by_header, stamp_response
+from .utils import OBDStatus
+
+logger = logging.getLogger(__name__)
+
+
+IDLE = "idle"        # waiting for the next round of commands
+HEADER = "header"    # waiting for the answer to 'AT SH'
+COMMAND = "command"  # waiting for the response to a command
+DOWN = "down"        # the adapter was disconnected
+
+
+class Adapter(object):
+    """ A connection driven by a FleetPoller, and the state of its transaction """
+
+    PROMPT = b">"
+
+    def __init__(self, connection, delay_cmds, timeout):
+        self.connection = connection
+        self.interface = connection.interface
+        self.delay_cmds = delay_cmds
+        self.timeout = timeout  # seconds to wait for the prompt
+        self.commands = {}   # key = OBDCommand, value = latest OBDResponse
+        self.callbacks = {}  # key = OBDCommand, value = list of functions
+        self.state = IDLE
+        self.fd = None  # file descriptor registered with the selector
+        self.rounds = 0     # number of completed rounds
+        self.responses = 0  # number of responses received
+        self.timeouts = 0   # number of responses given up on
+        self.draining = False  # finish the exchange in progress, without starting others
+        self.__header = connection.header  # header set on the adapter, None = unknown
+        self.__last_command = b""
+        self.__queue = []  # commands left in the current round
+        self.__command = None  # (OBDCommand, frame count asked for) being sent
+        self.__pending_header = None
+        self.__buffer = bytearray()
+        self.__deadline = None
+        self.__next_round = 0.0
+
+        # the connection has been talking to the adapter on its own
+        connection.forget_adapter_state(self.__header)
+
+    def __repr__(self):
+        return "<Adapter %s %s>" % (self.interface.port_name(), self.state)
+
+    @property
+    def header(self):
+        """ the header set on the adapter, None if unknown """
+        return self.__header
+
+    @property
+    def busy(self):
+        return self.state in (HEADER, COMMAND)
+
+    def wakeup(self):
+        """ returns the monotonic time at which step() has something to do, or None """
+        if self.busy:
+            return self.__deadline
+        if (self.state == IDLE) and self.commands and not self.draining:
+            return self.__next_round
+        return None
+
+    def step(self, now):
+        """ starts the next round when it is due, and gives up on overdue responses """
+        if self.busy and (now >= self.__deadline):
+            logger.warning("%s: no prompt after %s seconds", self.interface.port_name(), self.timeout)
+            self.timeouts += 1
+            # the adapter's state is unknown from now on
+            self.__header = None
+            self.__last_command = b""
+            if self.state == COMMAND:
+                self.__complete(self.__command[0], OBDResponse(), now)
+            else:
+                self.__send_next(now)
+
+        if (self.state == IDLE) and self.commands and (now >= self.__next_round) and not self.draining:
+            self.__queue = self.__schedule()
+            self.__send_next(now)
+
+    def readable(self, now):
+        """ collects the adapter's output, returns the number of responses completed """
+        data = self.interface.read_nowait()
+        if data is None:
+            self.__down()
+            return 0
+        if not self.busy:
+            return 0  # late output, after a timeout
+
+        self.__buffer.extend(data)
+        if self.PROMPT not in self.__buffer:
+            return 0
+
+        if self.state == HEADER:
+            if "OK" not in self.interface.split_lines(self.__buffer):
+                # sent on the previous header, the command would reach another ECU
+                logger.info("Set Header ('AT SH %s') did not return 'OK'", self.__pending_header)
+                self.__complete(self.__command[0], OBDResponse(), now)
+                return 1
+            self.__header = self.__pending_header
+            self.__send_command(now)
+            return 0
+
+        cmd, count = self.__command
+        messages = self.interface.parse(self.__buffer)
+        if self.connection.fast and cmd.fast:
+            key = (cmd, self.__header, self.interface.protocol_id())
+            self.connection.frame_counts.observe(key, messages, count)
+
+        r = cmd(messages) if messages else OBDResponse()
+        self.__complete(cmd, stamp_response(r, self.interface), now)
+        return 1
+
+    def __schedule(self):
+        """ orders the watched commands by header, the header that is set first """
+        return group_by_header(self.commands, lambda c: c.header, self.__header)
+
+    def __send_next(self, now):
+        if self.draining:
+            self.state = IDLE  # the next round starts over
+            return
+
+        if not self.__queue:
+            self.state = IDLE
+            self.rounds += 1
+            self.__next_round = now + self.delay_cmds
+            return
+
+        cmd = self.__queue.pop(0)
+        self.__command = (cmd, None)
+        if cmd.header != self.__header:
+            self.__pending_header = cmd.header
+            self.__write(HEADER, b"AT SH " + cmd.header + b" ", now)
+        else:
+            self.__send_command(now)
+
+    def __send_command(self, now):
+        cmd = self.__command[0]
+
+        # ask for the number of frames learned by the connection, like OBD.query()
+        count = None
+        if self.connection.fast and cmd.fast:
+            key = (cmd, self.__header, self.interface.protocol_id())
+            count = self.connection.frame_counts.get(key)
+        self.__command = (cmd, count)
+
+        cmd_string = cmd.descriptor.request(count)
+        sent = cmd_string
+        if self.connection.fast and (cmd_string == self.__last_command):
+            sent = b""  # repeat the previous command with a CR
+        self.__last_command = cmd_string
+        self.__write(COMMAND, sent, now)
+
+    def __write(self, state, cmd_string, now):
+        self.__buffer = bytearray()
+        if not self.interface.write_nowait(cmd_string):
+            self.__down()
+            return
+        self.state = state
+        self.__deadline = now + self.timeout
+
+    def __complete(self, cmd, r, now):
+        self.responses += 1
+        if cmd in self.commands:
+            self.commands[cmd] = r
+            for callback in self.callbacks[cmd]:
+                callback(r)
+        self.__send_next(now)
+
+    def __down(self):
+        if self.state != DOWN:
+            logger.warning("%s: adapter disconnected", self.interface.port_name())
+        self.state = DOWN
+
+
+class FleetPoller(object):
+    """
+        Polls the watched commands of several ELM327 connections, from a
+        single thread
+    """
+
+    def __init__(self, delay_cmds=0.25, timeout=5.0, poll_interval=0.005):
+        self.__adapters = {}  # key = OBD connection, value = Adapter
+        self.__selector = selectors.DefaultSelector()
+        self.__thread = None
+        self.__running = False
+        self.delay_cmds = delay_cmds  # seconds between the rounds of each adapter
+        self.timeout = timeout  # seconds to wait for a prompt
+        self.poll_interval = poll_interval  # for ports without a file descriptor
+
+    @property
+    def running(self):
+        return self.__running
+
+    @property
+    def adapters(self):
+        return list(self.__adapters.values())
+
+    def adapter(self, connection):
+        """ returns the Adapter of the given connection, or None """
+        return self.__adapters.get(connection)
+
+    def add(self, connection):
+        """
+            Hands the given connection over to the poller, and returns its
+            Adapter. Raises a ValueError if the connection can't be polled.
+        """
+        if connection in self.__adapters:
+            return self.__adapters[connection]
+
+        if self.__running:
+            logger.warning("Can't add() while running, please use stop()")
+            return None
+
+        if connection.status() == OBDStatus.NOT_CONNECTED:
+            raise ValueError("Can't poll a connection that isn't connected")
+        if not hasattr(connection.interface, "write_nowait"):
+            raise ValueError("Only ELM327 adapters can be polled, not %s" %
+                             type(connection.interface).__name__)
+
+        adapter = Adapter(connection, self.delay_cmds, self.timeout)
+        self.__adapters[connection] = adapter
+        self.__register(adapter)
+        logger.info("Polling %s" % connection.port_name())
+        return adapter
+
+    def remove(self, connection):
+        """ Hands the given connection back, for direct queries """
+        if self.__running:
+            logger.warning("Can't remove() while running, please use stop()")
+            return
+
+        adapter = self.__adapters.pop(connection, None)
+        if adapter is not None:
+            self.__unregister(adapter)
+            # the poller may have left another header set on the adapter
+            connection.forget_adapter_state(adapter.header)
+
+    def watch(self, connection, c, callback=None, force=False):
+        """
+            Subscribes the given command of the given connection for
+            continuous updating (see Async.watch()). The connection is
+            added to the poller if it isn't already.
+        """
+        if self.__running:
+            logger.warning("Can't watch() while running, please use stop()")
+            return
+
+        if not force and not connection.test_cmd(c):
+            # test_cmd() will print warnings
+            return
+
+        adapter = self.add(connection)
+        if c not in adapter.commands:
+            logger.info("Watching command: %s on %s" % (c, connection.port_name()))
+            adapter.commands[c] = OBDResponse()  # give it an initial value
+            adapter.callbacks[c] = []
+
+        if hasattr(callback, "__call__") and (callback not in adapter.callbacks[c]):
+            adapter.callbacks[c].append(callback)
+
+    def unwatch(self, connection, c, callback=None):
+        """
+            Unsubscribes a command of the given connection (and optionally,
+            a specific callback only) from being updated
+        """
+        if self.__running:
+            logger.warning("Can't unwatch() while running, please use stop()")
+            return
+
+        adapter = self.__adapters.get(connection)
+        if (adapter is None) or (c not in adapter.commands):
+            return
+
+        if hasattr(callback, "__call__") and (callback in adapter.callbacks[c]):
+            adapter.callbacks[c].remove(callback)
+            if adapter.callbacks[c]:
+                return
+        adapter.callbacks.pop(c)
+        adapter.commands.pop(c)
+
+    def query(self, connection, c):
+        """ returns the latest response to a watched command """
+        adapter = self.__adapters.get(connection)
+        if (adapter is None) or (c not in adapter.commands):
+            return OBDResponse()
+        return adapter.commands[c]
+
+    def __register(self, adapter):
+        """ (re)registers the adapter's port, whose descriptor may change when it reconnects """
+        fd = adapter.interface.fileno() if adapter.state != DOWN else None
+        if fd == adapter.fd:
+            return
+        self.__unregister(adapter)
+        if fd is not None:
+            self.__selector.register(fd, selectors.EVENT_READ, adapter)
+            adapter.fd = fd
+
+    def __unregister(self, adapter):
+        if adapter.fd is not None:
+            try:
+                self.__selector.unregister(adapter.fd)
+            except (KeyError, ValueError):
+                pass
+            adapter.fd = None
+
+    def poll(self, timeout=None):
+        """
+            Runs one iteration of the loop: starts the rounds that are due,
+            waits for output until the next thing to do (at most timeout
+            seconds, None = no limit), and handles it. Returns the number
+            of responses completed.
+        """
+        now = time.monotonic()
+        polled = []  # busy adapters without a file descriptor
+        wait = timeout
+
+        for adapter in self.__adapters.values():
+            adapter.step(now)
+            self.__register(adapter)
+            wakeup = adapter.wakeup()
+            if wakeup is not None:
+                wait = (wakeup - now) if wait is None else min(wait, wakeup - now)
+            if adapter.busy and (adapter.fd is None):
+                polled.append(adapter)
+
+        if polled:
+            wait = self.poll_interval if wait is None else min(wait, self.poll_interval)
+        if wait is not None:
+            wait = max(wait, 0.0)
+
+        if self.__selector.get_map():
+            events = self.__selector.select(wait)
+        else:
+            events = []
+            if wait is not None:
+                time.sleep(wait)
+
+        done = 0
+        now = time.monotonic()
+        for key, _ in events:
+            done += key.data.readable(now)
+        for adapter in polled:
+            done += adapter.readable(now)
+        return done
+
+    def start(self):
+        """ Starts polling, in a background thread """
+        if not self.__adapters:
+            logger.info("Poller not started because no adapters were added")
+            return
+
+        if self.__thread is None:
+            logger.info("Starting poller thread")
+            self.__running = True
+            self.__thread = threading.Thread(target=self.run, name="obd-fleet")
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def stop(self):
+        """ Stops the background thread, after the exchanges in progress """
+        if self.__thread is not None:
+            logger.info("Stopping poller thread...")
+            self.__running = False
+            self.__thread.join()
+            self.__thread = None
+
+    def run(self):
+        """ Poller thread """
+        while self.__running:
+            self.poll(0.25)
+
+        # let the exchanges in progress finish, so that the adapters are
+        # left ready for the next command
+        adapters = list(self.__adapters.values())
+        for adapter in adapters:
+            adapter.draining = True
+        while any(a.busy for a in adapters):
+            self.poll(0.25)
+        for adapter in adapters:
+            adapter.draining = False
+
+    def close(self):
+        """ Stops polling, and hands all of the connections back """
+        self.stop()
+        for connection in list(self.__adapters):
+            self.remove(connection)
+        self.__selector.close()
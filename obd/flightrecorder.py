@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# flightrecorder.py                                                    #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+"""
+    A black box for OBD sessions: a fixed size, memory mapped ring of the
+    most recent raw frames and decoded samples, and captures of the ring
+    around the moments when a trigger fires.
+
+    File layout (little endian), shared by ring files and capture files:
+
+        header (64 bytes):
+            MAGIC, slot size (uint32), slot count (uint32),
+            next sequence number (uint64), wall clock creation time (double),
+            time of the trigger (double, NaN for ring files)
+        then slot count slots of SLOT_SIZE bytes:
+            sequence number (uint64), time (double, seconds since epoch),
+            kind (1 byte), padding (1 byte), length of data (uint16),
+            data (up to SLOT_DATA bytes)
+
+    The slot with sequence number n is stored at position n % slot count.
+    Records longer than SLOT_DATA continue in the following slots, which
+    have the kind CONTINUED. The next sequence number in the header is
+    updated after every record, so a ring that wasn't closed (a crash, a
+    power cut) can be read, or reopened and continued.
+
+    Record kinds:
+
+        FRAME:   the raw text of a frame, as read from the adapter
+        SAMPLE:  command name length (uint8), command name, then b"d" and
+                 a double, b"j" and JSON text, or b"n" for null responses
+        TRIGGER: the reason the trigger gave, as UTF-8 text
+"""
+
+import collections
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+from .triplog import _value, _json_default, NUMBER
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"OBDFLT\x00\x01"
+
+SLOT_SIZE = 64
+
+CONTINUED = 0
+FRAME = 1
+SAMPLE = 2
+TRIGGER = 3
+
+_HEADER = struct.Struct("<8sIIQdd")
+_HEADER_SIZE = 64
+_SEQUENCE_OFFSET = 16  # offset of the next sequence number in the header
+_SLOT = struct.Struct("<QdBxH")
+SLOT_DATA = SLOT_SIZE - _SLOT.size
+MAX_SLOTS = 64  # per record, longer records are truncated
+_U64 = struct.Struct("<Q")
+_DOUBLE = struct.Struct("<d")
+
+Record = collections.namedtuple("Record", ["seq", "time", "kind", "data"])
+
+
+class _Ring(object):
+    """ the slots of a mapped file """
+
+    def __init__(self, m, count, seq):
+        self.map = m
+        self.count = count
+        self.seq = seq  # next sequence number
+
+    def append(self, kind, t, data):
+        m = self.map
+        data = data[:SLOT_DATA * min(MAX_SLOTS, self.count)]
+        for i in range(0, max(len(data), 1), SLOT_DATA):
+            chunk = data[i:i + SLOT_DATA]
+            offset = _HEADER_SIZE + (self.seq % self.count) * SLOT_SIZE
+            _SLOT.pack_into(m, offset, self.seq, t, kind if i == 0 else CONTINUED, len(chunk))
+            m[offset + _SLOT.size:offset + _SLOT.size + len(chunk)] = chunk
+            self.seq += 1
+        _U64.pack_into(m, _SEQUENCE_OFFSET, self.seq)
+
+    def records(self, start=None, end=None):
+        """ yields the records in the ring, oldest first, optionally within a time range """
+        m = self.map
+        current = None
+        for seq in range(max(0, self.seq - self.count), self.seq):
+            offset = _HEADER_SIZE + (seq % self.count) * SLOT_SIZE
+            s, t, kind, length = _SLOT.unpack_from(m, offset)
+            if s != seq:
+                current = None  # stale slot, from a record that was never finished
+                continue
+            data = bytes(m[offset + _SLOT.size:offset + _SLOT.size + min(length, SLOT_DATA)])
+            if kind == CONTINUED:
+                if current is not None:
+                    current[3] += data
+                continue
+            if current is not None:
+                yield Record(*current)
+            current = None
+            if (start is None or t >= start) and (end is None or t <= end):
+                current = [seq, t, kind, data]
+        if current is not None:
+            yield Record(*current)
+
+
+def _create(path, count, trigger_time=float("nan")):
+    """ creates and maps an empty ring file """
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, SLOT_SIZE, count, 0, time.time(), trigger_time).ljust(_HEADER_SIZE, b"\x00"))
+        f.truncate(_HEADER_SIZE + count * SLOT_SIZE)
+    f = open(path, "r+b")
+    return f, mmap.mmap(f.fileno(), 0)
+
+
+def _reserve(directory, name, extension):
+    """
+        creates an empty file for a capture, and returns its path. Names
+        already taken (by captures in the same millisecond, or by another
+        recorder) get a -1, -2... suffix
+    """
+    n = 0
+    while True:
+        path = os.path.join(directory, name + ("-%d" % n if n else "") + extension)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return path
+        except FileExistsError:
+            n += 1
+
+
+def encode_sample(name, value):
+    """ the data of a SAMPLE record """
+    name = name.encode("utf-8")[:255]
+    data = bytes(bytearray([len(name)])) + name
+    if value is None:
+        return data + b"n"
+    type_, v = value
+    if type_ == NUMBER:
+        return data + b"d" + _DOUBLE.pack(v)
+    return data + b"j" + json.dumps(v, default=_json_default).encode("utf-8")
+
+
+def decode(record):
+    """
+        returns the content of a record:
+            FRAME:   the raw frame text
+            SAMPLE:  (command name, value), value being a float, a decoded
+                     JSON value, or None
+            TRIGGER: the reason text
+    """
+    data = record.data
+    if record.kind == SAMPLE:
+        n = bytearray(data[:1])[0]
+        name = data[1:1 + n].decode("utf-8")
+        type_ = data[1 + n:2 + n]
+        if type_ == b"d":
+            value = _DOUBLE.unpack_from(data, 2 + n)[0]
+        elif type_ == b"j":
+            try:
+                value = json.loads(data[2 + n:].decode("utf-8"))
+            except ValueError:
+                value = data[2 + n:].decode("utf-8", "replace")  # truncated record
+        else:
+            value = None
+        return name, value
+    return data.decode("utf-8", "replace")
+
+
+class FlightRecorder(object):
+    """
+        Keeps the most recent frames and samples in a ring file of the
+        given size. Instances are callable, and can be used as Async
+        callbacks:
+
+            recorder = FlightRecorder("obd.ring", triggers=[NewDTC(), MILChange()])
+            recorder.watch(connection, [obd.commands.RPM, obd.commands.SPEED])
+
+        Triggers are called with every response, and return a reason
+        (any string) to freeze a capture: the records from `pre` seconds
+        before to `post` seconds after the trigger are written to a new
+        file in capture_dir, once the post window has passed. The ring
+        must be large enough to hold pre + post seconds of records.
+    """
+
+    def __init__(self, path, size=4 * 1024 * 1024, pre=60.0, post=30.0,
+                 triggers=None, capture_dir=None, frames=True):
+        self.path = path
+        self.pre = pre
+        self.post = post
+        self.triggers = list(triggers or [])
+        self.capture_dir = capture_dir or os.path.dirname(os.path.abspath(path))
+        self.frames = frames  # record the raw frames of every response
+        self.captures = []  # paths of the capture files written
+        self.__pending = []  # (trigger time, reason)
+        self.__lock = threading.Lock()
+        self.__start_time = time.time()
+        self.__start = time.monotonic()
+
+        count = max((size - _HEADER_SIZE) // SLOT_SIZE, MAX_SLOTS)
+        self.__file, self.__map, seq = self.__open(path, count)
+        self.__ring = _Ring(self.__map, count, seq)
+
+    def __open(self, path, count):
+        """ reopens an existing ring of the same size, or creates a new one """
+        if os.path.exists(path) and os.path.getsize(path) == _HEADER_SIZE + count * SLOT_SIZE:
+            f = open(path, "r+b")
+            m = mmap.mmap(f.fileno(), 0)
+            magic, slot_size, c, seq, _, _ = _HEADER.unpack_from(m, 0)
+            if magic == MAGIC and slot_size == SLOT_SIZE and c == count:
+                return f, m, seq
+            m.close()
+            f.close()
+        f, m = _create(path, count)
+        return f, m, 0
+
+    def __time(self, response):
+        if response.received_monotonic is not None:
+            return self.__start_time + (response.received_monotonic - self.__start)
+        return response.time
+
+    def __call__(self, response):
+        self.add(response)
+
+    def watch(self, connection, commands=(), force=False):
+        """ watches the given commands, and the commands of the triggers, on an Async connection """
+        commands = list(commands)
+        for trigger in self.triggers:
+            c = getattr(trigger, "command", None)
+            if c is not None and c not in commands:
+                commands.append(c)
+        for c in commands:
+            connection.watch(c, callback=self, force=force)
+
+    def add(self, response):
+        """ records a response, and runs the triggers on it """
+        if response.command is None:
+            return
+        t = self.__time(response)
+
+        reasons = []
+        for trigger in self.triggers:
+            try:
+                reason = trigger(response)
+            except Exception as e:
+                logger.exception("Trigger %r failed: %s" % (trigger, e))
+                continue
+            if reason:
+                reasons.append(reason)
+
+        with self.__lock:
+            if self.__map is None:
+                return
+            if self.frames:
+                for message in response.messages:
+                    for frame in message.frames:
+                        self.__ring.append(FRAME, t, frame.raw.encode("utf-8", "replace"))
+            value = None if response.value is None else _value(response)
+            self.__ring.append(SAMPLE, t, encode_sample(response.command.name, value))
+            for reason in reasons:
+                self.__trigger(reason, t)
+            self.__capture(t)
+
+    def trigger(self, reason="manual"):
+        """ freezes a capture around the current time """
+        with self.__lock:
+            if self.__map is not None:
+                self.__trigger(reason, self.__start_time + (time.monotonic() - self.__start))
+
+    def __trigger(self, reason, t):
+        logger.info("Flight recorder triggered: %s" % reason)
+        self.__ring.append(TRIGGER, t, reason.encode("utf-8"))
+        self.__pending.append((t, reason))
+
+    def __capture(self, now=None):
+        """ writes the captures whose post window has passed (all of them if now is None) """
+        for t, reason in list(self.__pending):
+            if now is not None and now < t + self.post:
+                continue
+            self.__pending.remove((t, reason))
+            path = _reserve(self.capture_dir, "capture-%s-%03d" % (
+                time.strftime("%Y%m%d-%H%M%S", time.localtime(t)), int((t % 1) * 1000)), ".obdflt")
+            records = list(self.__ring.records(t - self.pre, t + self.post))
+            write_capture(path, records, t)
+            self.captures.append(path)
+            logger.info("Flight recorder capture written to %s (%d records)" % (path, len(records)))
+
+    def records(self, start=None, end=None):
+        """ returns the records in the ring, oldest first """
+        with self.__lock:
+            return list(self.__ring.records(start, end))
+
+    def flush(self):
+        """ writes the ring to disk (the OS otherwise writes it back when it chooses) """
+        with self.__lock:
+            if self.__map is not None:
+                self.__map.flush()
+
+    def close(self):
+        """ writes the pending captures, with the post window recorded so far """
+        with self.__lock:
+            if self.__map is None:
+                return
+            self.__capture()
+            self.__map.flush()
+            self.__map.close()
+            self.__map = None
+            self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def write_capture(path, records, trigger_time):
+    """ writes records to a new file, sized to fit them """
+    count = sum([max(1, -(-len(r.data) // SLOT_DATA)) for r in records]) or 1
+    f, m = _create(path, count, trigger_time)
+    try:
+        ring = _Ring(m, count, 0)
+        for r in records:
+            ring.append(r.kind, r.time, r.data)
+        m.flush()
+    finally:
+        m.close()
+        f.close()
+
+
+class FlightLog(object):
+    """
+        Reads a ring file or a capture file:
+
+            with FlightLog("capture-20240101-120000-000.obdflt") as log:
+                log.trigger_time
+                for record in log.records():
+                    decode(record)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            data = f.read(_HEADER_SIZE)
+            if len(data) < _HEADER_SIZE:
+                raise ValueError("%s is not a flight recorder file (too short)" % path)
+            magic, slot_size, count, seq, self.created, self.trigger_time = _HEADER.unpack_from(data)
+            if magic != MAGIC or slot_size != SLOT_SIZE:
+                raise ValueError("%s is not a flight recorder file (bad magic)" % path)
+            if os.path.getsize(path) < _HEADER_SIZE + count * SLOT_SIZE:
+                raise ValueError("%s is truncated" % path)
+            self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__ring = _Ring(self.__map, count, seq)
+
+        if self.trigger_time != self.trigger_time:  # NaN, a ring file
+            self.trigger_time = None
+
+    def records(self, start=None, end=None):
+        """ returns the records, oldest first, optionally within a time range """
+        return list(self.__ring.records(start, end))
+
+    def samples(self, name=None):
+        """ returns (time, command name, value) for the SAMPLE records, optionally of one command """
+        samples = []
+        for r in self.records():
+            if r.kind == SAMPLE:
+                n, value = decode(r)
+                if name is None or n == name:
+                    samples.append((r.time, n, value))
+        return samples
+
+    def close(self):
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class NewDTC(object):
+    """
+        Fires when GET_DTC reports a code it didn't report before. The
+        codes of the first response are taken as the baseline.
+    """
+
+    def __init__(self, command=None):
+        from .commands import commands
+        self.command = command or commands.GET_DTC
+        self.__codes = None
+
+    def __call__(self, response):
+        if response.command != self.command or response.value is None:
+            return None
+        codes = set([c[0] for c in response.value])
+        new = None if self.__codes is None else sorted(codes - self.__codes)
+        self.__codes = codes
+        if new:
+            return "new DTC: %s" % ", ".join(new)
+        return None
+
+
+class MILChange(object):
+    """ fires when the MIL of STATUS turns on or off """
+
+    def __init__(self):
+        from .commands import commands
+        self.command = commands.STATUS
+        self.__mil = None
+
+    def __call__(self, response):
+        if response.command != self.command or response.value is None:
+            return None
+        mil = response.value.MIL
+        changed = self.__mil is not None and mil != self.__mil
+        self.__mil = mil
+        if changed:
+            return "MIL %s" % ("on" if mil else "off")
+        return None
+
+
+class Threshold(object):
+    """
+        Fires when the value of a command goes above `above`, or below
+        `below`. It fires again only after the value has come back.
+    """
+
+    def __init__(self, command, above=None, below=None):
+        self.command = command
+        self.above = above
+        self.below = below
+        self.__active = False
+
+    def __call__(self, response):
+        if response.command != self.command or response.value is None:
+            return None
+        v = response.value
+        v = getattr(v, "magnitude", v)
+        out = (self.above is not None and v > self.above) or \
+              (self.below is not None and v < self.below)
+        fired = out and not self.__active
+        self.__active = out
+        if fired:
+            return "%s = %s" % (self.command.name, v)
+        return None
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# formulas.py                                                          #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+"""
+    Declarative command definitions
+
+    OEM PIDs can be described by data instead of hand-written decoders.
+    Each definition gives the command, and either a Torque-style formula:
+
+        {"name": "BOOST", "description": "Boost pressure", "command": "221940",
+         "formula": "((A*256)+B)/4 - 100", "unit": "kilopascal"}
+
+    or a bit field, read from the data bytes as a big-endian number:
+
+        {"name": "GEAR", "description": "Selected gear", "command": "221A20",
+         "byte": "A", "bit": 4, "length": 4, "signed": false, "scale": 1, "offset": 0}
+
+    In formulas, A to Z are the data bytes following the echo of the
+    command (for 221940: 62 19 40 A B ...), then AA to AZ, BA to BZ...
+    Formulas may use + - * / % & | ^ << >> and parentheses, {A:n} for bit
+    n of A, and Signed(A) for a byte in two's complement. A bit field is
+    the length bits starting at bit (counted from the least significant
+    bit) of the bytes starting at byte, optionally signed, then scaled.
+
+    Definitions are compiled once into decoders: a single lookup in a
+    table of the 256 possible values for the formulas of a single byte,
+    and a generated function for the others. Tables of definitions can
+    be loaded from JSON, CSV or YAML files (the latter needs PyYAML), and
+    registered as commands:
+
+        from obd.formulas import load_definitions
+        obd.commands.add_commands(load_definitions("oem_pids.json"))
+"""
+
+import csv
+import json
+import logging
+import re
+
+from .OBDCommand import OBDCommand
+from .protocols import ECU, ECU_HEADER
+from .UnitsAndScaling import Unit
+from .utils import isHex
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+
+TOKENS = re.compile(r"\s*(?:(0[xX][0-9A-Fa-f]+|\d+\.?\d*|\.\d+)|([A-Za-z_][A-Za-z0-9_]*)|(<<|>>|[-+*/%&|^(){}:]))")
+VARIABLE = re.compile(r"^[A-Z]{1,2}$")
+
+# functions available to formulas, and their translation
+FUNCTIONS = {
+    "SIGNED": "_signed",
+}
+
+NAMESPACE = {
+    "__builtins__": {},
+    "_signed": lambda v: v - 256 if v > 127 else v,
+}
+
+
+def variable_index(name):
+    """ the index of a variable in the data bytes: A = 0 ... Z = 25, AA = 26... """
+    if len(name) == 1:
+        return ord(name) - ord("A")
+    return 26 * (ord(name[0]) - ord("A") + 1) + ord(name[1]) - ord("A")
+
+
+def _tokenize(formula):
+    tokens = []
+    pos = 0
+    formula = formula.rstrip()
+    while pos < len(formula):
+        m = TOKENS.match(formula, pos)
+        if m is None:
+            raise ValueError("Invalid formula %r at %r" % (formula, formula[pos:]))
+        tokens.append(m.group(m.lastindex))
+        pos = m.end()
+    return tokens
+
+
+def translate(formula, data="d", offset=0):
+    """
+        Translates a formula into a Python expression over the data bytes
+        (named data), the first variable being at the given offset.
+        Returns the expression and the set of the variables' indexes.
+    """
+    tokens = _tokenize(formula)
+    out = []
+    used = set()
+
+    def var(name):
+        if not VARIABLE.match(name):
+            raise ValueError("Unknown name %r in formula %r" % (name, formula))
+        index = variable_index(name)
+        used.add(index)
+        return "%s[%d]" % (data, offset + index)
+
+    i = 0
+    while i < len(tokens):
+        t = tokens[i]
+        if t == "{":
+            # {A:n} bit n of A
+            if tokens[i + 2:i + 3] != [":"] or tokens[i + 4:i + 5] != ["}"] or \
+                    not tokens[i + 3].isdigit() or int(tokens[i + 3]) > 7:
+                raise ValueError("Invalid bit in formula %r, expected {A:0} to {A:7}" % formula)
+            out.append("((%s >> %s) & 1)" % (var(tokens[i + 1]), tokens[i + 3]))
+            i += 5
+            continue
+        elif t in ["}", ":"]:
+            raise ValueError("Unexpected %r in formula %r" % (t, formula))
+        elif t[0].isalpha() or t[0] == "_":
+            if tokens[i + 1:i + 2] == ["("]:
+                if t.upper() not in FUNCTIONS:
+                    raise ValueError("Unknown function %r in formula %r" % (t, formula))
+                out.append(FUNCTIONS[t.upper()])
+            else:
+                out.append(var(t))
+        else:
+            out.append(t)
+        i += 1
+
+    # spaced, so that the tokens can't combine (ie: "* *" isn't a power)
+    expression = " ".join(out)
+    try:
+        compile(expression, "<formula>", "eval")
+    except SyntaxError:
+        raise ValueError("Invalid formula %r" % formula)
+    return expression, used
+
+
+def bit_field(byte=0, bit=0, length=8, signed=False, scale=1, offset=0):
+    """ returns the formula of a bit field (see the module's docstring) """
+    if isinstance(byte, str):
+        byte = variable_index(byte)
+    if (length < 1) or (bit < 0):
+        raise ValueError("Invalid bit field: bit %d, length %d" % (bit, length))
+
+    span = (bit + length + 7) // 8
+    names = [_variable_name(byte + i) for i in range(span)]
+    raw = " | ".join(["(%s << %d)" % (n, 8 * (span - 1 - i)) for i, n in enumerate(names)])
+    value = "((%s) >> %d) & %d" % (raw, bit, (1 << length) - 1)
+    if signed:
+        value = "((%s) ^ %d) - %d" % (value, 1 << (length - 1), 1 << (length - 1))
+    if scale != 1:
+        value = "(%s) * %r" % (value, scale)
+    if offset != 0:
+        value = "(%s) + %r" % (value, offset)
+    return value
+
+
+def _variable_name(index):
+    if index < 26:
+        return chr(ord("A") + index)
+    return chr(ord("A") + index // 26 - 1) + chr(ord("A") + index % 26)
+
+
+def compile_formula(formula, skip=2, unit=None):
+    """
+        Compiles a formula into a decoder (taking a list of messages, like
+        the ones of decoders.py). skip is the number of bytes before A, the
+        echo of the command. The values are Quantities of the given unit
+        (a pint unit), or numbers. Data that is too short, or a division
+        by zero, decode to None.
+    """
+    expression, used = translate(formula, "d", skip)
+    needed = skip + max(used) + 1 if used else 0
+    quantity = Unit.Quantity
+
+    if len(used) == 1:
+        # a single byte: look the value up in a table of every possible value
+        (index,) = used
+        f = eval("lambda d: " + translate(formula, "d", -index)[0], dict(NAMESPACE))
+        table = []
+        for x in range(256):
+            try:
+                table.append(f((x,)))
+            except ZeroDivisionError:
+                table.append(None)
+        position = skip + index
+
+        # Quantities are made for each response: they can be modified in place (ito())
+        def decoder(messages):
+            d = messages[0].data
+            if len(d) < needed:
+                return None
+            v = table[d[position]]
+            return v if (unit is None) or (v is None) else quantity(v, unit)
+        return decoder
+
+    f = eval("lambda d: " + expression, dict(NAMESPACE))
+
+    def decoder(messages):
+        d = messages[0].data
+        if len(d) < needed:
+            return None
+        try:
+            v = f(d)
+        except ZeroDivisionError:
+            return None
+        return v if unit is None else quantity(v, unit)
+    return decoder
+
+
+def _ecu(name):
+    if isinstance(name, int):
+        return name
+    name = (name or "ALL").strip().upper()
+    if not hasattr(ECU, name):
+        raise ValueError("Unknown ECU %r" % name)
+    return getattr(ECU, name)
+
+
+def _number(value):
+    """ an int, or a float for numbers with decimals (ie: read from CSV) """
+    if isinstance(value, (int, float)):
+        return value
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def _present(value):
+    return (value is not None) and (value != "")
+
+
+def define(definition):
+    """ compiles a definition (a dict, see the module's docstring) into an OBDCommand """
+    name = str(definition["name"]).strip()
+    if not name.isupper() or not name.replace("_", "").isalnum():
+        raise ValueError("Command names must be upper case identifiers, not %r" % name)
+
+    command = str(definition["command"]).replace(" ", "").upper()
+    if (len(command) < 2) or (len(command) % 2) or not isHex(command):
+        raise ValueError("%s: invalid command %r" % (name, command))
+
+    formula = definition.get("formula")
+    if not _present(formula):
+        byte = definition.get("byte", 0)
+        formula = bit_field(int(byte) if str(byte).isdigit() else str(byte).strip().upper(),
+                            int(definition.get("bit") or 0),
+                            int(definition.get("length") or 8),
+                            str(definition.get("signed")).strip().lower() in ["1", "true", "yes"],
+                            _number(definition.get("scale") or 1),
+                            _number(definition.get("offset") or 0))
+
+    unit = definition.get("unit")
+    unit = Unit.Unit(unit.strip()) if _present(unit) else None
+
+    skip = definition.get("skip")
+    skip = int(skip) if _present(skip) else len(command) // 2
+    try:
+        decoder = compile_formula(str(formula), skip, unit)
+    except ValueError as e:
+        raise ValueError("%s: %s" % (name, e))
+
+    header = definition.get("header")
+    header = str(header).strip().upper().encode() if _present(header) else ECU_HEADER.ENGINE
+
+    return OBDCommand(name,
+                      str(definition.get("description") or ""),
+                      command.encode(),
+                      0,
+                      decoder,
+                      _ecu(definition.get("ecu")),
+                      False,
+                      header)
+
+
+def load_definitions(path):
+    """
+        Loads and compiles the definitions of a JSON, CSV or YAML file,
+        returns the list of OBDCommands. JSON and YAML files hold a list of
+        definitions (or a dict with a "commands" list), CSV files have a
+        column per field:
+
+            name, description, command, formula, unit, header, byte, bit, length, signed, scale, offset
+    """
+    lower = str(path).lower()
+    with open(path, newline="") as f:
+        if lower.endswith(".csv"):
+            definitions = list(csv.DictReader(f, skipinitialspace=True))
+        elif lower.endswith(".yaml") or lower.endswith(".yml"):
+            if yaml is None:
+                raise ImportError("Loading YAML definitions needs PyYAML (pip install pyyaml)")
+            definitions = yaml.safe_load(f)
+        else:
+            definitions = json.load(f)
+
+    if isinstance(definitions, dict):
+        definitions = definitions.get("commands", [])
+    return [define(d) for d in definitions]
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# frame_counts.py                                                      #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FrameCounts(object):
+    """
+        Learns how many frames the car returns for each command, so that
+        the ELM can be told to return as soon as they have all arrived
+        (rather than waiting for its timeout).
+
+        Counts are keyed by (command, header, protocol), and are only
+        learned from complete responses: requests sent without a count,
+        where every message was parsed. Each later response is checked
+        against the learned frame count and set of responding ECUs. A
+        mismatch (missing ECUs, truncated multi-frame messages, errors)
+        drops the entry, and the count is learned again on the next query.
+        Entries are also re-verified after a number of consecutive hits,
+        since an ECU that was missing during learning can't be detected
+        while the ELM is stopping early.
+    """
+
+    MAX_COUNT = 0xF  # the ELM takes a single hex digit
+
+    def __init__(self, verify_every=100):
+        self.verify_every = verify_every  # hits before a count is re-verified, None = never
+        self.__entries = {}  # key = (command, header, protocol), value = _Entry
+
+        self.hits = 0  # responses that matched the learned count
+        self.misses = 0  # responses that didn't, causing the count to be learned again
+        self.learned = 0  # number of times a count was learned
+        self.relearned = 0  # number of times a verification learned a different count
+
+    def get(self, key):
+        """ returns the learned frame count for the given key, or None """
+        entry = self.__entries.get(key)
+
+        if (entry is None) or (entry.count > self.MAX_COUNT):
+            return None
+
+        if (self.verify_every is not None) and (entry.hits >= self.verify_every):
+            entry.verifying = True
+            return None  # send this one without a count
+
+        return entry.count
+
+    def observe(self, key, messages, count):
+        """
+            Updates the model with the messages returned for the given key.
+            count is the frame count that was sent with the request, or None.
+        """
+        messages = messages or []
+        parsed = [m for m in messages if m.parsed()]
+        complete = bool(messages) and (len(parsed) == len(messages))
+
+        frames = sum([len(m.frames) for m in parsed])
+        ecus = frozenset([m.tx_id for m in parsed])
+
+        entry = self.__entries.get(key)
+
+        if count is None:
+            if not complete:
+                return  # errors or NO DATA, nothing to learn from
+
+            if entry is None:
+                self.learned += 1
+                self.__entries[key] = _Entry(frames, ecus)
+            elif entry.verifying:
+                if (entry.count, entry.ecus) != (frames, ecus):
+                    logger.debug("Frame count for %s changed from %d to %d" % (str(key[0]), entry.count, frames))
+                    self.relearned += 1
+                self.__entries[key] = _Entry(frames, ecus)
+
+        elif (entry is not None) and complete and (entry.count == frames) and (entry.ecus == ecus):
+            self.hits += 1
+            entry.hits += 1
+
+        else:
+            logger.debug("Frame count mismatch for %s, learning it again" % str(key[0]))
+            self.misses += 1
+            self.__entries.pop(key, None)
+
+    def forget(self, key=None):
+        """ drops the learned count for the given key, or for every key when None """
+        if key is None:
+            self.__entries = {}
+        else:
+            self.__entries.pop(key, None)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def stats(self):
+        """ returns a dict of the hit and miss counters """
+        return {
+            "entries": len(self.__entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "learned": self.learned,
+            "relearned": self.relearned,
+        }
+
+
+class _Entry(object):
+    """ the learned frame count and responders for a single key """
+
+    def __init__(self, count, ecus):
+        self.count = count
+        self.ecus = ecus
+        self.hits = 0
+        self.verifying = False
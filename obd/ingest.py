@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# ingest.py                                                            #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+"""
+    Offline ingestion of recorded transcripts (see obd/recording.py):
+    replays the adapter's answers through the same protocol parsers and
+    command decoders as a live connection, and writes one trip log (see
+    obd/triplog.py) per vehicle.
+
+    Transcripts are parsed in a pool of processes, and handed out to it
+    in chunks. The parent process only appends the decoded columns to
+    the trip logs, in the order of the transcripts' paths.
+
+        python -m obd.ingest uploads/ -o trips/
+
+    Each directory in a source directory is a vehicle (its transcripts can
+    be in any subdirectory), transcripts at the top of a source directory
+    belong to a vehicle named after it.
+"""
+
+import array
+import collections
+import logging
+import multiprocessing
+import os
+import time
+
+from .commands import commands
+from .elm327 import ELM327
+from .recording import read_records, transactions
+from .triplog import TripLogWriter, _value, NUMBER
+
+logger = logging.getLogger(__name__)
+
+EXTENSION = ".obdrec"
+
+FileResult = collections.namedtuple("FileResult", ["path", "columns", "requests", "samples", "unparsed", "error"])
+
+
+def _lines(reads):
+    return ELM327.split_lines(bytearray(b"".join([r.data for r in reads])))
+
+
+def parse_transcript(path, protocol=None):
+    """
+        Replays a transcript through the protocol parsers and decoders.
+        The protocol is followed through the transcript's ATSP/ATTP/ATDPN
+        commands, unless one is given (a protocol ID, "1" through "A").
+
+        Returns a FileResult, whose columns are a dict of
+        (type, unit, times, values), keyed by command name.
+    """
+    try:
+        start_time, records = read_records(path)
+    except (IOError, OSError, ValueError) as e:
+        return FileResult(path, {}, 0, 0, 0, str(e))
+
+    protocol_id = protocol
+    parser = None
+    r0100 = []
+    previous = None  # request repeated by an empty command
+    samples = collections.OrderedDict()  # key = command name, value = (times, responses)
+    stats = [0, 0, 0]  # requests, samples, unparsed
+
+    for write, reads in transactions(records):
+        if write is None or not reads:
+            continue
+        request = write.data.strip().upper().replace(b" ", b"")
+        if not request:
+            request = previous
+        previous = request
+        if not request:
+            continue
+
+        if request.startswith(b"AT"):
+            if protocol is None and request[:4] in (b"ATTP", b"ATSP") and request[4:] != b"0":
+                protocol_id, parser = request[4:].decode(), None
+            elif protocol is None and request == b"ATDPN":
+                lines = _lines(reads)
+                if lines:
+                    p = lines[0]
+                    protocol_id, parser = (p[1:] if len(p) > 1 and p.startswith("A") else p), None
+            continue
+
+        stats[0] += 1
+        lines = _lines(reads)
+        if request == b"0100":
+            r0100 = lines
+
+        command = commands.for_request(request)
+        if command is None and len(request) % 2:
+            command = commands.for_request(request[:-1])  # with the number of frames to wait for
+        if command is None:
+            stats[2] += 1
+            continue
+
+        if parser is None:
+            if protocol_id not in ELM327._SUPPORTED_PROTOCOLS:
+                stats[2] += 1
+                continue
+            parser = ELM327._SUPPORTED_PROTOCOLS[protocol_id](r0100)
+
+        response = command(parser(lines))
+        t = start_time + reads[-1].time
+        if command.name not in samples:
+            samples[command.name] = ([], [])
+        times, responses = samples[command.name]
+        times.append(t)
+        responses.append(response)
+        stats[1] += 1
+
+    return FileResult(path, _columns(samples), stats[0], stats[1], stats[2], None)
+
+
+def _columns(samples):
+    """
+        turns the responses of each command into a column, the same way
+        TripLogWriter.add() does: the first value decides the column's
+        type, null values are NaN in NUMBER columns and left out of JSON columns
+    """
+    columns = {}
+    for name, (times, responses) in samples.items():
+        first = next((r for r in responses if r.value is not None), None)
+        if first is None:
+            continue
+        type_, _ = _value(first)
+        unit = str(first.value.u) if type_ == NUMBER and hasattr(first.value, "u") else ""
+
+        if type_ == NUMBER:
+            values = array.array("d")
+            for r in responses:
+                t, v = _value(r) if r.value is not None else (None, None)
+                values.append(v if t == NUMBER else float("nan"))
+            columns[name] = (type_, unit, array.array("d", times), values)
+        else:
+            kept = [(t, r.value) for t, r in zip(times, responses) if r.value is not None]
+            columns[name] = (type_, unit, array.array("d", [k[0] for k in kept]), [k[1] for k in kept])
+    return columns
+
+
+def _parse(task):
+    path, protocol = task
+    return parse_transcript(path, protocol)
+
+
+def find_transcripts(sources, extension=EXTENSION):
+    """
+        returns a list of (vehicle, path), sorted by vehicle and path.
+        Sources are directories (see the module docstring), or transcripts.
+    """
+    found = []
+    for source in sources:
+        source = os.path.abspath(source)
+        if os.path.isfile(source):
+            found.append((os.path.splitext(os.path.basename(source))[0], source))
+            continue
+        for directory, _, files in os.walk(source):
+            relative = os.path.relpath(directory, source)
+            vehicle = os.path.basename(source) if relative == "." else relative.split(os.sep)[0]
+            for f in files:
+                if f.endswith(extension):
+                    found.append((vehicle, os.path.join(directory, f)))
+    return sorted(found)
+
+
+def ingest(sources, output_dir, workers=None, chunksize=None, protocol=None, extension=EXTENSION):
+    """
+        Parses every transcript found in the sources, and writes one trip
+        log per vehicle (<output_dir>/<vehicle>.obdtrip), replacing
+        existing ones. workers=1 parses in this process.
+
+        Returns a dict of per-vehicle summaries, keyed by vehicle:
+        {"path", "files", "requests", "samples", "unparsed", "errors"}
+    """
+    found = find_transcripts(sources, extension)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    workers = workers or os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, len(found) // (workers * 4))
+
+    vehicles = dict((path, vehicle) for vehicle, path in found)
+    tasks = [(path, protocol) for _, path in found]
+    summaries = collections.OrderedDict()
+    writer = None
+    start = time.monotonic()
+
+    pool = multiprocessing.Pool(workers) if workers > 1 and len(tasks) > 1 else None
+    try:
+        results = pool.imap(_parse, tasks, chunksize) if pool is not None else map(_parse, tasks)
+        for result in results:
+            vehicle = vehicles[result.path]
+            summary = summaries.get(vehicle)
+            if summary is None:
+                if writer is not None:
+                    writer.close()  # results come in order, the previous vehicle is done
+                path = os.path.join(output_dir, vehicle + ".obdtrip")
+                writer = TripLogWriter(path)
+                summary = summaries[vehicle] = dict(path=path, files=0, requests=0, samples=0, unparsed=0, errors=0)
+
+            summary["files"] += 1
+            summary["requests"] += result.requests
+            summary["samples"] += result.samples
+            summary["unparsed"] += result.unparsed
+            if result.error is not None:
+                logger.error("Failed to read %s: %s" % (result.path, result.error))
+                summary["errors"] += 1
+                continue
+
+            for name, (type_, unit, times, values) in result.columns.items():
+                try:
+                    writer.extend(name, times, values, type_, unit)
+                except ValueError as e:
+                    logger.error("%s: %s" % (result.path, e))
+                    summary["errors"] += 1
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if writer is not None:
+            writer.close()
+
+    logger.info("Ingested %d transcripts of %d vehicles in %.1f s" %
+                (len(found), len(summaries), time.monotonic() - start))
+    return summaries
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m obd.ingest",
+                                     description="Decodes recorded transcripts into one trip log per vehicle")
+    parser.add_argument("sources", nargs="+", help="directories of vehicles, or transcripts")
+    parser.add_argument("-o", "--output", required=True, help="directory of the trip logs")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of processes (default: one per CPU)")
+    parser.add_argument("--chunksize", type=int, default=None, help="transcripts handed to a process at a time")
+    parser.add_argument("--protocol", default=None,
+                        help="protocol of every transcript, 1 through A (default: as recorded)")
+    parser.add_argument("--extension", default=EXTENSION, help="extension of the transcripts (default: %s)" % EXTENSION)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    summaries = ingest(args.sources, args.output, args.workers, args.chunksize,
+                       args.protocol and args.protocol.upper(), args.extension)
+    for vehicle, s in summaries.items():
+        print("%s: %d files, %d samples, %d unparsed requests, %d errors -> %s" %
+              (vehicle, s["files"], s["samples"], s["unparsed"], s["errors"], s["path"]))
+
+
+if __name__ == "__main__":
+    main()
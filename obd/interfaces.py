@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# interfaces.py                                                        #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+"""
+    The interfaces OBD can drive. Port strings are handed to an ELM327
+    (any serial port, or pyserial URL), unless their scheme names a
+    native transport:
+
+        obd.OBD("/dev/ttyUSB0")        # ELM327
+        obd.OBD("socket://host:35000") # ELM327, through pyserial's URL handlers
+        obd.OBD("socketcan://can0")    # SocketCAN, see obd/socketcan.py
+
+    A native transport provides the methods of ELM327 that OBD uses:
+    status(), ecus(), protocol_name(), protocol_id(), port_name(),
+    baudrate(), send_and_parse(), timestamps(), low_power(),
+    normal_power() and close(). send_and_parse() receives what OBD would
+    send to an ELM327 ("AT SH 7E0", "AT CRA 7E8", "AT AR", OBD requests
+    optionally followed by the number of frames to wait for, or an empty
+    string to repeat the previous request), and returns the parsed
+    Messages. NativeInterface implements them, on top of a _request()
+    that sends a request payload and returns the answer as the ELM's
+    header-on lines.
+"""
+
+import logging
+from binascii import unhexlify
+
+from .elm327 import ELM327
+from .utils import OBDStatus, isHex
+
+logger = logging.getLogger(__name__)
+
+_interfaces = {}  # key = URL scheme, value = interface class
+
+
+def register_interface(scheme, cls):
+    """ makes OBD use the given class for port strings starting with "<scheme>://" """
+    _interfaces[scheme] = cls
+
+
+def interface_class(portstr):
+    """ returns the interface class for a port string """
+    if portstr and "://" in portstr:
+        return _interfaces.get(portstr.split("://", 1)[0], ELM327)
+    return ELM327
+
+
+class NativeInterface(object):
+    """
+        Base class of the transports that reach the car without an
+        ELM327. Subclasses open their connection, set self._protocol and
+        self._status, and implement:
+
+            _request(payload, count, trace): sends a request (bytearray),
+                returns the lines of the answer, formatted like the ELM's
+                with headers on. count is the number of frames to wait
+                for, if known. Marks the write_start, write_flushed,
+                first_byte and prompt stages of the trace, if any, and
+                sets self._sent and self._received
+            _target(header): returns the request target of an 'AT SH'
+                header (None for functional), or raises ValueError
+            _close(): closes the connection
+    """
+
+    def __init__(self, portname, timeout):
+        self._status = OBDStatus.NOT_CONNECTED
+        self._portname = portname
+        self._protocol = None
+        self._target_address = None  # given by _target(), None = functional
+        self._rx_filter = None  # 'AT CRA' pattern, None = any ECU
+        self._sent = (None, None)  # (monotonic, wall clock) time of the last request
+        self._received = (None, None)  # (monotonic, wall clock) time of the last response
+        self.__last = b""  # previous request, repeated by an empty command
+        self.timeout = timeout
+
+    def _request(self, payload, count=None, trace=None):
+        raise NotImplementedError()
+
+    def _target(self, header):
+        raise NotImplementedError()
+
+    def _close(self):
+        pass
+
+    def _version(self):
+        """ the answer to ATI """
+        return self.__class__.__name__
+
+    def _accepts(self, header):
+        """ applies the 'AT CRA' pattern to the header (hex string) of a received frame """
+        f = self._rx_filter
+        if f is None:
+            return True
+        return len(f) == len(header) and all([a == "X" or a == b for a, b in zip(f, header)])
+
+    def __at(self, cmd):
+        """ the AT commands that OBD sends, returns the lines of the answer """
+        if cmd.startswith(b"SH"):
+            try:
+                self._target_address = self._target(cmd[2:].decode())
+            except ValueError:
+                return ["?"]
+            return ["OK"]
+        elif cmd.startswith(b"CRA"):
+            self._rx_filter = cmd[3:].decode().upper() or None
+            return ["OK"]
+        elif cmd == b"AR":
+            self._rx_filter = None
+            return ["OK"]
+        elif cmd == b"I":
+            return [self._version()]
+        return ["?"]
+
+    def send_and_parse(self, cmd, trace=None):
+        """
+            send() function used to service all OBDCommands
+
+            Takes the commands OBD would send to an ELM327, and returns
+            a list of Message objects
+        """
+
+        if self._status != OBDStatus.CAR_CONNECTED:
+            logger.info("cannot send_and_parse() when unconnected")
+            return None
+
+        cmd = cmd.replace(b" ", b"").upper() or self.__last
+
+        if cmd.startswith(b"AT"):
+            lines = self.__at(cmd[2:])
+        elif not cmd or not isHex(cmd.decode()):
+            lines = ["?"]
+        else:
+            self.__last = cmd
+            count = None
+            if len(cmd) % 2:
+                count = int(cmd[-1:], 16)  # the number of frames to wait for
+                cmd = cmd[:-1]
+            lines = self._request(bytearray(unhexlify(cmd)), count, trace)
+
+        messages = self._protocol(lines)
+        if trace is not None:
+            trace.mark("parsed")
+        return messages
+
+    def timestamps(self):
+        """
+            returns the (monotonic, wall clock) times at which the last
+            request was sent, and its last response received:
+            (sent, sent_wall, received, received_wall). None when unknown.
+        """
+        return self._sent + self._received
+
+    def status(self):
+        return self._status
+
+    def ecus(self):
+        return self._protocol.ecu_map.values() if self._protocol else []
+
+    def protocol_name(self):
+        return self._protocol.ELM_NAME if self._protocol else ""
+
+    def protocol_id(self):
+        return self._protocol.ELM_ID if self._protocol else ""
+
+    def port_name(self):
+        return self._portname
+
+    def baudrate(self):
+        return None
+
+    def low_power(self):
+        """ there's no adapter to put to sleep """
+        return []
+
+    def normal_power(self):
+        return []
+
+    def close(self):
+        self._status = OBDStatus.NOT_CONNECTED
+        self._protocol = None
+        self._close()
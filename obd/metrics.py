@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# metrics.py                                                           #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+import bisect
+
+
+class Stats(object):
+    """
+        Running summary (count, total, min, max, last) of a series of
+        samples. Used for the durations and counters reported by the
+        connection objects.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.last = None
+
+    def add(self, value):
+        """ records a new sample """
+        self.count += 1
+        self.total += value
+        self.last = value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "last": self.last,
+            "mean": self.mean,
+        }
+
+    def __str__(self):
+        if self.count == 0:
+            return "count=0"
+        return "count=%d total=%.6f min=%.6f max=%.6f mean=%.6f" % \
+               (self.count, self.total, self.min, self.max, self.mean)
+
+
+class Histogram(object):
+    """
+        Distribution of a series of durations (in seconds), counted in
+        fixed buckets. counts[i] is the number of samples no greater than
+        buckets[i] (and greater than the previous bucket), the last count
+        is for the samples above every bucket.
+    """
+
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+               0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(sorted(buckets or self.BUCKETS))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.stats = Stats()
+
+    def add(self, value):
+        """ records a new sample """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.stats.add(value)
+
+    @property
+    def count(self):
+        return self.stats.count
+
+    def quantile(self, q):
+        """
+            returns an upper bound of the given quantile (0.0 to 1.0): the
+            first bucket holding it, or the largest sample when it's above
+            every bucket. None when empty.
+        """
+        if self.stats.count == 0:
+            return None
+
+        rank = q * self.stats.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if (seen > 0) and (seen >= rank):
+                return min(bound, self.stats.max)
+        return self.stats.max
+
+    def cumulative(self):
+        """ returns a list of (upper bound, number of samples <= bound), ending with infinity """
+        result = []
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            result.append((bound, seen))
+        return result
+
+    def as_dict(self):
+        d = self.stats.as_dict()
+        d["p50"] = self.quantile(0.5)
+        d["p90"] = self.quantile(0.9)
+        d["p99"] = self.quantile(0.99)
+        return d
+
+    def __str__(self):
+        if self.stats.count == 0:
+            return "count=0"
+        return "count=%d mean=%.6f p50<=%.6f p90<=%.6f max=%.6f" % \
+               (self.stats.count, self.stats.mean, self.quantile(0.5),
+                self.quantile(0.9), self.stats.max)
@@ -32,17 +32,69 @@
 
 
 import logging
+import threading
+import time
 
 from .OBDResponse import OBDResponse
 from .__version__ import __version__
+from .cache import ResponseCache
 from .commands import commands
 from .elm327 import ELM327
+from .frame_counts import FrameCounts
+from .interfaces import interface_class
+from .metrics import Stats
 from .protocols import ECU_HEADER
-from .utils import scan_serial, OBDStatus
+from .supervisor import Supervisor
+from .tracing import QueryTrace, Tracer
+from .utils import scan_serial, BitArray, OBDStatus
 
 logger = logging.getLogger(__name__)
 
 
+def stamp_response(r, interface):
+    """ copies the send and receive times of the interface's last command onto a response """
+    sent, sent_wall, received, received_wall = interface.timestamps()
+    r.sent_monotonic = sent
+    r.sent_time = sent_wall
+    r.received_monotonic = received
+    r.received_time = received_wall
+    if received_wall is not None:
+        r.time = received_wall
+    return r
+
+
+def group_by_header(cmds, header_of, current):
+    """
+        Orders commands so that commands sharing an ECU header (given by
+        header_of(cmd)) are sent back to back. The group for the current
+        header goes first. Otherwise, groups are ordered by their first
+        appearance, and the order within a group is kept.
+    """
+    groups = {}
+    for c in cmds:
+        groups.setdefault(header_of(c), []).append(c)
+
+    ordered = groups.pop(current, [])
+    for group in groups.values():
+        ordered += group
+    return ordered
+
+
+class _Flight(object):
+    """ a request on the bus, which concurrent identical requests wait for """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
 class OBD(object):
     """
         Class representing an OBD-II connection
@@ -50,14 +102,33 @@ class OBD(object):
     """
 
     def __init__(self, portstr=None, baudrate=None, protocol=None, fast=True,
-                 timeout=0.1, check_voltage=True, start_low_power=False):
+                 timeout=0.1, check_voltage=True, start_low_power=False,
+                 reconnect=False, physical_addressing=False, cache=False,
+                 trace=False):
         self.interface = None
+        self.__bus_lock = threading.RLock()  # serializes access to the adapter
+        self.__flights_lock = threading.Lock()
+        self.__flights = {}  # key = (OBDCommand, force), value = _Flight of the request on the bus
+        self.coalesced = 0  # number of queries that were answered by an identical concurrent query
         self.supported_commands = set(commands.base_commands())
         self.fast = fast  # global switch for disabling optimizations
         self.timeout = timeout
         self.__last_command = b""  # used for running the previous command with a CR
         self.__last_header = ECU_HEADER.ENGINE  # for comparing with the previously used header
-        self.__frame_counts = {}  # keeps track of the number of return frames for each command
+        self.frame_counts = FrameCounts()  # learns the number of return frames for each command
+        self.__check_voltage = check_voltage
+        self.__start_low_power = start_low_power
+        self.__session = None  # (port, baudrate, protocol) of the last successful connection, used by resume()
+        self.supervisor = Supervisor(self) if reconnect else None
+        self.cache = ResponseCache() if cache else None  # serves static and slow-changing commands
+        self.header_switches = Stats()  # time spent (seconds) on each 'AT SH' round trip
+        self.tracer = Tracer() if trace else None  # per-stage latency histograms of the queries
+        self.physical_addressing = physical_addressing  # send to the single ECU known to answer, when possible
+        self.ecu_supported_commands = {}  # key = tx_id of the ECU, value = set of commands it supports
+        self.__ecu_flags = {}  # key = tx_id, value = ECU flag given by the protocol
+        self.__physical_targets = {}  # key = OBDCommand, value = (header, receive filter)
+        self.__functional_header = None  # broadcast header for the remaining commands, once the targets are mapped
+        self.__last_rx_filter = None  # CAN receive address set with 'AT CRA', None = automatic
 
         logger.info("======================= python-OBD (v%s) =======================" % __version__)
         self.__connect(portstr, baudrate, protocol,
@@ -68,7 +139,8 @@ class OBD(object):
     def __connect(self, portstr, baudrate, protocol, check_voltage,
                   start_low_power):
         """
-            Attempts to instantiate an ELM327 connection object.
+            Attempts to instantiate an ELM327 connection object (or the
+            native interface named by the port's scheme, see interfaces.py).
         """
 
         if portstr is None:
@@ -90,14 +162,73 @@ class OBD(object):
                     break  # success! stop searching for serial
         else:
             logger.info("Explicit port defined")
-            self.interface = ELM327(portstr, baudrate, protocol,
-                                    self.timeout, check_voltage,
-                                    start_low_power)
+            self.interface = interface_class(portstr)(portstr, baudrate, protocol,
+                                                      self.timeout, check_voltage,
+                                                      start_low_power)
 
         # if the connection failed, close it
         if self.interface.status() == OBDStatus.NOT_CONNECTED:
             # the ELM327 class will report its own errors
             self.close()
+        else:
+            self.__save_session()
+
+    def __save_session(self):
+        """ remember the negotiated port settings, so that resume() can skip the detection steps """
+        if self.status() == OBDStatus.CAR_CONNECTED:
+            self.__session = (self.interface.port_name(),
+                              self.interface.baudrate(),
+                              self.interface.protocol_id())
+
+    def resume(self):
+        """
+            Re-opens a dropped connection using the port, baudrate and
+            protocol of the previous session. Unlike a fresh OBD() this
+            skips the port scan, the baudrate and protocol detection, and
+            the supported command discovery. The ECU header that was in
+            use is restored.
+
+            Returns a boolean for whether the car is connected again.
+        """
+
+        with self.__bus_lock:
+            return self.__resume()
+
+    def __resume(self):
+        if self.__session is None:
+            logger.warning("Cannot resume: no previous session to restore")
+            return False
+
+        portstr, baudrate, protocol = self.__session
+        logger.info("Resuming connection: PORT=%s BAUD=%s PROTOCOL=%s" % (portstr, baudrate, protocol))
+
+        # drop whatever is left of the old interface
+        if self.interface is not None:
+            self.interface.close()
+
+        self.interface = interface_class(portstr)(portstr, baudrate, protocol,
+                                                  self.timeout, self.__check_voltage,
+                                                  self.__start_low_power)
+
+        if self.status() != OBDStatus.CAR_CONNECTED:
+            return False
+
+        # the ELM was reset, so forget the adapter state we were tracking
+        header = self.__last_header
+        rx_filter = self.__last_rx_filter
+        self.__last_header = ECU_HEADER.ENGINE
+        self.__last_rx_filter = None
+        self.__last_command = b""
+
+        if header is not None:
+            self.__set_header(header)
+        self.__set_receive_filter(rx_filter)
+
+        # this may not even be the same car
+        if self.cache is not None:
+            self.cache.invalidate()
+
+        return True
 
     def __load_commands(self):
         """
@@ -117,9 +248,11 @@ class OBD(object):
             if not self.test_cmd(get, warn=False):
                 continue
 
-            # when querying, only use the blocking OBD.query()
+            # when querying, don't use query()
             # prevents problems when query is redefined in a subclass (like Async)
-            response = OBD.query(self, get)
+            messages = self.__send_query(get)
+            self.__learn_ecu_support(get, messages)
+            response = get(messages) if messages else OBDResponse()
 
             if response.is_null():
                 logger.info("No valid data for PID listing command: %s" % get)
@@ -141,10 +274,103 @@ class OBD(object):
 
         logger.info("finished querying with %d commands supported" % len(self.supported_commands))
 
+        if self.physical_addressing:
+            self.__map_physical_targets()
+
+    def __learn_ecu_support(self, get, messages):
+        """
+            Records which ECUs reported support for each PID, using the
+            raw (unfiltered) messages of a PID listing command.
+        """
+        for m in (messages or []):
+            if not m.parsed() or m.tx_id is None:
+                continue
+
+            self.__ecu_flags[m.tx_id] = m.ecu
+            supported = self.ecu_supported_commands.setdefault(m.tx_id, set())
+
+            # same decoding as the pid() decoder, without any padding of the data
+            data = m.data[:get.bytes] if get.bytes > 0 else m.data
+            for i, bit in enumerate(BitArray(data[2:])):
+                if bit:
+                    mode = get.mode
+                    pid = get.pid + i + 1
+                    if commands.has_pid(mode, pid):
+                        supported.add(commands[mode][pid])
+
+    def __map_physical_targets(self):
+        """
+            For every supported command that exactly one (matching) ECU
+            answers, work out the physical request header and the CAN
+            receive address of that ECU. Those commands are then sent
+            directly to the ECU, and the adapter stops listening for
+            other responders.
+        """
+        protocol_id = self.protocol_id()
+        if protocol_id not in ["6", "7", "8", "9"]:
+            logger.info("Physical addressing is only supported over the ISO 15765-4 CAN protocols")
+            return
+
+        id_bits = 11 if protocol_id in ["6", "8"] else 29
+        self.__functional_header = b"7DF" if id_bits == 11 else b"DB33F1"
+
+        self.__physical_targets = {}
+        for c in self.supported_commands:
+            if c.header != ECU_HEADER.ENGINE:
+                continue  # the user picked a header, leave it alone
+
+            tx_ids = [tx_id for tx_id, supported in self.ecu_supported_commands.items()
+                      if (c in supported) and (c.ecu & self.__ecu_flags[tx_id])]
+
+            if len(tx_ids) == 1:
+                self.__physical_targets[c] = self.__physical_address(tx_ids[0], id_bits)
+
+        # the header we're tracking no longer matches what the adapter uses (functional),
+        # so make sure that the first physical request really sets it
+        self.__last_header = None
+
+        logger.info("Using physical addressing for %d commands" % len(self.__physical_targets))
+
+    @staticmethod
+    def __physical_address(tx_id, id_bits):
+        """ returns the (request header, receive address) pair for the given ECU """
+        if id_bits == 11:
+            # 7E8 -> 7EF respond to requests on 7E0 -> 7E7
+            return (("%03X" % (0x7E0 + tx_id)).encode(),
+                    ("%03X" % (0x7E8 + tx_id)).encode())
+        else:
+            # 18 DA <target> F1 for requests, 18 DA F1 <source> for responses
+            # (the ELM takes the priority byte from 'AT CP', which defaults to 18)
+            return (("DA%02XF1" % tx_id).encode(),
+                    ("18DAF1%02X" % tx_id).encode())
+
+    def __addressing(self, cmd):
+        """ returns the (header, receive filter) pair to be used for the given command """
+        if self.physical_addressing and (self.__functional_header is not None):
+            if cmd in self.__physical_targets:
+                return self.__physical_targets[cmd]
+            elif cmd.header == ECU_HEADER.ENGINE:
+                # commands that several (or unknown) ECUs answer are broadcast
+                return (self.__functional_header, None)
+        return (cmd.header, None)
+
+    def __set_receive_filter(self, rx_filter):
+        """ sets the CAN receive address ('AT CRA'), or returns to automatic receive ('AT AR') for None """
+        if rx_filter == self.__last_rx_filter:
+            return
+        at = b'AT CRA ' + rx_filter if rx_filter is not None else b'AT AR'
+        r = self.interface.send_and_parse(at)
+        if not r or "\n".join([m.raw() for m in r]) != "OK":
+            logger.info("Receive filter ('%s') did not return 'OK'", at)
+            return
+        self.__last_rx_filter = rx_filter
+
     def __set_header(self, header):
         if header == self.__last_header:
             return
+        start = time.monotonic()
         r = self.interface.send_and_parse(b'AT SH ' + header + b' ')
+        self.header_switches.add(time.monotonic() - start)
         if not r:
             logger.info("Set Header ('AT SH %s') did not return data", header)
             return OBDResponse()
@@ -153,18 +379,43 @@ class OBD(object):
             return OBDResponse()
         self.__last_header = header
 
+    @property
+    def header(self):
+        """ the ECU header set on the adapter (ECU_HEADER.ENGINE is the adapter's default) """
+        return self.__last_header
+
+    def forget_adapter_state(self, header=None):
+        """
+            Forgets the last command sent to the adapter, for when something
+            else has been talking to it (see FleetPoller). The next query
+            sends its command in full. header is the ECU header left set on
+            the adapter, None if unknown (the next query sets it again).
+        """
+        with self.__bus_lock:
+            self.__last_header = header
+            self.__last_command = b""
+
+    def exclusive(self):
+        """
+            Returns a context manager keeping the adapter for the calling
+            thread: queries from other threads wait until it exits (see
+            DynamicDIDs.define()). The calling thread's own queries go through.
+        """
+        return self.__bus_lock
+
     def close(self):
         """
             Closes the connection, and clears supported_commands
         """
 
-        self.supported_commands = set()
-
-        if self.interface is not None:
-            logger.info("Closing connection")
-            self.__set_header(ECU_HEADER.ENGINE)
-            self.interface.close()
-            self.interface = None
+        with self.__bus_lock:
+            self.supported_commands = set()
+            self.__session = None  # an explicit close shouldn't be undone by the supervisor
+            if self.interface is not None:
+                logger.info("Closing connection")
+                self.__set_header(ECU_HEADER.ENGINE)
+                self.interface.close()
+                self.interface = None
 
     def status(self):
         """ returns the OBD connection status """
@@ -175,17 +426,21 @@ class OBD(object):
 
     def low_power(self):
         """ Enter low power mode """
-        if self.interface is None:
-            return OBDStatus.NOT_CONNECTED
-        else:
-            return self.interface.low_power()
+        with self.__bus_lock:
+            if self.interface is None:
+                return OBDStatus.NOT_CONNECTED
+            else:
+                self.__last_command = b""  # a lone CR would now repeat AT LP
+                return self.interface.low_power()
 
     def normal_power(self):
         """ Exit low power mode """
-        if self.interface is None:
-            return OBDStatus.NOT_CONNECTED
-        else:
-            return self.interface.normal_power()
+        with self.__bus_lock:
+            if self.interface is None:
+                return OBDStatus.NOT_CONNECTED
+            else:
+                self.__last_command = b""  # nothing to repeat once the ELM wakes
+                return self.interface.normal_power()
 
     # not sure how useful this would be
 
@@ -264,21 +519,104 @@ class OBD(object):
         """
             primary API function. Sends commands to the car, and
             protects against sending unsupported commands.
+
+            Safe to call from several threads: requests take turns on
+            the adapter, and identical concurrent requests are coalesced
+            into a single transaction, whose response is returned to
+            every caller.
         """
 
+        # cached answers don't wait for the bus, only misses queue for it
+        if (self.cache is not None) and (self.status() != OBDStatus.NOT_CONNECTED) and \
+                (force or self.test_cmd(cmd, warn=False)):
+            r = self.cache.get(cmd)
+            if r is not None:
+                return r
+
+        key = (cmd, force)
+
+        with self.__flights_lock:
+            flight = self.__flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.__flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return flight.wait()
+
+        try:
+            with self.__bus_lock:
+                flight.response = self.__query(cmd, force)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.__flights_lock:
+                del self.__flights[key]
+            flight.done.set()
+
+        return flight.response
+
+    def __query(self, cmd, force):
+        """ query() for a single caller, with the bus lock held """
+
         if self.status() == OBDStatus.NOT_CONNECTED:
-            logger.warning("Query failed, no connection available")
-            return OBDResponse()
+            if (self.supervisor is None) or not self.supervisor.recover():
+                logger.warning("Query failed, no connection available")
+                return OBDResponse()
 
         # if the user forces, skip all checks
         if not force and not self.test_cmd(cmd):
             return OBDResponse()
 
-        self.__set_header(cmd.header)
+        trace = QueryTrace(cmd) if self.tracer is not None else None
+        messages = self.__send_query(cmd, trace)
 
-        logger.info("Sending command: %s" % str(cmd))
-        cmd_string = self.__build_command_string(cmd)
-        messages = self.interface.send_and_parse(cmd_string)
+        # clearing the DTCs resets most of the car's diagnostic state
+        if (self.cache is not None) and (cmd == commands.CLEAR_DTC):
+            self.cache.invalidate()
+
+        if not messages:
+            logger.info("No valid OBD Messages returned")
+            if trace is not None:
+                self.tracer.record(trace)
+            return self.__stamp(OBDResponse())
+
+        r = self.__stamp(cmd(messages))  # compute a response object
+
+        if trace is not None:
+            trace.mark("decoded")
+            trace.ecus = tuple(m.tx_id for m in messages if m.parsed())
+            self.tracer.record(trace)
+
+        if self.cache is not None:
+            self.cache.put(cmd, r)
+
+        return r
+
+    def __send_query(self, cmd, trace=None):
+        """ sends the given command to the car, and returns the parsed messages """
+
+        header, rx_filter = self.__addressing(cmd)
+        self.__set_header(header)
+        self.__set_receive_filter(rx_filter)
+        if trace is not None:
+            trace.mark("header_set")
+
+        # if we know the number of frames that this command returns,
+        # only wait for exactly that number. This avoids some harsh
+        # timeouts from the ELM, thus speeding up queries.
+        key = (cmd, header, self.protocol_id())
+        count = self.frame_counts.get(key) if (self.fast and cmd.fast) else None
+
+        logger.info("Sending command: %s", cmd)
+        cmd_string = self.__build_command_string(cmd, count)
+        if trace is None:
+            messages = self.interface.send_and_parse(cmd_string)
+        else:
+            messages = self.interface.send_and_parse(cmd_string, trace=trace)
 
         # if we're sending a new command, note it
         # first check that the current command WASN'T sent as an empty CR
@@ -286,26 +624,40 @@ class OBD(object):
         if cmd_string:
             self.__last_command = cmd_string
 
-        # if we don't already know how many frames this command returns,
-        # log it, so we can specify it next time
-        if cmd not in self.__frame_counts:
-            self.__frame_counts[cmd] = sum([len(m.frames) for m in messages])
+        # learn (or check) the number of frames this command returns,
+        # so we can specify it next time
+        if self.fast and cmd.fast:
+            self.frame_counts.observe(key, messages, count)
 
-        if not messages:
-            logger.info("No valid OBD Messages returned")
-            return OBDResponse()
+        return messages
 
-        return cmd(messages)  # compute a response object
+    def __stamp(self, r):
+        """ copies the send and receive times of the last command onto a response """
+        if self.interface is not None:
+            stamp_response(r, self.interface)
+        return r
 
-    def __build_command_string(self, cmd):
-        """ assembles the appropriate command string """
-        cmd_string = cmd.command
+    def schedule(self, cmds):
+        """
+            Orders the given commands so that commands sharing an ECU
+            header are sent back to back, minimizing the number of
+            'AT SH' round trips. The group for the header that is
+            currently set goes first. Otherwise, groups are ordered by
+            their first appearance, and the order within a group is kept.
+        """
+        return group_by_header(cmds, lambda c: self.__addressing(c)[0], self.__last_header)
 
-        # if we know the number of frames that this command returns,
-        # only wait for exactly that number. This avoids some harsh
-        # timeouts from the ELM, thus speeding up queries.
-        if self.fast and cmd.fast and (cmd in self.__frame_counts):
-            cmd_string += str(self.__frame_counts[cmd]).encode()
+    def query_many(self, cmds, force=False):
+        """
+            Queries each of the given commands, grouped by ECU header
+            (see schedule()). Returns a dict of responses keyed by command.
+        """
+        return dict((c, self.query(c, force=force)) for c in self.schedule(cmds))
+
+    def __build_command_string(self, cmd, count=None):
+        """ assembles the appropriate command string """
+        # tells the ELM how many frames to wait for, if known
+        cmd_string = cmd.descriptor.request(count)
 
         # if we sent this last time, just send a CR
         # (CR is added by the ELM327 class)
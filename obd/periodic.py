@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# periodic.py                                                          #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+"""
+    UDS ReadDataByPeriodicIdentifier (service 0x2A) streaming
+
+    Instead of answering a request per value, an ECU can be asked to send
+    some of its DIDs on its own, at a slow, medium or fast rate (chosen by
+    the manufacturer). Each periodic message is a single CAN frame, with
+    the low byte of the DID (F2xx) followed by its data. The adapter is
+    put in monitor mode (AT MA on ELM327 and STN chips, the raw bus for
+    SocketCAN) to receive them, and each value is handed to Async-style
+    callbacks:
+
+        from obd.periodic import PeriodicStream, FAST
+        from obd.uds import DID, UAS
+
+        RPM = DID("PERIODIC_RPM", "Engine speed", 0xF201, 2, UAS(False, 0.25, Unit.rpm))
+
+        stream = PeriodicStream(connection, rate=FAST)
+        stream.watch(RPM, callback)
+        stream.start()  # schedules the DIDs, and starts receiving them
+        ...
+        stream.stop()   # stops receiving, and unschedules the DIDs
+
+    The CAN ID of the periodic messages is chosen by the manufacturer
+    (often not the ECU's usual response ID): pass it as rx_header to drop
+    the rest of the bus traffic. While streaming, the adapter is busy
+    monitoring the bus: the stream holds the connection's bus lock, and
+    queries from other threads (an Async loop included) wait until stop().
+"""
+
+import logging
+import threading
+import time
+from binascii import unhexlify
+
+from .OBDCommand import OBDCommand
+from .OBDResponse import OBDResponse
+from .protocols import ECU, ECU_HEADER
+from .protocols.protocol import Message
+from .uds import NRC, negative_response, read_did
+from .utils import OBDStatus, isHex
+
+logger = logging.getLogger(__name__)
+
+
+READ_DATA_BY_PERIODIC_IDENTIFIER = 0x2A
+
+# transmission modes
+SLOW = 1
+MEDIUM = 2
+FAST = 3
+STOP = 4
+
+
+def _positive(messages):
+    """ True for a positive response to a 2A request, else the negative response code, or None """
+    for m in messages:
+        if m.data and m.data[0] == READ_DATA_BY_PERIODIC_IDENTIFIER + 0x40:
+            return True
+    return negative_response(messages, READ_DATA_BY_PERIODIC_IDENTIFIER)
+
+
+def schedule_command(mode, dids, header=ECU_HEADER.ENGINE):
+    """ returns the command scheduling (or with mode STOP, unscheduling) the given periodic DIDs """
+    pdids = b"".join([("%02X" % (d.did & 0xFF)).encode() for d in dids])
+    return OBDCommand("PERIODIC_%d" % mode, "Read data by periodic identifier",
+                      b"2A%02X" % mode + pdids, 0, _positive, ECU.ALL, False, header)
+
+
+class PeriodicStream(object):
+    """
+        Schedules periodic DIDs on an ECU, and receives them as a stream
+        of OBDResponses, handed to callbacks from a background thread
+    """
+
+    def __init__(self, connection, rate=FAST, header=ECU_HEADER.ENGINE, rx_header=None,
+                 monitor=b"AT MA"):
+        self.connection = connection
+        self.rate = rate  # SLOW, MEDIUM or FAST
+        self.header = header  # the ECU the DIDs are scheduled on
+        self.rx_header = rx_header  # header of the periodic messages (hex, ie: "5E8"), None = any
+        self.monitor = monitor  # the ELM command receiving them
+        self.messages = 0  # number of periodic messages received
+        self.__dids = {}  # key = periodic DID (low byte), value = DID
+        self.__commands = {}  # key = DID, value = the ReadDataByIdentifier command of its responses
+        self.__responses = {}  # key = DID, value = latest OBDResponse
+        self.__callbacks = {}  # key = DID, value = list of functions
+        self.__thread = None
+        self.__running = False
+        self.__started = threading.Event()  # set by the thread, once it knows whether the stream started
+        self.__streaming = False  # whether it did
+
+    @property
+    def running(self):
+        return self.__running
+
+    def watch(self, did, callback=None):
+        """
+            Subscribes the given DID (see uds.DID), whose number must be a
+            periodic one (F200 to F2FF), with an optional callback fired
+            upon every new value
+        """
+        if self.__running:
+            logger.warning("Can't watch() while running, please use stop()")
+            return
+
+        if (did.did >> 8) != 0xF2:
+            raise ValueError("%04X isn't a periodic DID (F200 to F2FF)" % did.did)
+
+        if did not in self.__responses:
+            logger.info("Watching periodic DID: %04X" % did.did)
+            self.__dids[did.did & 0xFF] = did
+            self.__commands[did] = read_did(did, self.header)
+            self.__responses[did] = OBDResponse()
+            self.__callbacks[did] = []
+
+        if hasattr(callback, "__call__") and (callback not in self.__callbacks[did]):
+            self.__callbacks[did].append(callback)
+
+    def unwatch(self, did, callback=None):
+        """ Unsubscribes a DID (or only one of its callbacks) """
+        if self.__running:
+            logger.warning("Can't unwatch() while running, please use stop()")
+            return
+
+        if did not in self.__responses:
+            return
+        if hasattr(callback, "__call__") and (callback in self.__callbacks[did]):
+            self.__callbacks[did].remove(callback)
+            if self.__callbacks[did]:
+                return
+        self.__dids.pop(did.did & 0xFF, None)
+        self.__commands.pop(did)
+        self.__responses.pop(did)
+        self.__callbacks.pop(did)
+
+    def query(self, did):
+        """ returns the latest value received for the given DID """
+        return self.__responses.get(did, OBDResponse())
+
+    def start(self):
+        """
+            Schedules the watched DIDs on the ECU, and starts receiving
+            them. Returns whether the stream was started.
+        """
+        if self.__thread is not None:
+            return True
+
+        if not self.__dids:
+            logger.info("Periodic stream not started because no DIDs were watched")
+            return False
+
+        interface = self.connection.interface
+        if self.connection.status() != OBDStatus.CAR_CONNECTED:
+            logger.info("Periodic stream not started because no connection was made")
+            return False
+        if not hasattr(interface, "monitor_start") or \
+                self.connection.protocol_id() not in ["6", "7", "8", "9"]:
+            logger.error("Periodic messages can only be received from CAN buses, with an ELM327 or SocketCAN")
+            return False
+
+        # the thread takes the bus for the whole stream, and reports whether it started
+        logger.info("Starting periodic stream thread")
+        self.__running = True
+        self.__streaming = False
+        self.__started.clear()
+        self.__thread = threading.Thread(target=self.run, name="obd-periodic")
+        self.__thread.daemon = True
+        self.__thread.start()
+        self.__started.wait()
+        if not self.__streaming:
+            self.__thread.join()
+            self.__thread = None
+            self.__running = False
+        return self.__streaming
+
+    def __start(self, interface):
+        """ schedules the DIDs, and puts the adapter in monitor mode """
+        r = self.connection.query(schedule_command(self.rate, self.__dids.values(), self.header),
+                                  force=True)
+        if r.value is not True:
+            logger.error("The ECU refused the periodic DIDs: %s" %
+                         ("no answer" if r.value is None else NRC.get(r.value, "%02X" % r.value)))
+            return False
+
+        self.__bits = 11 if self.connection.protocol_id() in ["6", "8"] else 29
+        return interface.monitor_start(self.monitor)
+
+    def stop(self):
+        """ Stops receiving, and unschedules the DIDs """
+        if self.__thread is None:
+            return
+
+        logger.info("Stopping periodic stream thread...")
+        self.__running = False
+        self.__thread.join()
+        self.__thread = None
+
+    def run(self):
+        """ Daemon thread, holding the connection's bus lock """
+        try:
+            with self.connection.exclusive():
+                self.__stream()
+        finally:
+            self.__started.set()  # start() can't be left waiting
+
+    def __stream(self):
+        interface = self.connection.interface
+        self.__streaming = self.__start(interface)
+        self.__started.set()
+        if not self.__streaming:
+            self.__running = False
+            return
+
+        while self.__running:
+            lines = interface.monitor_read(0.25)
+            if lines is None:
+                logger.info("Periodic stream thread terminated because device disconnected")
+                self.__running = False
+                return
+            for line in lines:
+                self.__receive(line)
+
+        interface.monitor_stop()
+        # the adapter's last command is the monitor's now
+        self.connection.forget_adapter_state(self.connection.header)
+        self.connection.query(schedule_command(STOP, self.__dids.values(), self.header), force=True)
+
+    def __receive(self, line):
+        """ decodes a periodic message printed in monitor mode, and fires the callbacks """
+        line = line.replace(" ", "")
+        width = 3 if self.__bits == 11 else 8
+        if (len(line) <= width) or (len(line) - width) % 2 or not isHex(line):
+            return  # BUFFER FULL, or other messages of the adapter
+        header, data = line[:width], bytearray(unhexlify(line[width:]))
+        if (self.rx_header is not None) and (header != self.rx_header.upper()):
+            return
+
+        # a single frame with the response SID (6A), or the periodic DID right away
+        length = data[0]
+        if (1 < length < len(data)) and (data[1] == READ_DATA_BY_PERIODIC_IDENTIFIER + 0x40):
+            data = data[2:1 + length]
+        did = self.__dids.get(data[0])
+        if (did is None) or (len(data) < 1 + did.length):
+            return
+
+        now = time.monotonic()
+        self.messages += 1
+        m = Message([])
+        m.data = bytearray([0x62, did.did >> 8, did.did & 0xFF]) + data[1:1 + did.length]
+        r = OBDResponse(self.__commands[did], [m])
+        r.value = did.decode(data[1:1 + did.length])
+        r.received_monotonic = now
+        r.received_time = r.time
+        self.__responses[did] = r
+
+        for callback in self.__callbacks[did]:
+            callback(r)
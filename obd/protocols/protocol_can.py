@@ -39,6 +39,17 @@ from .protocol import Protocol
 logger = logging.getLogger(__name__)
 
 
+def isotp_segment(payload):
+    """ splits a payload into padded ISO-TP frames (single, or first + consecutive frames) """
+    if len(payload) <= 7:
+        frames = [bytearray([len(payload)]) + payload]
+    else:
+        frames = [bytearray([0x10 | (len(payload) >> 8), len(payload) & 0xFF]) + payload[:6]]
+        for i, start in enumerate(range(6, len(payload), 7)):
+            frames.append(bytearray([0x20 | ((i + 1) & 0x0F)]) + payload[start:start + 7])
+    return [f + bytearray(8 - len(f)) for f in frames]
+
+
 class CANProtocol(Protocol):
     TX_ID_ENGINE = 0
     TX_ID_TRANSMISSION = 1
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# recording.py                                                         #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+
+"""
+    Compact binary transcripts of the traffic between python-OBD and an
+    adapter, as recorded by the record:// port, and played back by the
+    replay:// port (see obd/urlhandler/).
+
+    File layout (little endian):
+
+        header: MAGIC, wall clock start time (double, seconds since epoch)
+        then one record per write() or read() chunk:
+            kind     (1 byte)  WRITE or READ
+            delta    (uint32)  microseconds since the previous record
+            length   (uint16)  number of bytes of data
+            data     (length bytes)
+
+    Timestamps are taken from the monotonic clock, and stored as deltas.
+"""
+
+import logging
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"OBDREC\x00\x01"
+WRITE = b"W"
+READ = b"R"
+
+_HEADER = struct.Struct("<8sd")
+_RECORD = struct.Struct("<cIH")
+_MAX_DELTA = 0xFFFFFFFF
+_MAX_LENGTH = 0xFFFF
+
+
+class Record(object):
+    """ a single write() or read() chunk, with its time since the start of the recording """
+
+    __slots__ = ["kind", "time", "data"]
+
+    def __init__(self, kind, time_, data):
+        self.kind = kind
+        self.time = time_
+        self.data = data
+
+    def __repr__(self):
+        return "Record(%r, %.6f, %r)" % (self.kind, self.time, self.data)
+
+
+class RecordWriter(object):
+    """ appends records to a transcript file """
+
+    def __init__(self, path):
+        self.path = path
+        self.start_time = time.time()
+        self.__file = open(path, "wb")
+        self.__file.write(_HEADER.pack(MAGIC, self.start_time))
+        self.__start = time.monotonic()
+        self.__last = 0  # microseconds since start, of the previous record
+
+    def write(self, kind, data, timestamp=None):
+        """ records a chunk of data, timestamp defaults to now (monotonic clock) """
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        now = int((timestamp - self.__start) * 1e6)
+        delta = min(max(now - self.__last, 0), _MAX_DELTA)
+        self.__last += delta
+
+        data = bytes(data)
+        for i in range(0, max(len(data), 1), _MAX_LENGTH):
+            chunk = data[i:i + _MAX_LENGTH]
+            self.__file.write(_RECORD.pack(kind, delta, len(chunk)))
+            self.__file.write(chunk)
+            delta = 0
+
+    def flush(self):
+        self.__file.flush()
+
+    def close(self):
+        if not self.__file.closed:
+            self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def read_records(path):
+    """
+        Loads a transcript file. Returns a tuple of the wall clock start
+        time, and the list of Records.
+    """
+    with open(path, "rb") as f:
+        buf = f.read()
+
+    if len(buf) < _HEADER.size:
+        raise ValueError("%s is not an OBD transcript (too short)" % path)
+
+    magic, start_time = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError("%s is not an OBD transcript (bad magic)" % path)
+
+    records = []
+    offset = _HEADER.size
+    t = 0
+    while offset + _RECORD.size <= len(buf):
+        kind, delta, length = _RECORD.unpack_from(buf, offset)
+        offset += _RECORD.size
+        data = buf[offset:offset + length]
+        offset += length
+        t += delta
+
+        if len(data) < length:
+            logger.warning("%s ends with a truncated record" % path)
+            break
+
+        records.append(Record(kind, t / 1e6, data))
+
+    return start_time, records
+
+
+def transactions(records):
+    """
+        Groups records into (write record, [read records]) pairs.
+        Reads that arrive before the first write are paired with None.
+    """
+    result = []
+    current = (None, [])
+    for r in records:
+        if r.kind == WRITE:
+            if current[0] is not None or current[1]:
+                result.append(current)
+            current = (r, [])
+        else:
+            current[1].append(r)
+
+    if current[0] is not None or current[1]:
+        result.append(current)
+
+    return result
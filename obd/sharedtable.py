@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# sharedtable.py                                                       #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+"""
+    Publishes the latest value of every watched command into a shared
+    memory segment, so that any local process can read the live values
+    without a round trip to the process that owns the serial port.
+
+    Segment layout (little endian):
+
+        header (64 bytes): MAGIC, slot size (uint32), slot count (uint32),
+                           number of slots in use (uint32)
+        then slot count slots of slot size bytes:
+            sequence lock   (uint64)  odd while the slot is being written
+            count           (uint64)  number of values published in the slot
+            time            (double)  seconds since epoch
+            value           (double)  NaN for JSON and null values
+            type            (1 byte)  NUMBER, JSON or NULL
+            name length     (1 byte)
+            unit length     (1 byte)
+            padding         (1 byte)
+            text length     (uint16)  length of the JSON text
+            padding         (2 bytes)
+            name            (32 bytes)
+            unit            (32 bytes)
+            text            (the rest of the slot) JSON text of non-numeric values
+
+    Slots are assigned to commands in the order they are first published,
+    and keep their command for the life of the segment. There is one
+    writer (the publisher), readers retry until they copy a slot whose
+    sequence lock was even and unchanged around the copy.
+"""
+
+import collections
+import json
+import logging
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+from .triplog import _value, _json_default, NUMBER, JSON
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"OBDSHM\x00\x01"
+NULL = b"n"
+
+_HEADER = struct.Struct("<8sIII")
+_HEADER_SIZE = 64
+_USED_OFFSET = 16  # offset of the number of slots in use in the header
+_SLOT = struct.Struct("<QQddcBBxH2x")
+_NAME = _SLOT.size
+_UNIT = _NAME + 32
+_TEXT = _UNIT + 32
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+
+Sample = collections.namedtuple("Sample", ["value", "unit", "time", "seq"])
+
+_published = set()  # names of the segments created by this process (and its forks)
+
+
+def _attach(name):
+    """ attaches to an existing segment, without letting this process' resource tracker unlink it at exit """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # before python 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        if name in _published:
+            return shm  # the tracker registration is the publisher's
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+class TablePublisher(object):
+    """
+        Creates a segment, and publishes the responses it is given into
+        it. Instances are callable, and can be used as Async callbacks:
+
+            table = TablePublisher("obd")
+            table.watch(connection, [obd.commands.RPM, obd.commands.SPEED])
+
+        The segment is removed by close().
+    """
+
+    def __init__(self, name=None, slots=64, slot_size=256):
+        if slot_size < _TEXT + 16:
+            raise ValueError("slot_size must be at least %d bytes" % (_TEXT + 16))
+        self.slots = slots
+        self.slot_size = slot_size
+        self.__shm = shared_memory.SharedMemory(name=name, create=True,
+                                                size=_HEADER_SIZE + slots * slot_size)
+        self.name = self.__shm.name
+        _published.add(self.name)
+        self.__buf = self.__shm.buf
+        self.__index = {}  # key = command name, value = slot offset
+        self.__lock = threading.Lock()
+        _HEADER.pack_into(self.__buf, 0, MAGIC, slot_size, slots, 0)
+
+    def __call__(self, response):
+        self.publish(response)
+
+    def watch(self, connection, commands, force=False):
+        """ watches the given commands on an Async connection, publishing their responses """
+        for c in commands:
+            connection.watch(c, callback=self, force=force)
+
+    def publish(self, response):
+        """ writes the value of a response to its command's slot """
+        if response.command is None:
+            return
+        t = response.received_time if response.received_time is not None else response.time
+
+        if response.value is None:
+            type_, value, text = NULL, float("nan"), b""
+        else:
+            type_, value = _value(response)
+            if type_ == NUMBER:
+                text = b""
+            else:
+                value, text = float("nan"), json.dumps(value, default=_json_default).encode("utf-8")
+        unit = str(response.value.u).encode("utf-8")[:32] if hasattr(response.value, "u") else b""
+        text = text[:self.slot_size - _TEXT]
+
+        with self.__lock:
+            if self.__buf is None:
+                return
+            offset = self.__slot(response.command.name)
+            if offset is None:
+                return
+            buf = self.__buf
+            seq, count = struct.unpack_from("<QQ", buf, offset)
+            name = response.command.name.encode("utf-8")[:32]
+
+            _U64.pack_into(buf, offset, seq + 1)  # odd, readers retry
+            _SLOT.pack_into(buf, offset, seq + 1, count + 1, t, value, type_, len(name), len(unit), len(text))
+            buf[offset + _UNIT:offset + _UNIT + len(unit)] = unit
+            buf[offset + _TEXT:offset + _TEXT + len(text)] = text
+            _U64.pack_into(buf, offset, seq + 2)
+
+    def __slot(self, name):
+        """ returns the offset of a command's slot, assigning one if needed """
+        offset = self.__index.get(name)
+        if offset is None:
+            used = len(self.__index)
+            if used == self.slots:
+                logger.warning("Shared table %s is full, %s is not published" % (self.name, name))
+                return None
+            offset = _HEADER_SIZE + used * self.slot_size
+            encoded = name.encode("utf-8")[:32]
+            self.__buf[offset + _NAME:offset + _NAME + len(encoded)] = encoded
+            struct.pack_into("<B", self.__buf, offset + 33, len(encoded))  # name length
+            self.__index[name] = offset
+            _U32.pack_into(self.__buf, _USED_OFFSET, used + 1)
+        return offset
+
+    def close(self):
+        """ removes the segment """
+        with self.__lock:
+            if self.__buf is None:
+                return
+            self.__buf = None
+            self.__shm.close()
+            self.__shm.unlink()
+            _published.discard(self.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class SharedTable(object):
+    """
+        Reads the latest values from a publisher's segment, in any process:
+
+            table = SharedTable("obd")
+            table["RPM"]        # Sample(value, unit, time, seq)
+            table.snapshot()    # {"RPM": Sample(...), ...}
+
+        `seq` counts the values published for the command, so a reader can
+        tell whether a value is new since its last read.
+    """
+
+    def __init__(self, name, retries=1000):
+        self.name = name
+        self.retries = retries
+        self.__shm = _attach(name)
+        self.__buf = self.__shm.buf
+        magic, self.slot_size, self.slots, _ = _HEADER.unpack_from(self.__buf, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("%s is not a shared table" % name)
+        self.__index = {}  # key = command name, value = slot offset
+
+    def names(self):
+        """ the names of the published commands """
+        self.__scan()
+        return list(self.__index)
+
+    def __scan(self):
+        """ reads the names of slots assigned since the last scan """
+        buf = self.__buf
+        (used,) = _U32.unpack_from(buf, _USED_OFFSET)
+        for i in range(len(self.__index), min(used, self.slots)):
+            offset = _HEADER_SIZE + i * self.slot_size
+            n = buf[offset + 33]
+            name = bytes(buf[offset + _NAME:offset + _NAME + n]).decode("utf-8")
+            self.__index[name] = offset
+
+    def read(self, name):
+        """ returns the latest Sample of a command, or None if it wasn't published (or stayed locked) """
+        offset = self.__index.get(name)
+        if offset is None:
+            self.__scan()
+            offset = self.__index.get(name)
+            if offset is None:
+                return None
+
+        buf = self.__buf
+        for i in range(self.retries):
+            (before,) = _U64.unpack_from(buf, offset)
+            if before & 1:
+                if i > 10:
+                    time.sleep(0)  # let the writer finish
+                continue
+            data = bytes(buf[offset:offset + self.slot_size])
+            (after,) = _U64.unpack_from(buf, offset)
+            if before == after:
+                return self.__decode(data)
+        return None
+
+    def __decode(self, data):
+        _, count, t, value, type_, _, unit_len, text_len = _SLOT.unpack_from(data, 0)
+        if count == 0:
+            return None
+        unit = data[_UNIT:_UNIT + unit_len].decode("utf-8")
+        if type_ == NULL:
+            value = None
+        elif type_ == JSON:
+            text = data[_TEXT:_TEXT + text_len].decode("utf-8", "replace")
+            try:
+                value = json.loads(text)
+            except ValueError:
+                value = text  # truncated to the slot
+        return Sample(value, unit, t, count)
+
+    def __getitem__(self, name):
+        sample = self.read(name)
+        if sample is None:
+            raise KeyError(name)
+        return sample
+
+    def snapshot(self):
+        """ returns the latest Sample of every published command """
+        self.__scan()
+        samples = {}
+        for name in self.__index:
+            s = self.read(name)
+            if s is not None:
+                samples[name] = s
+        return samples
+
+    def close(self):
+        if self.__buf is not None:
+            self.__buf = None
+            self.__shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
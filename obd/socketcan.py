@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# socketcan.py                                                         #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+"""
+    Native CAN transport for Linux SocketCAN interfaces, in place of an
+    ELM327. Requests are sent as ISO-TP frames on a raw CAN socket (or a
+    kernel CAN_ISOTP socket, for physically addressed requests), and the
+    received frames are handed to the same CAN protocol parsers as the
+    ELM's output.
+
+        connection = obd.OBD("socketcan://can0")
+        connection = obd.OBD("socketcan://can0?protocol=7&isotp=1")
+        connection = obd.OBD("socketcan://emulator")  # an emulated bus, see obd/emulator.py
+
+    URL parameters:
+
+        protocol  6 or 8 for 11-bit IDs, 7 or 9 for 29-bit IDs (default:
+                  detected, trying 11-bit IDs first). The bitrate is set
+                  on the interface (ip link set can0 type can bitrate 500000)
+        isotp     1 to use kernel CAN_ISOTP sockets for physically
+                  addressed requests (needs the can-isotp module)
+        ecus      number of ECUs of the emulated bus (default: 2)
+"""
+
+import logging
+import socket
+import struct
+import time
+from binascii import hexlify
+
+try:
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from urlparse import urlparse, parse_qs
+
+from .interfaces import NativeInterface
+from .protocols.protocol_can import isotp_segment
+from .protocols import ISO_15765_4_11bit_500k, \
+                       ISO_15765_4_29bit_500k, \
+                       ISO_15765_4_11bit_250k, \
+                       ISO_15765_4_29bit_250k
+from .utils import OBDStatus, isHex
+
+logger = logging.getLogger(__name__)
+
+CAN_EFF_FLAG = 0x80000000  # extended (29-bit) ID
+CAN_RTR_FLAG = 0x40000000
+CAN_ERR_FLAG = 0x20000000
+CAN_SFF_MASK = 0x000007FF
+CAN_EFF_MASK = 0x1FFFFFFF
+
+_CAN_FRAME = struct.Struct("=IB3x8s")
+_CAN_FILTER = struct.Struct("=II")
+
+FLOW_CONTROL = bytearray([0x30, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])  # send everything, no delay
+RESPONSE_PENDING_TIME = 5.0  # P2* of ISO 15765-4, after a "response pending" negative response
+
+
+class RawBus(object):
+    """ a raw CAN socket, frames are (CAN ID, data) pairs """
+
+    def __init__(self, ifname):
+        self.ifname = ifname
+        self.sock = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+        self.sock.bind((ifname,))
+
+    def set_filters(self, filters):
+        """ only receive the frames matching one of the (CAN ID, mask) pairs, None for all frames """
+        if filters is None:
+            data = _CAN_FILTER.pack(0, 0)
+        else:
+            data = b"".join([_CAN_FILTER.pack(i | (CAN_EFF_FLAG if i > CAN_SFF_MASK else 0),
+                                              m | CAN_EFF_FLAG) for i, m in filters])
+        self.sock.setsockopt(socket.SOL_CAN_RAW, socket.CAN_RAW_FILTER, data)
+
+    def send(self, can_id, data):
+        if can_id > CAN_SFF_MASK:
+            can_id |= CAN_EFF_FLAG
+        self.sock.send(_CAN_FRAME.pack(can_id, len(data), bytes(data)))
+
+    def recv(self, timeout):
+        """
+            returns the next (CAN ID, data) frame, or None after the timeout
+            (with a timeout of 0, only the frames already received)
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            # past the deadline, the socket doesn't block: the queue is still read
+            self.sock.settimeout(max(deadline - time.monotonic(), 0.0))
+            try:
+                frame = self.sock.recv(_CAN_FRAME.size)
+            except (socket.timeout, BlockingIOError):
+                return None
+            can_id, dlc, data = _CAN_FRAME.unpack(frame)
+            if can_id & (CAN_ERR_FLAG | CAN_RTR_FLAG):
+                continue
+            can_id &= CAN_EFF_MASK if can_id & CAN_EFF_FLAG else CAN_SFF_MASK
+            return can_id, data[:dlc]
+
+    def close(self):
+        self.sock.close()
+
+
+class SocketCAN(NativeInterface):
+    """
+        Handles communication with the car over a SocketCAN interface,
+        with the same methods as ELM327 (see obd/interfaces.py)
+    """
+
+    _SUPPORTED_PROTOCOLS = {
+        "6": ISO_15765_4_11bit_500k,
+        "7": ISO_15765_4_29bit_500k,
+        "8": ISO_15765_4_11bit_250k,
+        "9": ISO_15765_4_29bit_250k,
+    }
+
+    _TRY_PROTOCOL_ORDER = ["6", "7"]
+
+    def __init__(self, portname, baudrate, protocol, timeout,
+                 check_voltage=True, start_low_power=False):
+        """
+            Opens the interface, and tries to reach the car. The timeout
+            is the time to wait for more frames after the last one (like
+            the ELM's AT ST). baudrate, check_voltage and start_low_power
+            don't apply to CAN interfaces.
+        """
+
+        NativeInterface.__init__(self, portname, timeout)
+        self.__bus = None
+        self.__isotp = {}  # key = (request ID, response ID), value = CAN_ISOTP socket
+
+        url = urlparse(portname)
+        options = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        self.__ifname = url.netloc or url.path
+        self.__use_isotp = options.get("isotp", "0") not in ("0", "")
+        if "protocol" in options:
+            protocol = options["protocol"].upper()
+
+        logger.info("Initializing SocketCAN: INTERFACE=%s PROTOCOL=%s" %
+                    (self.__ifname, "auto" if protocol is None else protocol))
+
+        try:
+            if self.__ifname == "emulator":
+                from .emulator import EmulatedCANBus, default_ecus
+                p = protocol or "6"
+                self.__bus = EmulatedCANBus(default_ecus(p, int(options.get("ecus", 2))),
+                                            bits=11 if p in ("6", "8") else 29)
+            else:
+                self.__bus = RawBus(self.__ifname)
+        except (AttributeError, OSError, ValueError) as e:  # no AF_CAN support, or no such interface
+            logger.error("Failed to open %s: %s" % (portname, e))
+            return
+
+        self._status = OBDStatus.OBD_CONNECTED  # no adapter to check, the bus is the car's
+
+        if protocol is not None and protocol not in self._SUPPORTED_PROTOCOLS:
+            logger.error("%s is not a CAN protocol. Please use \"6\" through \"9\"" % protocol)
+            return
+
+        for p in ([protocol] if protocol is not None else self._TRY_PROTOCOL_ORDER):
+            self._protocol = self._SUPPORTED_PROTOCOLS[p]([])
+            self.__bus.set_filters(self.__filters())
+            r0100 = self._request(bytearray(b"\x01\x00"))
+            if any([isHex(line) for line in r0100]):
+                self._protocol = self._SUPPORTED_PROTOCOLS[p](r0100)
+                self._status = OBDStatus.CAR_CONNECTED
+                logger.info("Connected Successfully: INTERFACE=%s PROTOCOL=%s" % (self.__ifname, p))
+                return
+
+        self._protocol = None
+        logger.error("Connected to %s, but no ECU answered" % self.__ifname)
+
+    # --------------------------- CAN IDs ---------------------------
+
+    def __bits(self):
+        return self._protocol.id_bits
+
+    def __functional_id(self):
+        return 0x7DF if self.__bits() == 11 else 0x18DB33F1
+
+    def __filters(self):
+        """ the IDs of the ECUs' responses """
+        if self.__bits() == 11:
+            return [(0x7E8, 0x7F8)]
+        return [(0x18DAF100, 0x1FFFFF00)]
+
+    def __request_id(self, response_id):
+        """ the ID to send flow control frames to, for an ECU's response ID """
+        if self.__bits() == 11:
+            return response_id - 8
+        return 0x18DA00F1 | ((response_id & 0xFF) << 8)
+
+    def __response_id(self, request_id):
+        """ the ID a physically addressed ECU answers with """
+        if self.__bits() == 11:
+            return request_id + 8
+        return 0x18DAF100 | ((request_id >> 8) & 0xFF)
+
+    def _target(self, header):
+        """ turns an 'AT SH' header into a CAN ID (the priority of 29-bit IDs is 18, like the ELM's default 'AT CP') """
+        if not header or not isHex(header) or len(header) > 8:
+            raise ValueError(header)
+        can_id = int(header, 16)
+        if len(header) <= 3:
+            pass
+        elif len(header) <= 6:
+            can_id |= 0x18000000
+        return None if can_id == self.__functional_id() else can_id
+
+    def _version(self):
+        return "SocketCAN %s" % self.__ifname
+
+    # --------------------------- requests ---------------------------
+
+    def _request(self, payload, count=None, trace=None):
+        """ sends a request, returns the received frames as lines, formatted like the ELM's """
+        physical = self._target_address is not None
+        tx_id = self._target_address if physical else self.__functional_id()
+
+        if physical and self.__use_isotp:
+            return self.__request_isotp(tx_id, payload, trace)
+
+        if trace is not None:
+            trace.mark("write_start")
+        if len(payload) <= 7:
+            self.__bus.send(tx_id, bytearray([len(payload)]) + payload + bytearray(7 - len(payload)))
+        elif not physical:
+            logger.error("Functional requests are limited to 7 bytes")
+            return ["CAN ERROR"]
+        elif not self.__send_multi(tx_id, payload):
+            return ["NO DATA"]
+        now = time.monotonic()
+        self._sent = (now, time.time())
+        self._received = (None, None)
+        if trace is not None:
+            trace.mark("write_flushed", now)
+
+        fmt = "%03X" if self.__bits() == 11 else "%08X"
+        lines = []
+        remaining = {}  # key = response ID, value = number of consecutive frames still expected
+        deadline = time.monotonic() + self.timeout
+        while True:
+            frame = self.__bus.recv(max(deadline - time.monotonic(), 0))
+            if frame is None:
+                break
+            can_id, data = frame
+            header = fmt % can_id
+            if not data or not self._accepts(header):
+                continue
+            now = time.monotonic()
+            pci = data[0] & 0xF0
+
+            if pci == 0x30:
+                continue  # flow control, not for us
+            if pci == 0x00 and len(data) >= 4 and data[1] == 0x7F and data[3] == 0x78:
+                deadline = now + RESPONSE_PENDING_TIME  # response pending
+                continue
+
+            if not lines and trace is not None:
+                trace.mark("first_byte", now)
+            lines.append(header + hexlify(bytes(data)).decode().upper())
+            self._received = (now, time.time())
+            deadline = now + self.timeout
+
+            if pci == 0x10:
+                length = ((data[0] & 0x0F) << 8) | data[1]
+                remaining[can_id] = -(-(length - 6) // 7)
+                self.__bus.send(self.__request_id(can_id), FLOW_CONTROL)
+            elif pci == 0x20 and can_id in remaining:
+                remaining[can_id] -= 1
+
+            if count is not None and len(lines) >= count:
+                break
+            if physical and not any(remaining.values()):
+                break  # a single ECU was addressed, and its message is complete
+
+        if trace is not None:
+            trace.mark("prompt", self._received[0])
+        return lines or ["NO DATA"]
+
+    def __send_multi(self, tx_id, payload):
+        """ sends a multi-frame request, waiting for the ECU's flow control frame """
+        frames = isotp_segment(payload)
+        self.__bus.send(tx_id, frames[0])
+        rx_id = self.__response_id(tx_id)
+        deadline = time.monotonic() + max(self.timeout, 0.05)
+        block, st_min = None, 0.0
+        while block is None:
+            frame = self.__bus.recv(max(deadline - time.monotonic(), 0))
+            if frame is None:
+                logger.info("No flow control frame from %X" % rx_id)
+                return False
+            can_id, data = frame
+            if can_id == rx_id and data and (data[0] & 0xF0) == 0x30:
+                block = data[1]
+                st_min = data[2] / 1000.0 if data[2] <= 0x7F else 0.0001 * (data[2] - 0xF0)
+
+        for sent, frame in enumerate(frames[1:], 1):
+            self.__bus.send(tx_id, frame)
+            if block and sent % block == 0 and sent < len(frames) - 1:
+                if not self.__await_flow_control(rx_id):
+                    return False
+            elif st_min:
+                time.sleep(st_min)
+        return True
+
+    def __await_flow_control(self, rx_id):
+        deadline = time.monotonic() + max(self.timeout, 0.05)
+        while True:
+            frame = self.__bus.recv(max(deadline - time.monotonic(), 0))
+            if frame is None:
+                return False
+            if frame[0] == rx_id and frame[1] and (frame[1][0] & 0xF0) == 0x30:
+                return True
+
+    def __request_isotp(self, tx_id, payload, trace=None):
+        """ sends a request on a kernel CAN_ISOTP socket, which handles the segmentation """
+        rx_id = self.__response_id(tx_id)
+        sock = self.__isotp.get((tx_id, rx_id))
+        if sock is None:
+            sock = socket.socket(socket.AF_CAN, socket.SOCK_DGRAM, socket.CAN_ISOTP)
+            sock.bind((self.__ifname,
+                       rx_id | (CAN_EFF_FLAG if rx_id > CAN_SFF_MASK else 0),
+                       tx_id | (CAN_EFF_FLAG if tx_id > CAN_SFF_MASK else 0)))
+            self.__isotp[(tx_id, rx_id)] = sock
+
+        if trace is not None:
+            trace.mark("write_start")
+        sock.send(bytes(payload))
+        now = time.monotonic()
+        self._sent = (now, time.time())
+        self._received = (None, None)
+        if trace is not None:
+            trace.mark("write_flushed", now)
+
+        deadline = now + self.timeout
+        while True:
+            sock.settimeout(max(deadline - time.monotonic(), 0.001))
+            try:
+                response = bytearray(sock.recv(4095))
+            except socket.timeout:
+                return ["NO DATA"]
+            if len(response) >= 3 and response[0] == 0x7F and response[2] == 0x78:
+                deadline = time.monotonic() + RESPONSE_PENDING_TIME
+                continue
+            break
+
+        now = time.monotonic()
+        self._received = (now, time.time())
+        if trace is not None:
+            trace.mark("first_byte", now)
+            trace.mark("prompt", now)
+
+        # the parsers expect frames: segment the payload again
+        fmt = "%03X" if self.__bits() == 11 else "%08X"
+        return [fmt % rx_id + hexlify(bytes(f)).decode().upper() for f in isotp_segment(response)]
+
+    # --------------------------- monitor ---------------------------
+
+    def monitor_start(self, cmd=b"AT MA"):
+        """ receives all of the frames on the bus, like AT MA (see ELM327.monitor_start()) """
+        if self._status != OBDStatus.CAR_CONNECTED:
+            return False
+        self.__bus.set_filters(None)
+        return True
+
+    def monitor_read(self, timeout):
+        """
+            returns the frames received, as lines formatted like the ELM's,
+            waiting up to timeout seconds for the first
+        """
+        fmt = "%03X" if self.__bits() == 11 else "%08X"
+        lines = []
+        frame = self.__bus.recv(timeout)
+        while frame is not None:
+            can_id, data = frame
+            header = fmt % can_id
+            if data and self._accepts(header):
+                lines.append(header + hexlify(bytes(data)).decode().upper())
+            frame = self.__bus.recv(0)
+        return lines
+
+    def monitor_stop(self):
+        if self.__bus is not None:
+            self.__bus.set_filters(self.__filters())
+        return []
+
+    def _close(self):
+        """ closes the sockets """
+        for sock in self.__isotp.values():
+            sock.close()
+        self.__isotp = {}
+        if self.__bus is not None:
+            self.__bus.close()
+            self.__bus = None
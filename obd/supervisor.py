@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# supervisor.py                                                        #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+
+import logging
+import time
+
+from .metrics import Stats
+
+logger = logging.getLogger(__name__)
+
+
+class Supervisor(object):
+    """
+        Watches over an OBD connection, and brings it back after the
+        adapter drops out (unplugged, Bluetooth link lost, etc...).
+
+        Reconnection attempts are spaced with a bounded exponential
+        backoff. Each attempt uses OBD.resume(), which re-opens the port
+        with the baudrate and protocol learned by the previous session,
+        rather than repeating the full cold start.
+    """
+
+    def __init__(self, connection, initial_delay=0.5, max_delay=30.0,
+                 multiplier=2.0, max_attempts=10):
+        self.connection = connection
+        self.initial_delay = initial_delay  # seconds before the second attempt
+        self.max_delay = max_delay  # upper bound for the backoff
+        self.multiplier = multiplier
+        self.max_attempts = max_attempts  # per call to recover(), None = unlimited
+
+        self.outages = Stats()  # durations (seconds) of the recovered outages
+        self.attempts = 0  # total number of resume attempts
+        self.failed_attempts = 0
+        self.__down_since = None  # monotonic timestamp of the current outage
+
+    @property
+    def down_since(self):
+        """ monotonic timestamp of when the current outage was detected, or None """
+        return self.__down_since
+
+    def outage_duration(self):
+        """ length of the current outage in seconds (0.0 when connected) """
+        if self.__down_since is None:
+            return 0.0
+        return time.monotonic() - self.__down_since
+
+    def recover(self, keep_going=None):
+        """
+            Blocks until the connection is restored, max_attempts is
+            exhausted, or the optional keep_going() callable returns False.
+
+            Returns a boolean for whether the connection is up.
+        """
+
+        if self.connection.is_connected():
+            return True
+
+        if self.__down_since is None:
+            self.__down_since = time.monotonic()
+            logger.warning("Connection lost, attempting to reconnect")
+
+        delay = self.initial_delay
+        attempt = 0
+
+        while (self.max_attempts is None) or (attempt < self.max_attempts):
+
+            if (keep_going is not None) and not keep_going():
+                return False
+
+            attempt += 1
+            self.attempts += 1
+
+            if self.connection.resume():
+                duration = time.monotonic() - self.__down_since
+                self.__down_since = None
+                self.outages.add(duration)
+                logger.warning("Reconnected after %.3f seconds" % duration)
+                return True
+
+            self.failed_attempts += 1
+            logger.info("Reconnect attempt %d failed, retrying in %.1f seconds" % (attempt, delay))
+
+            if not self.__sleep(delay, keep_going):
+                return False
+            delay = min(delay * self.multiplier, self.max_delay)
+
+        logger.error("Failed to reconnect after %d attempts" % attempt)
+        return False
+
+    def stats(self):
+        """ returns a dict of the outage metrics """
+        return {
+            "outages": self.outages.as_dict(),
+            "attempts": self.attempts,
+            "failed_attempts": self.failed_attempts,
+            "current_outage": self.outage_duration(),
+        }
+
+    @staticmethod
+    def __sleep(delay, keep_going):
+        """ sleeps in short slices, so that a stop request isn't held up by the backoff """
+        end = time.monotonic() + delay
+        while True:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return True
+            if (keep_going is not None) and not keep_going():
+                return False
+            time.sleep(min(remaining, 0.1))
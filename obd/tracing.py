@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# tracing.py                                                           #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+import logging
+import threading
+import time
+
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+# stages of a query, in the order they happen
+STAGES = [
+    "start",          # the query was picked up (with the bus lock held)
+    "header_set",     # AT SH / AT CRA were sent, if needed
+    "write_start",    # the command is being written to the port
+    "write_flushed",  # the port finished writing
+    "first_byte",     # the adapter started answering
+    "prompt",         # the adapter's prompt was seen
+    "parsed",         # the protocol assembled the messages
+    "decoded",        # the command decoded the response
+]
+
+# durations recorded for each query: (name, from stage, to stage)
+SEGMENTS = [
+    ("header", "start", "header_set"),
+    ("write", "write_start", "write_flushed"),
+    ("adapter", "write_flushed", "first_byte"),
+    ("transfer", "first_byte", "prompt"),
+    ("parse", "prompt", "parsed"),
+    ("decode", "parsed", "decoded"),
+    ("total", "start", None),  # until the last stage reached
+]
+
+
+class QueryTrace(object):
+    """ the monotonic timestamps of the stages of a single query """
+
+    __slots__ = ["command", "marks", "ecus"]
+
+    def __init__(self, command):
+        self.command = command
+        self.marks = {"start": time.monotonic()}  # key = stage, value = time.monotonic()
+        self.ecus = ()  # tx_id of the ECUs that answered
+
+    def mark(self, stage, t=None):
+        """ records the time (default: now) at which the given stage was reached """
+        self.marks[stage] = time.monotonic() if t is None else t
+
+    def durations(self):
+        """ returns a dict of the segments durations (in seconds) that could be measured """
+        end = max(self.marks.values())
+        result = {}
+        for name, start, stop in SEGMENTS:
+            if (start in self.marks) and ((stop is None) or (stop in self.marks)):
+                result[name] = (self.marks[stop] if stop else end) - self.marks[start]
+        return result
+
+    def __repr__(self):
+        stages = [s for s in STAGES if s in self.marks]
+        t0 = self.marks["start"]
+        return "<QueryTrace %s %s>" % (
+            self.command.name if self.command is not None else None,
+            " ".join(["%s=%.6f" % (s, self.marks[s] - t0) for s in stages]))
+
+
+class Tracer(object):
+    """
+        Collects the traces of a connection's queries into histograms
+        of each segment (see SEGMENTS), per command and per ECU. Traces
+        are also handed to the exporters: functions taking a QueryTrace,
+        called from the querying thread.
+    """
+
+    def __init__(self, buckets=None):
+        self.buckets = buckets
+        self.commands = {}  # key = command name, value = {segment: Histogram}
+        self.ecus = {}  # key = tx_id of the ECU, value = {segment: Histogram}
+        self.traces = 0  # number of traces recorded
+        self.last = None  # the last QueryTrace recorded
+        self.__exporters = []
+        self.__lock = threading.Lock()
+        self.__server = None
+
+    def add_exporter(self, exporter):
+        self.__exporters.append(exporter)
+
+    def remove_exporter(self, exporter):
+        if exporter in self.__exporters:
+            self.__exporters.remove(exporter)
+
+    def record(self, trace):
+        """ adds a finished trace to the histograms, and exports it """
+        durations = trace.durations()
+        name = trace.command.name if trace.command is not None else ""
+
+        with self.__lock:
+            self.traces += 1
+            self.last = trace
+            self.__add(self.commands.setdefault(name, {}), durations)
+            for tx_id in trace.ecus:
+                self.__add(self.ecus.setdefault(tx_id, {}), durations)
+
+        for exporter in list(self.__exporters):
+            try:
+                exporter(trace)
+            except Exception as e:
+                logger.error("Trace exporter failed: %s" % e)
+
+    def __add(self, histograms, durations):
+        for segment, value in durations.items():
+            if segment not in histograms:
+                histograms[segment] = Histogram(self.buckets)
+            histograms[segment].add(value)
+
+    def histogram(self, command, segment="total"):
+        """ returns the Histogram of a command's segment, or None """
+        name = command if isinstance(command, str) else command.name
+        return self.commands.get(name, {}).get(segment)
+
+    def ecu_histogram(self, tx_id, segment="total"):
+        """ returns the Histogram of an ECU's segment, or None """
+        return self.ecus.get(tx_id, {}).get(segment)
+
+    def reset(self):
+        with self.__lock:
+            self.commands = {}
+            self.ecus = {}
+            self.traces = 0
+            self.last = None
+
+    def stats(self):
+        """ returns a nested dict of the histograms """
+        with self.__lock:
+            return {
+                "commands": dict((name, dict((s, h.as_dict()) for s, h in segments.items()))
+                                 for name, segments in self.commands.items()),
+                "ecus": dict((tx_id, dict((s, h.as_dict()) for s, h in segments.items()))
+                             for tx_id, segments in self.ecus.items()),
+            }
+
+    def text(self):
+        """ returns the histograms in the Prometheus text exposition format """
+        lines = []
+        with self.__lock:
+            for metric, label, table in [("obd_query_seconds", "command", self.commands),
+                                         ("obd_ecu_seconds", "ecu", self.ecus)]:
+                lines.append("# TYPE %s histogram" % metric)
+                for key in sorted(table, key=str):
+                    for segment in sorted(table[key]):
+                        h = table[key][segment]
+                        labels = '%s="%s",segment="%s"' % (label, key, segment)
+                        for bound, n in h.cumulative():
+                            le = "+Inf" if bound == float("inf") else repr(bound)
+                            lines.append('%s_bucket{%s,le="%s"} %d' % (metric, labels, le, n))
+                        lines.append("%s_sum{%s} %.9f" % (metric, labels, h.stats.total))
+                        lines.append("%s_count{%s} %d" % (metric, labels, h.count))
+            lines.append("# TYPE obd_traces_total counter")
+            lines.append("obd_traces_total %d" % self.traces)
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=0, host="127.0.0.1"):
+        """
+            Serves text() over HTTP from a background thread (on any path,
+            ie: http://127.0.0.1:<port>/metrics). Returns the (host, port)
+            the server is bound to.
+        """
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+
+        if self.__server is not None:
+            return self.__server.server_address
+
+        tracer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = tracer.text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self.__server = HTTPServer((host, port), Handler)
+        thread = threading.Thread(target=self.__server.serve_forever, name="obd-metrics")
+        thread.daemon = True
+        thread.start()
+        logger.info("Serving metrics on http://%s:%d/" % self.__server.server_address[:2])
+        return self.__server.server_address
+
+    def stop(self):
+        """ stops the HTTP server """
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
@@ -0,0 +1,523 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# triplog.py                                                           #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+"""
+    Columnar trip logs: the decoded values of an Async stream (or of any
+    OBDResponse), stored with one column per command.
+
+    File layout (little endian):
+
+        header: MAGIC, wall clock start time (double), monotonic start time (double)
+        then blocks of:
+            tag      (4 bytes)  COLUMN, CHUNK or INDEX
+            length   (uint32)   number of bytes of payload
+            payload  (length bytes)
+
+        COLUMN: column id (uint16), type (1 byte), name and unit (each a
+                uint16 length, then UTF-8 text)
+        CHUNK:  column id (uint16), sample count (uint32), the timestamps
+                (doubles, seconds since epoch), then the values: doubles for
+                NUMBER columns (NaN for null responses), or a uint32 length
+                and UTF-8 JSON text for each value of JSON columns
+        INDEX:  chunk count (uint32), then for each chunk: column id
+                (uint16), offset of the CHUNK block (uint64), sample count
+                (uint32), first and last timestamps (doubles)
+
+        trailer (after the INDEX block): offset of the INDEX block (uint64), INDEX_MAGIC
+
+    Samples are buffered per column, and appended a chunk at a time. The
+    INDEX block and trailer are written by close(). Files that weren't
+    closed (a crash, a power cut) are still readable, their blocks are
+    scanned instead. Timestamps are the time at which the adapter's
+    prompt was received, measured on the monotonic clock and anchored to
+    the wall clock at the start of the log.
+"""
+
+import array
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"OBDTRIP\x01"
+INDEX_MAGIC = b"OBDTIDX\x01"
+
+COLUMN = b"COLN"
+CHUNK = b"CHNK"
+INDEX = b"INDX"
+
+NUMBER = b"d"  # column of doubles
+JSON = b"j"  # column of JSON values, for everything else
+
+_HEADER = struct.Struct("<8sdd")
+_BLOCK = struct.Struct("<4sI")
+_COLUMN = struct.Struct("<Hc")
+_CHUNK = struct.Struct("<HI")
+_INDEX_ENTRY = struct.Struct("<HQIdd")
+_TRAILER = struct.Struct("<Q8s")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+
+_SWAP = sys.byteorder != "little"  # array() is in native byte order
+
+
+def _doubles(values):
+    a = array.array("d", values)
+    if _SWAP:
+        a.byteswap()
+    return a.tobytes()
+
+
+def _text(s):
+    s = s.encode("utf-8")
+    return _U16.pack(len(s)) + s
+
+
+def _json_default(o):
+    """ JSON encoding for the objects decoders return (Status, StatusTest, Monitor, VIN bytes...) """
+    if isinstance(o, (bytes, bytearray)):
+        return o.decode("utf-8", "replace")
+    if hasattr(o, "__dict__"):
+        return o.__dict__
+    return str(o)
+
+
+def _value(response):
+    """ returns (type, value) for a response's value """
+    from .UnitsAndScaling import Unit
+
+    v = response.value
+    if isinstance(v, Unit.Quantity):
+        return NUMBER, float(v.magnitude)
+    elif isinstance(v, (bool, int, float)):
+        return NUMBER, float(v)
+    else:
+        return JSON, v
+
+
+class _Column(object):
+    __slots__ = ["id", "name", "type", "unit", "times", "values"]
+
+    def __init__(self, id_, name, type_, unit):
+        self.id = id_
+        self.name = name
+        self.type = type_
+        self.unit = unit
+        self.times = []
+        self.values = []
+
+
+class TripLogWriter(object):
+    """
+        Appends the responses it is given to a trip log. Instances are
+        callable, and can be used as Async callbacks:
+
+            log = TripLogWriter("trip.obdtrip")
+            connection.watch(obd.commands.RPM, callback=log)
+            # or: log.watch(connection, [obd.commands.RPM, ...])
+
+        Samples are buffered in memory, and written chunk_size samples at
+        a time per column. With append=True, samples are added to an
+        existing log.
+    """
+
+    def __init__(self, path, chunk_size=1024, append=False):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.samples = 0  # number of samples added
+        self.__columns = {}  # key = command name, value = _Column
+        self.__index = []  # (column id, offset, count, first time, last time)
+        self.__lock = threading.Lock()
+
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            with TripLog(path) as log:
+                self.start_time = log.start_time
+                self.__start = time.monotonic() - (time.time() - log.start_time)
+                for name in log.columns:
+                    c = log._column(name)
+                    self.__columns[name] = _Column(c.id, name, c.type, c.unit)
+                self.__index = list(log._index)
+                end = log._end
+            self.__file = open(path, "r+b")
+            self.__file.truncate(end)  # drops the previous index and trailer
+            self.__file.seek(end)
+        else:
+            self.start_time = time.time()
+            self.__start = time.monotonic()
+            self.__file = open(path, "wb")
+            self.__file.write(_HEADER.pack(MAGIC, self.start_time, self.__start))
+
+    def __call__(self, response):
+        self.add(response)
+
+    def watch(self, connection, commands, force=False):
+        """ watches the given commands on an Async connection, logging their responses """
+        for c in commands:
+            connection.watch(c, callback=self, force=force)
+
+    def add(self, response):
+        """ records the value of a response """
+        if response.command is None:
+            return
+
+        if response.received_monotonic is not None:
+            t = self.start_time + (response.received_monotonic - self.__start)
+        else:
+            t = response.time
+
+        type_, value = _value(response)
+
+        with self.__lock:
+            if self.__file.closed:
+                return
+
+            column = self.__columns.get(response.command.name)
+            if column is None:
+                if response.value is None:
+                    return  # the column's type is decided by its first value
+                unit = str(response.value.u) if type_ == NUMBER and hasattr(response.value, "u") else ""
+                column = self.__add_column(response.command.name, type_, unit)
+
+            if column.type == NUMBER:
+                if type_ != NUMBER:
+                    value = float("nan")
+            elif response.value is None:
+                return
+
+            column.times.append(t)
+            column.values.append(value)
+            self.samples += 1
+
+            if len(column.times) >= self.chunk_size:
+                self.__write_chunk(column)
+
+    def extend(self, name, times, values, type_=NUMBER, unit=""):
+        """
+            appends already decoded samples to a column: times in seconds
+            since epoch, and values (floats for NUMBER columns, anything
+            JSON can encode for JSON columns)
+        """
+        with self.__lock:
+            if self.__file.closed:
+                return
+
+            column = self.__columns.get(name)
+            if column is None:
+                column = self.__add_column(name, type_, unit)
+            elif column.type != type_:
+                raise ValueError("column %s has type %r, not %r" % (name, column.type, type_))
+
+            i = 0
+            while i < len(times):
+                n = self.chunk_size - len(column.times)
+                column.times.extend(times[i:i + n])
+                column.values.extend(values[i:i + n])
+                i += n
+                if len(column.times) >= self.chunk_size:
+                    self.__write_chunk(column)
+            self.samples += len(times)
+
+    def __add_column(self, name, type_, unit):
+        column = _Column(len(self.__columns), name, type_, unit)
+        self.__columns[name] = column
+
+        payload = _COLUMN.pack(column.id, type_) + _text(name) + _text(unit)
+        self.__file.write(_BLOCK.pack(COLUMN, len(payload)) + payload)
+        return column
+
+    def __write_chunk(self, column):
+        count = len(column.times)
+        if count == 0:
+            return
+
+        if column.type == NUMBER:
+            values = _doubles(column.values)
+        else:
+            values = bytearray()
+            for v in column.values:
+                s = json.dumps(v, default=_json_default).encode("utf-8")
+                values += _U32.pack(len(s)) + s
+
+        payload = _CHUNK.pack(column.id, count) + _doubles(column.times) + bytes(values)
+        offset = self.__file.tell()
+        self.__file.write(_BLOCK.pack(CHUNK, len(payload)) + payload)
+        self.__index.append((column.id, offset, count, column.times[0], column.times[-1]))
+
+        column.times = []
+        column.values = []
+
+    def flush(self):
+        """ writes the buffered samples of every column """
+        with self.__lock:
+            for column in self.__columns.values():
+                self.__write_chunk(column)
+            self.__file.flush()
+
+    def close(self):
+        """ writes the remaining samples and the index """
+        with self.__lock:
+            if self.__file.closed:
+                return
+
+            for column in self.__columns.values():
+                self.__write_chunk(column)
+
+            payload = _U32.pack(len(self.__index)) + \
+                b"".join([_INDEX_ENTRY.pack(*e) for e in self.__index])
+            offset = self.__file.tell()
+            self.__file.write(_BLOCK.pack(INDEX, len(payload)) + payload)
+            self.__file.write(_TRAILER.pack(offset, INDEX_MAGIC))
+            self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class TripLog(object):
+    """
+        Reads a trip log through a memory map.
+
+            with TripLog("trip.obdtrip") as log:
+                log.columns                   # names of the logged commands
+                times, values = log["RPM"]    # arrays of timestamps and values
+                log.to_numpy()                # dict of (times, values) NumPy arrays
+                log.to_pandas()               # DataFrame, one column per command
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__file = open(path, "rb")
+        try:
+            self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.__file.close()
+            raise ValueError("%s is not a trip log (empty)" % path)
+
+        m = self.__map
+        if len(m) < _HEADER.size:
+            self.close()
+            raise ValueError("%s is not a trip log (too short)" % path)
+
+        magic, self.start_time, self.start_monotonic = _HEADER.unpack_from(m, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("%s is not a trip log (bad magic)" % path)
+
+        self.__columns = {}  # key = name, value = _Column
+        self.__by_id = {}  # key = column id, value = _Column
+        self._index = []  # (column id, offset, count, first time, last time)
+        self._end = None  # offset at which a writer may append blocks
+        self.__scan()
+
+    def __scan(self):
+        """ reads the column definitions, and the index (or rebuilds it) """
+        m = self.__map
+        index_offset = None
+        if len(m) >= _HEADER.size + _TRAILER.size:
+            offset, magic = _TRAILER.unpack_from(m, len(m) - _TRAILER.size)
+            if magic == INDEX_MAGIC:
+                index_offset = offset
+
+        offset = _HEADER.size
+        while offset + _BLOCK.size <= len(m):
+            tag, length = _BLOCK.unpack_from(m, offset)
+            start = offset + _BLOCK.size
+            if start + length > len(m):
+                logger.warning("%s ends with a truncated block" % self.path)
+                break
+
+            if tag == COLUMN:
+                id_, type_ = _COLUMN.unpack_from(m, start)
+                p = start + _COLUMN.size
+                name, p = self.__read_text(p)
+                unit, p = self.__read_text(p)
+                column = _Column(id_, name, type_, unit)
+                self.__columns[name] = column
+                self.__by_id[id_] = column
+            elif tag == CHUNK:
+                if index_offset is None:
+                    id_, count = _CHUNK.unpack_from(m, start)
+                    times = start + _CHUNK.size
+                    first = struct.unpack_from("<d", m, times)[0]
+                    last = struct.unpack_from("<d", m, times + 8 * (count - 1))[0]
+                    self._index.append((id_, offset, count, first, last))
+            elif tag == INDEX:
+                if offset == index_offset:
+                    (n,) = _U32.unpack_from(m, start)
+                    self._index = [_INDEX_ENTRY.unpack_from(m, start + 4 + i * _INDEX_ENTRY.size)
+                                   for i in range(n)]
+                    self._end = offset
+                    return
+            else:
+                logger.warning("%s has an unknown block %r" % (self.path, tag))
+                break
+
+            if (index_offset is not None) and (start + length > index_offset):
+                break
+            offset = start + length
+
+        self._end = offset
+
+    def __read_text(self, offset):
+        (n,) = _U16.unpack_from(self.__map, offset)
+        offset += 2
+        return bytes(self.__map[offset:offset + n]).decode("utf-8"), offset + n
+
+    @property
+    def columns(self):
+        """ names of the logged commands, in the order they first appeared """
+        return [c.name for c in sorted(self.__columns.values(), key=lambda c: c.id)]
+
+    def _column(self, name):
+        if name not in self.__columns:
+            raise KeyError(name)
+        return self.__columns[name]
+
+    def unit(self, name):
+        """ the unit of a NUMBER column (as given by Pint), or "" """
+        return self._column(name).unit
+
+    def count(self, name):
+        """ number of samples in a column """
+        column = self._column(name)
+        return sum([e[2] for e in self._index if e[0] == column.id])
+
+    def chunks(self, name, start=None, end=None):
+        """
+            returns the index entries (column id, offset, count, first time,
+            last time) of a column, optionally only the chunks overlapping
+            the given time range
+        """
+        column = self._column(name)
+        return [e for e in self._index if e[0] == column.id and
+                (start is None or e[4] >= start) and (end is None or e[3] <= end)]
+
+    def __chunk(self, entry):
+        """ returns (times offset, values offset, count) of a chunk """
+        _, offset, count, _, _ = entry
+        times = offset + _BLOCK.size + _CHUNK.size
+        return times, times + 8 * count, count
+
+    def __doubles(self, offset, count):
+        a = array.array("d")
+        a.frombytes(self.__map[offset:offset + 8 * count])
+        if _SWAP:
+            a.byteswap()
+        return a
+
+    def __json(self, offset, count):
+        values = []
+        for _ in range(count):
+            (n,) = _U32.unpack_from(self.__map, offset)
+            values.append(json.loads(bytes(self.__map[offset + 4:offset + 4 + n]).decode("utf-8")))
+            offset += 4 + n
+        return values
+
+    def __getitem__(self, name):
+        """ returns (times, values) of a column, as an array of doubles and an array or list """
+        column = self._column(name)
+        times = array.array("d")
+        values = array.array("d") if column.type == NUMBER else []
+        for entry in self.chunks(name):
+            t, v, count = self.__chunk(entry)
+            times.extend(self.__doubles(t, count))
+            if column.type == NUMBER:
+                values.extend(self.__doubles(v, count))
+            else:
+                values.extend(self.__json(v, count))
+        return times, values
+
+    def numpy(self, name):
+        """ returns (times, values) of a column as NumPy arrays, read straight from the map """
+        import numpy as np
+
+        column = self._column(name)
+        times = []
+        values = []
+        for entry in self.chunks(name):
+            t, v, count = self.__chunk(entry)
+            times.append(np.frombuffer(self.__map, dtype="<f8", count=count, offset=t))
+            if column.type == NUMBER:
+                values.append(np.frombuffer(self.__map, dtype="<f8", count=count, offset=v))
+            else:
+                values.append(np.array(self.__json(v, count) + [None], dtype=object)[:-1])
+
+        if not times:
+            return np.empty(0, dtype="<f8"), np.empty(0, dtype="<f8" if column.type == NUMBER else object)
+        return np.concatenate(times), np.concatenate(values)
+
+    def to_numpy(self):
+        """ returns a dict of (times, values) NumPy arrays, keyed by command name """
+        return dict((name, self.numpy(name)) for name in self.columns)
+
+    def series(self, name):
+        """ returns a column as a pandas Series, indexed by UTC timestamps """
+        import pandas as pd
+
+        times, values = self.numpy(name)
+        index = pd.to_datetime(times, unit="s", utc=True)
+        return pd.Series(values, index=index, name=name)
+
+    def to_pandas(self):
+        """ returns a DataFrame with one column per command, joined on the timestamps """
+        import pandas as pd
+
+        series = [self.series(name) for name in self.columns]
+        if not series:
+            return pd.DataFrame()
+        return pd.concat(series, axis=1).sort_index()
+
+    def close(self):
+        if self.__map is not None:
+            try:
+                self.__map.close()
+            except BufferError:
+                pass  # arrays from numpy() still point into the map, it's closed once they're gone
+            self.__map = None
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# uds.py                                                               #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+"""
+    UDS (ISO 14229) ReadDataByIdentifier, service 0x22
+
+    Manufacturer specific signals are read by 16 bit data identifiers
+    (DIDs). Several DIDs can be read with a single request:
+
+        -> 22 02 8C 04 4A
+        <- 62 02 8C C8 04 4A 01 F4
+
+    and the response is split back into one value per DID. DIDs are
+    described by a table of DID objects, giving the length of their data
+    and its decoder: a UAS object (the signed/scale/unit/offset scalings
+    of Mode 06), or any function taking the data bytes.
+
+        DIDS = [
+            #    name           description                  DID     bytes  decoder
+            DID("BATTERY_SOC", "Battery state of charge"   , 0x028C, 1,     UAS(False, 0.5, Unit.percent)),
+            DID("DPF_LOAD"   , "Particulate filter load"   , 0x044A, 2,     UAS(False, 0.01, Unit.gram)),
+        ]
+
+        commands.add_dids(DIDS)             # commands.BATTERY_SOC, commands[0x22][0x028C]
+        for c in batch(DIDS):               # as few requests as possible
+            connection.query(c, force=True).value  # {"BATTERY_SOC": ..., "DPF_LOAD": ...}
+
+    Tables can also be loaded from CSV files, see load_dids().
+"""
+
+import csv
+import logging
+
+from .OBDCommand import OBDCommand
+from .OBDResponse import OBDResponse
+from .UnitsAndScaling import Unit, UAS
+from .protocols import ECU, ECU_HEADER
+
+logger = logging.getLogger(__name__)
+
+
+READ_DATA_BY_IDENTIFIER = 0x22
+POSITIVE_RESPONSE = 0x40  # added to the SID
+NEGATIVE_RESPONSE = 0x7F
+
+# the negative response codes most often met when reading DIDs
+NRC = {
+    0x10: "general reject",
+    0x11: "service not supported",
+    0x13: "incorrect message length or invalid format",
+    0x14: "response too long",
+    0x22: "conditions not correct",
+    0x31: "request out of range",
+    0x33: "security access denied",
+    0x78: "response pending",
+    0x7F: "service not supported in active session",
+}
+
+# an ELM327 sends single frames only: 7 bytes, the SID and 3 DIDs
+MAX_DIDS = 3
+
+
+def text(data):
+    """ decodes ASCII data (part numbers, VINs...) """
+    return bytes(data).rstrip(b"\x00 ").decode("ascii", "replace")
+
+
+def raw(data):
+    return bytes(data)
+
+
+class DID(object):
+    """
+        A data identifier: its name, 16 bit number, the length of its data
+        in bytes, and the decoder of that data (defaults to raw bytes)
+    """
+
+    def __init__(self, name, desc, did, length, decoder=raw):
+        self.name = name
+        self.desc = desc
+        self.did = did
+        self.length = length
+        self.decode = decoder
+
+    def __repr__(self):
+        return "DID(%r, %r, 0x%04X, %d)" % (self.name, self.desc, self.did, self.length)
+
+
+def load_dids(path):
+    """
+        Reads a table of DIDs from a CSV file, with the columns:
+
+            name, description, did, bytes, signed, scale, offset, unit
+
+        did is in hex, signed is 0 or 1, and unit is any unit known to
+        obd.Unit (degC, percent, volt, kilometer...). The unit can also
+        be "text" or "raw", for data that isn't scaled.
+    """
+    dids = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f, skipinitialspace=True):
+            unit = (row.get("unit") or "count").strip()
+            if unit == "text":
+                decoder = text
+            elif unit == "raw":
+                decoder = raw
+            else:
+                decoder = UAS(bool(int(row.get("signed") or 0)),
+                              float(row.get("scale") or 1),
+                              Unit.Unit(unit),
+                              float(row.get("offset") or 0))
+            dids.append(DID(row["name"].strip(),
+                            (row.get("description") or "").strip(),
+                            int(row["did"], 16),
+                            int(row["bytes"]),
+                            decoder))
+    return dids
+
+
+def split_response(data, dids):
+    """
+        Splits the data of a positive response (starting with 0x62) into
+        a dict of data bytes, keyed by DID number. ECUs may answer the DIDs
+        in any order, and leave out the ones they don't support.
+    """
+    lengths = dict((d.did, d.length) for d in dids)
+    found = {}
+    i = 1
+    while i + 2 <= len(data):
+        did = (data[i] << 8) | data[i + 1]
+        if did not in lengths:
+            logger.info("Unexpected DID in the response: %04X", did)
+            break
+        found[did] = data[i + 2:i + 2 + lengths[did]]
+        if len(found[did]) < lengths[did]:
+            logger.info("DID %04X is truncated", did)
+            del found[did]
+            break
+        i += 2 + lengths[did]
+    return found
+
+
+def negative_response(messages, sid=READ_DATA_BY_IDENTIFIER):
+    """ returns the code of the first negative response to the given service, or None """
+    for m in messages:
+        if (len(m.data) >= 3) and (m.data[0] == NEGATIVE_RESPONSE) and \
+                (m.data[1] == sid) and (m.data[2] != 0x78):
+            return m.data[2]
+    return None
+
+
+class ReadDataByIdentifier(OBDCommand):
+    """
+        An OBDCommand reading one or several DIDs in a single request. The
+        value is the decoded value of a single DID, and a dict of values,
+        keyed by DID name, for several.
+    """
+
+    def __init__(self, dids, name=None, header=ECU_HEADER.ENGINE, ecu=ECU.ALL):
+        if isinstance(dids, DID):
+            dids = [dids]
+        self.dids = tuple(dids)
+        if not self.dids:
+            raise ValueError("ReadDataByIdentifier needs at least one DID")
+
+        command = b"22" + b"".join([("%04X" % d.did).encode() for d in self.dids])
+        if name is None:
+            name = "_".join([d.name for d in self.dids])
+        if len(self.dids) == 1:
+            desc = self.dids[0].desc
+        else:
+            desc = "Read " + ", ".join([d.name for d in self.dids])
+
+        super(ReadDataByIdentifier, self).__init__(name, desc, command, 0, self.__decode,
+                                                   ecu, True, header)
+
+    def clone(self):
+        return ReadDataByIdentifier(self.dids, self.name, self.header, self.ecu)
+
+    def __decode(self, messages):
+        for m in messages:
+            if m.data and (m.data[0] == READ_DATA_BY_IDENTIFIER + POSITIVE_RESPONSE):
+                found = split_response(m.data, self.dids)
+                values = dict((d.name, d.decode(found[d.did]))
+                              for d in self.dids if d.did in found)
+                if len(self.dids) == 1:
+                    return values.get(self.dids[0].name)
+                return values
+
+        nrc = negative_response(messages)
+        if nrc is not None:
+            logger.info("%s: negative response %02X (%s)", self.name, nrc, NRC.get(nrc, "unknown"))
+        return None
+
+    def split(self, response):
+        """
+            Splits a response to this command into one OBDResponse per DID,
+            keyed by the single DID command of that DID (see read_did())
+        """
+        responses = {}
+        values = response.value
+        if len(self.dids) == 1:
+            values = {self.dids[0].name: values} if values is not None else {}
+
+        for d in self.dids:
+            r = derived_response(read_did(d, self.header, self.ecu), response,
+                                 (values or {}).get(d.name))
+            responses[r.command] = r
+        return responses
+
+
+def derived_response(command, response, value):
+    """ returns a response to the given command, with the messages and timing of another response """
+    r = OBDResponse(command, response.messages)
+    r.value = value
+    r.time = response.time
+    r.sent_monotonic = response.sent_monotonic
+    r.sent_time = response.sent_time
+    r.received_monotonic = response.received_monotonic
+    r.received_time = response.received_time
+    return r
+
+
+def read_did(did, header=ECU_HEADER.ENGINE, ecu=ECU.ALL):
+    """ returns the command reading a single DID """
+    return ReadDataByIdentifier([did], did.name, header, ecu)
+
+
+def batch(dids, max_dids=MAX_DIDS):
+    """
+        Groups the given DIDs, or single DID commands, into as few
+        ReadDataByIdentifier commands as possible, of at most max_dids
+        DIDs each. Commands are grouped by header; DIDs use the engine's.
+    """
+    groups = {}  # key = (header, ecu), value = list of DIDs
+    for d in dids:
+        if isinstance(d, ReadDataByIdentifier):
+            groups.setdefault((d.header, d.ecu), []).extend(d.dids)
+        else:
+            groups.setdefault((ECU_HEADER.ENGINE, ECU.ALL), []).append(d)
+
+    batches = []
+    for (header, ecu), group in groups.items():
+        for i in range(0, len(group), max_dids):
+            batches.append(ReadDataByIdentifier(group[i:i + max_dids], header=header, ecu=ecu))
+    return batches
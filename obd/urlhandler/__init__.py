@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# urlhandler/__init__.py                                               #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+
+"""
+    pyserial URL handlers provided by python-OBD
+
+    This package is added to serial.protocol_handler_packages when obd is
+    imported, so these URLs can be passed anywhere a port name is accepted:
+
+        record://<file>?port=<port or URL>    records a transcript of the traffic
+        replay://<file>[?timing=fast|original][&strict=1]
+                                              plays a transcript back
+        emulator://[<name>][?protocol=6&latency=0...]
+                                              talks to an emulated adapter
+        tcp://<host>:<port>[?connect_timeout=3&read_timeout=1...]
+                                              talks to a WiFi adapter, with
+                                              tuned socket options
+"""
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# urlhandler/buffer.py                                                 #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+
+import collections
+import time
+
+
+class ScheduledBuffer(object):
+    """
+        Input buffer for the simulated ports. Chunks of bytes are queued
+        with the (monotonic) time at which they become readable, which is
+        how these ports reproduce the delays of a real adapter.
+    """
+
+    def __init__(self):
+        self.__chunks = collections.deque()  # [due time, data]
+
+    def push(self, data, due=None):
+        """ queues data, to be readable at the given time (default: now) """
+        if data:
+            self.__chunks.append([time.monotonic() if due is None else due, bytes(data)])
+
+    def available(self):
+        """ number of bytes that can be read without waiting """
+        now = time.monotonic()
+        return sum([len(d) for due, d in self.__chunks if due <= now])
+
+    def clear(self):
+        self.__chunks.clear()
+
+    def __len__(self):
+        """ number of bytes queued, including the ones that aren't due yet """
+        return sum([len(d) for due, d in self.__chunks])
+
+    def read(self, size, timeout):
+        """
+            Returns up to size bytes. Waits (at most timeout seconds, None
+            for no limit) for the first chunk to become readable, but
+            returns early with what it has rather than wait for more.
+        """
+        data = bytearray()
+        while len(data) < size and self.__chunks:
+            due, chunk = self.__chunks[0]
+
+            wait = due - time.monotonic()
+            if wait > 0:
+                if data:
+                    break
+                if (timeout is not None) and (wait > timeout):
+                    time.sleep(timeout)
+                    break
+                time.sleep(wait)
+
+            n = size - len(data)
+            data += chunk[:n]
+            if n >= len(chunk):
+                self.__chunks.popleft()
+            else:
+                self.__chunks[0][1] = chunk[n:]
+
+        return bytes(data)
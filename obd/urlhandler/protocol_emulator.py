@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# urlhandler/protocol_emulator.py                                      #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+
+import time
+
+try:
+    import urlparse
+except ImportError:
+    import urllib.parse as urlparse
+
+from serial.serialutil import SerialBase, SerialException, PortNotOpenError
+
+from obd.emulator import Emulator, default_ecus, get_emulator
+from .buffer import ScheduledBuffer
+
+
+class Serial(SerialBase):
+    """
+        Serial port connected to an emulated adapter (see obd/emulator.py).
+
+            emulator://[<name>][?protocol=6&ecus=2&latency=0&jitter=0&timeout=0.2
+                                 &no_data_rate=0&disconnect_after=N&seed=N&stn=<firmware>]
+
+        A name refers to an Emulator registered under that name, and is
+        created with the given options if there isn't one. Without a name,
+        every port gets a new emulator. The emulator is available as the
+        port's "emulator" attribute.
+
+        While the emulator is disconnected, opening, reading or writing the
+        port raises a SerialException.
+    """
+
+    OPTIONS = {
+        "protocol": str,
+        "ecus": int,
+        "latency": float,
+        "jitter": float,
+        "frame_time": float,
+        "timeout": float,
+        "no_data_rate": float,
+        "disconnect_after": int,
+        "voltage": float,
+        "seed": int,
+        "stn": str,
+    }
+
+    def __init__(self, *args, **kwargs):
+        self.emulator = None
+        self.__pending = ScheduledBuffer()  # the bytes to be read
+        super(Serial, self).__init__(*args, **kwargs)
+
+    def open(self):
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+
+        self.emulator = self.from_url(self.port)
+        if self.emulator.offline:
+            raise SerialException("Emulated adapter is disconnected")
+
+        self.__pending.clear()
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+        super(Serial, self).close()
+
+    def from_url(self, url):
+        """ returns the emulator for the given URL """
+        parts = urlparse.urlsplit(url)
+        if parts.scheme != "emulator":
+            raise SerialException("expected a string in the form "
+                                  "\"emulator://[<name>][?protocol=6&latency=0...]\": "
+                                  "not starting with emulator:// (%r)" % parts.scheme)
+
+        options = {}
+        for option, values in urlparse.parse_qs(parts.query, True).items():
+            if option not in self.OPTIONS:
+                raise SerialException("unknown option: %r" % option)
+            try:
+                options[option] = self.OPTIONS[option](values[0])
+            except ValueError:
+                raise SerialException("invalid value for %s: %r" % (option, values[0]))
+
+        name = (parts.netloc + parts.path) or None
+        if name is not None:
+            emulator = get_emulator(name)
+            if emulator is not None:
+                return emulator
+
+        protocol = options.get("protocol", "6").upper()
+        try:
+            options["ecus"] = default_ecus(protocol, options.get("ecus", 2))
+            return Emulator(name=name, **options)
+        except ValueError as e:
+            raise SerialException(str(e))
+
+    def _reconfigure_port(self):
+        pass  # nothing to configure
+
+    def __check(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        if self.emulator.offline:
+            raise SerialException("Emulated adapter is disconnected")
+
+    @property
+    def in_waiting(self):
+        self.__check()
+        self.__pending.push(self.emulator.monitor_output())
+        return self.__pending.available()
+
+    def read(self, size=1):
+        self.__check()
+        self.__pending.push(self.emulator.monitor_output())
+        return self.__pending.read(size, self._timeout)
+
+    def write(self, data):
+        self.__check()
+
+        now = time.monotonic()
+        chunks = self.emulator.feed(bytes(data))
+        if chunks is None:
+            raise SerialException("Emulated adapter is disconnected")
+
+        for offset, chunk in chunks:
+            self.__pending.push(chunk, now + offset)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self.__check()
+        self.__pending.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def _update_break_state(self):
+        pass
+
+    def _update_rts_state(self):
+        pass
+
+    def _update_dtr_state(self):
+        pass
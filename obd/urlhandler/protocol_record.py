@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# urlhandler/protocol_record.py                                        #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+
+import logging
+
+try:
+    import urlparse
+except ImportError:
+    import urllib.parse as urlparse
+
+import serial
+from serial.serialutil import SerialBase, SerialException, PortNotOpenError
+
+from obd.recording import RecordWriter, WRITE, READ
+
+logger = logging.getLogger(__name__)
+
+
+class Serial(SerialBase):
+    """
+        Serial port that passes everything through to another port, while
+        recording every write, and every chunk of received bytes into an
+        OBD transcript (see obd/recording.py).
+
+            record://<file>?port=<port or URL>
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.__inner = None
+        self.__writer = None
+        super(Serial, self).__init__(*args, **kwargs)
+
+    def open(self):
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+
+        path, port = self.from_url(self.port)
+
+        self.__inner = serial.serial_for_url(port,
+                                             baudrate=self._baudrate,
+                                             bytesize=self._bytesize,
+                                             parity=self._parity,
+                                             stopbits=self._stopbits,
+                                             timeout=self._timeout,
+                                             write_timeout=self._write_timeout)
+        self.__writer = RecordWriter(path)
+        logger.info("Recording traffic of %s to %s" % (port, path))
+        self.is_open = True
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self.__inner.close()
+            self.__writer.close()
+        super(Serial, self).close()
+
+    @staticmethod
+    def from_url(url):
+        """ returns the (transcript path, wrapped port) given in the URL """
+        parts = urlparse.urlsplit(url)
+        if parts.scheme != "record":
+            raise SerialException("expected a string in the form "
+                                  "\"record://<file>?port=<port>\": not starting "
+                                  "with record:// (%r)" % parts.scheme)
+
+        path = parts.netloc + parts.path
+        options = urlparse.parse_qs(parts.query, True)
+        if not path or "port" not in options:
+            raise SerialException("expected a string in the form "
+                                  "\"record://<file>?port=<port>\": %r" % url)
+
+        return path, options["port"][0]
+
+    def _reconfigure_port(self):
+        if self.__inner is not None:
+            self.__inner.baudrate = self._baudrate
+            self.__inner.timeout = self._timeout
+            self.__inner.write_timeout = self._write_timeout
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        return self.__inner.in_waiting
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise PortNotOpenError()
+        data = self.__inner.read(size)
+        if data:
+            self.__writer.write(READ, data)
+        return data
+
+    def write(self, data):
+        if not self.is_open:
+            raise PortNotOpenError()
+        self.__writer.write(WRITE, data)
+        return self.__inner.write(data)
+
+    def flush(self):
+        if not self.is_open:
+            return  # also called by io's close()
+        self.__inner.flush()
+        self.__writer.flush()
+
+    def reset_input_buffer(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        self.__inner.reset_input_buffer()
+
+    def reset_output_buffer(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        self.__inner.reset_output_buffer()
+
+    def fileno(self):
+        return self.__inner.fileno()
+
+    def _update_break_state(self):
+        self.__inner.break_condition = self._break_state
+
+    def _update_rts_state(self):
+        self.__inner.rts = self._rts_state
+
+    def _update_dtr_state(self):
+        self.__inner.dtr = self._dtr_state
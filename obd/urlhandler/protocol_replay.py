@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# urlhandler/protocol_replay.py                                        #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+
+import logging
+import time
+
+try:
+    import urlparse
+except ImportError:
+    import urllib.parse as urlparse
+
+from serial.serialutil import SerialBase, SerialException, PortNotOpenError
+
+from obd.recording import read_records, transactions
+from .buffer import ScheduledBuffer
+
+logger = logging.getLogger(__name__)
+
+
+class Serial(SerialBase):
+    """
+        Serial port that plays back an OBD transcript (see obd/recording.py).
+
+            replay://<file>[?timing=fast|original][&strict=1]
+
+        Every write() is matched with the next recorded write, and the bytes
+        that were received after it are made available to read(). With
+        timing=original, the bytes arrive with the same delays as they did
+        during the recording. The default (timing=fast) delivers them at
+        once, and read() never waits once the transcript runs dry.
+
+        When a write doesn't match the next recorded write, the transcript is
+        searched forward for a matching one. With strict=1, a mismatch raises
+        a SerialException instead.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.__transactions = []
+        self.__position = 0  # index of the next transaction to replay
+        self.__pending = ScheduledBuffer()  # the bytes to be read
+        self.original_timing = False
+        self.strict = False
+        super(Serial, self).__init__(*args, **kwargs)
+
+    def open(self):
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+
+        path = self.from_url(self.port)
+        try:
+            _, records = read_records(path)
+        except (IOError, OSError, ValueError) as e:
+            raise SerialException("Could not open transcript: %s" % e)
+
+        self.__transactions = transactions(records)
+        self.__position = 0
+        self.__pending.clear()
+
+        # anything received before the first write (boot messages, etc...)
+        if self.__transactions and self.__transactions[0][0] is None:
+            self.__queue(self.__transactions[0])
+            self.__position = 1
+
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+        super(Serial, self).close()
+
+    def from_url(self, url):
+        """ returns the transcript path, and applies the options given in the URL """
+        parts = urlparse.urlsplit(url)
+        if parts.scheme != "replay":
+            raise SerialException("expected a string in the form "
+                                  "\"replay://<file>[?timing=fast|original][&strict=1]\": "
+                                  "not starting with replay:// (%r)" % parts.scheme)
+
+        for option, values in urlparse.parse_qs(parts.query, True).items():
+            if option == "timing":
+                if values[0] not in ["fast", "original"]:
+                    raise SerialException("unknown timing: %r" % values[0])
+                self.original_timing = values[0] == "original"
+            elif option == "strict":
+                self.strict = values[0] not in ["", "0", "false"]
+            else:
+                raise SerialException("unknown option: %r" % option)
+
+        return parts.netloc + parts.path
+
+    def _reconfigure_port(self):
+        pass  # nothing to configure
+
+    @property
+    def remaining(self):
+        """ number of recorded writes that haven't been replayed """
+        return len(self.__transactions) - self.__position
+
+    def __queue(self, transaction):
+        """ makes the reads of a transaction available, relative to now """
+        w, reads = transaction
+        now = time.monotonic()
+        t0 = w.time if w is not None else 0.0
+        for r in reads:
+            self.__pending.push(r.data, now + (r.time - t0) if self.original_timing else now)
+
+    def __find(self, data):
+        """ returns the index of the next transaction written with the given data, or None """
+        for i in range(self.__position, len(self.__transactions)):
+            if self.__transactions[i][0].data == data:
+                return i
+        return None
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        return self.__pending.available()
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise PortNotOpenError()
+        return self.__pending.read(size, self._timeout)
+
+    def write(self, data):
+        if not self.is_open:
+            raise PortNotOpenError()
+
+        data = bytes(data)
+        i = self.__find(data) if not self.strict else self.__position
+
+        if (i is None) or (i >= len(self.__transactions)) or \
+           (self.__transactions[i][0].data != data):
+            if self.strict:
+                raise SerialException("Write %r does not match the transcript" % data)
+            logger.warning("Write %r not found in the transcript" % data)
+            return len(data)
+
+        if i != self.__position:
+            logger.debug("Skipped %d recorded writes" % (i - self.__position))
+
+        self.__queue(self.__transactions[i])
+        self.__position = i + 1
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        self.__pending.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def _update_break_state(self):
+        pass
+
+    def _update_rts_state(self):
+        pass
+
+    def _update_dtr_state(self):
+        pass
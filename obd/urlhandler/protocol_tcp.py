@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+
+########################################################################
+#                                                                      #
+# python-OBD: A python OBD-II serial module derived from pyobd         #
+#                                                                      #
+# Copyright 2004 Donour Sizemore (donour@uchicago.edu)                 #
+# Copyright 2009 Secons Ltd. (www.obdtester.com)                       #
+# Copyright 2009 Peter J. Creath                                       #
+# Copyright 2016 Brendan Whitfield (brendan-w.com)                     #
+#                                                                      #
+########################################################################
+#                                                                      #
+# urlhandler/protocol_tcp.py                                           #
+#                                                                      #
+# This file is part of python-OBD (a derivative of pyOBD)              #
+#                                                                      #
+# python-OBD is free software: you can redistribute it and/or modify   #
+# it under the terms of the GNU General Public License as published by #
+# the Free Software Foundation, either version 2 of the License, or    #
+# (at your option) any later version.                                  #
+#                                                                      #
+# python-OBD is distributed in the hope that it will be useful,        #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        #
+# GNU General Public License for more details.                         #
+#                                                                      #
+# You should have received a copy of the GNU General Public License    #
+# along with python-OBD.  If not, see <http://www.gnu.org/licenses/>.  #
+#                                                                      #
+########################################################################
+
+
+import logging
+import select
+import socket
+import time
+
+try:
+    import urlparse
+except ImportError:
+    import urllib.parse as urlparse
+
+from serial.serialutil import SerialBase, SerialException, PortNotOpenError
+
+logger = logging.getLogger(__name__)
+
+_listeners = []  # functions taking (event, port), see add_listener()
+
+
+def add_listener(fn):
+    """
+        Calls fn(event, port) when a tcp:// port connects ("connect"),
+        loses its connection ("disconnect"), or connects again on its own
+        ("reconnect"). The port's last_error holds the reason of a
+        disconnection. Listeners are called from the thread using the port.
+    """
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def remove_listener(fn):
+    if fn in _listeners:
+        _listeners.remove(fn)
+
+
+def _notify(event, port):
+    for fn in list(_listeners):
+        try:
+            fn(event, port)
+        except Exception as e:
+            logger.exception("tcp:// listener %r failed: %s" % (fn, e))
+
+
+class Serial(SerialBase):
+    """
+        Serial port for adapters reached over TCP (WiFi ELM327 dongles),
+        with socket options tuned for short request/response exchanges:
+
+            tcp://<host>:<port>[?connect_timeout=3&read_timeout=<seconds>
+                                &nodelay=1&quickack=1&rcvbuf=16384
+                                &keepalive=1&keepidle=2&keepintvl=1&keepcnt=3
+                                &user_timeout=5&reconnect=0]
+
+        nodelay       disables Nagle's algorithm, so commands leave at once
+        quickack      ACKs every read at once, instead of delaying the ACKs
+                      that the adapter's own Nagle algorithm waits for (Linux)
+        rcvbuf        size of the receive buffer, in bytes (0 = the OS default)
+        keepalive     probes idle connections: keepidle seconds of silence,
+        keepidle...   then keepcnt probes keepintvl seconds apart
+        user_timeout  seconds that written data may stay unacknowledged
+                      before the connection is declared dead (Linux)
+        read_timeout  replaces the read timeout asked for by the caller
+                      (10 s for the ELM327 class)
+        reconnect     number of attempts to connect again, when writing to
+                      a connection that was lost (WiFi adapters keep their
+                      state across TCP connections)
+
+        A lost connection raises a SerialException on the next read or
+        write, and the listeners (see add_listener()) are notified.
+    """
+
+    OPTIONS = {
+        "connect_timeout": float,
+        "read_timeout": float,
+        "nodelay": int,
+        "quickack": int,
+        "rcvbuf": int,
+        "keepalive": int,
+        "keepidle": int,
+        "keepintvl": int,
+        "keepcnt": int,
+        "user_timeout": float,
+        "reconnect": int,
+    }
+
+    DEFAULTS = {
+        "connect_timeout": 3.0,
+        "read_timeout": None,
+        "nodelay": 1,
+        "quickack": 1,
+        "rcvbuf": 16384,
+        "keepalive": 1,
+        "keepidle": 2,
+        "keepintvl": 1,
+        "keepcnt": 3,
+        "user_timeout": 5.0,
+        "reconnect": 0,
+    }
+
+    def __init__(self, *args, **kwargs):
+        self.__socket = None
+        self.__buffer = bytearray()
+        self.address = None  # (host, port)
+        self.options = dict(self.DEFAULTS)
+        self.connects = 0  # number of successful connections
+        self.last_error = None  # reason of the last disconnection
+        super(Serial, self).__init__(*args, **kwargs)
+
+    def open(self):
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+
+        self.address, options = self.from_url(self.port)
+        self.options.update(options)
+        self.__connect()
+        self.is_open = True
+        _notify("connect", self)
+
+    def __connect(self):
+        o = self.options
+        try:
+            sock = socket.create_connection(self.address, timeout=o["connect_timeout"])
+        except (OSError, socket.error) as e:
+            raise SerialException("Could not connect to %s:%d: %s" % (self.address + (e,)))
+
+        def option(level, name, value):
+            if hasattr(socket, name):  # some are Linux only
+                try:
+                    sock.setsockopt(level, getattr(socket, name), value)
+                except (OSError, socket.error) as e:
+                    logger.debug("Failed to set %s: %s" % (name, e))
+
+        if o["nodelay"]:
+            option(socket.IPPROTO_TCP, "TCP_NODELAY", 1)
+        if o["rcvbuf"]:
+            option(socket.SOL_SOCKET, "SO_RCVBUF", o["rcvbuf"])
+        if o["keepalive"]:
+            option(socket.SOL_SOCKET, "SO_KEEPALIVE", 1)
+            option(socket.IPPROTO_TCP, "TCP_KEEPIDLE", o["keepidle"])
+            option(socket.IPPROTO_TCP, "TCP_KEEPINTVL", o["keepintvl"])
+            option(socket.IPPROTO_TCP, "TCP_KEEPCNT", o["keepcnt"])
+        if o["user_timeout"]:
+            option(socket.IPPROTO_TCP, "TCP_USER_TIMEOUT", int(o["user_timeout"] * 1000))
+        sock.setblocking(False)
+
+        self.__socket = sock
+        self.__buffer = bytearray()
+        self.connects += 1
+        logger.info("Connected to %s:%d" % self.address)
+
+    def __drop(self, error):
+        """ drops a dead connection """
+        logger.warning("Connection to %s:%d lost: %s" % (self.address + (error,)))
+        self.last_error = error
+        if self.__socket is not None:
+            self.__socket.close()
+            self.__socket = None
+            _notify("disconnect", self)
+
+    def __lost(self, error):
+        """ drops a dead connection, and raises the error """
+        self.__drop(error)
+        raise SerialException("Connection to %s:%d lost: %s" % (self.address + (error,)))
+
+    def __reconnect(self):
+        """ connects again after a lost connection, if allowed """
+        for i in range(self.options["reconnect"]):
+            try:
+                self.__connect()
+            except SerialException as e:
+                logger.info("Reconnect attempt %d failed: %s" % (i + 1, e))
+                time.sleep(min(0.1 * 2 ** i, 2.0))
+                continue
+            _notify("reconnect", self)
+            return True
+        return False
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            if self.__socket is not None:
+                try:
+                    self.__socket.shutdown(socket.SHUT_RDWR)
+                except (OSError, socket.error):
+                    pass
+                self.__socket.close()
+                self.__socket = None
+        super(Serial, self).close()
+
+    @classmethod
+    def from_url(cls, url):
+        """ returns the ((host, port), options) given in the URL """
+        parts = urlparse.urlsplit(url)
+        if parts.scheme != "tcp":
+            raise SerialException("expected a string in the form "
+                                  "\"tcp://<host>:<port>[?option=value...]\": not starting "
+                                  "with tcp:// (%r)" % parts.scheme)
+        try:
+            address = (parts.hostname, parts.port)
+        except ValueError:
+            address = (None, None)
+        if not address[0] or not address[1]:
+            raise SerialException("expected a string in the form "
+                                  "\"tcp://<host>:<port>[?option=value...]\": %r" % url)
+
+        options = {}
+        for key, values in urlparse.parse_qs(parts.query, True).items():
+            if key not in cls.OPTIONS:
+                raise SerialException("unknown option %r in %r" % (key, url))
+            try:
+                options[key] = cls.OPTIONS[key](values[0])
+            except ValueError:
+                raise SerialException("bad value for %r in %r" % (key, url))
+        return address, options
+
+    def _reconfigure_port(self):
+        pass  # baudrates and the like don't apply
+
+    def __timeout(self):
+        t = self.options["read_timeout"]
+        return self._timeout if t is None else t
+
+    def __fill(self, timeout):
+        """ receives what the socket has, waiting up to timeout (None = forever) for something """
+        if self.__socket is None:
+            self.__lost("not connected")
+        try:
+            readable, _, _ = select.select([self.__socket], [], [], timeout)
+            if not readable:
+                return
+            data = self.__socket.recv(4096)
+        except (OSError, socket.error) as e:
+            self.__lost(e)
+        if not data:
+            self.__lost("closed by the adapter")
+        self.__buffer += data
+        if self.options["quickack"] and hasattr(socket, "TCP_QUICKACK"):
+            # quick ACK mode isn't permanent, set it again after each read
+            self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        if self.__socket is not None:
+            self.__fill(0)
+        return len(self.__buffer)
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise PortNotOpenError()
+        timeout = self.__timeout()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(self.__buffer) < size:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            self.__fill(remaining)
+        data = bytes(self.__buffer[:size])
+        del self.__buffer[:size]
+        return data
+
+    def write(self, data):
+        if not self.is_open:
+            raise PortNotOpenError()
+        if self.__socket is None and not self.__reconnect():
+            raise SerialException("Not connected to %s:%d" % self.address)
+        data = bytes(data)
+        try:
+            self.__socket.setblocking(True)
+            self.__socket.settimeout(self.options["user_timeout"] or None)
+            self.__socket.sendall(data)
+        except (OSError, socket.error) as e:
+            self.__lost(e)
+        finally:
+            if self.__socket is not None:
+                self.__socket.setblocking(False)
+        return len(data)
+
+    def flush(self):
+        pass  # sendall() returns once the data is handed to the socket
+
+    def reset_input_buffer(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+        self.__buffer = bytearray()
+        # a connection lost while idle is noticed here, before the next
+        # command is written, which leaves a chance to reconnect
+        while self.__socket is not None:
+            try:
+                if not self.__socket.recv(4096):
+                    self.__drop("closed by the adapter")
+            except (BlockingIOError, InterruptedError):
+                break
+            except (OSError, socket.error) as e:
+                self.__drop(e)
+
+    def reset_output_buffer(self):
+        pass
+
+    def fileno(self):
+        if self.__socket is None:
+            raise PortNotOpenError()
+        return self.__socket.fileno()
+
+    def _update_break_state(self):
+        pass
+
+    def _update_rts_state(self):
+        pass
+
+    def _update_dtr_state(self):
+        pass
@@ -27,7 +27,7 @@ setup(
     author_email="brendanw@windworksdesign.com",
     url="http://github.com/brendan-w/python-OBD",
     license="GNU GPLv2",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks"]),
     include_package_data=True,
     zip_safe=False,
     install_requires=["pyserial==3.*", "pint==0.20.*"],
@@ -2,11 +2,15 @@
     Tests for the API layer
 """
 
+import threading
+import time
+
 import obd
 from obd import ECU
 from obd.OBDCommand import OBDCommand
 from obd.decoders import noop
-from obd.protocols.protocol import Message
+from obd.protocols import ISO_15765_4_11bit_500k
+from obd.protocols.protocol import Frame, Message
 from obd.utils import OBDStatus
 
 
@@ -19,6 +23,7 @@ class FakeELM:
         self._port_name = port_name
         self._status = OBDStatus.CAR_CONNECTED
         self._last_command = None
+        self._sent = []
 
     def port_name(self):
         return self._port_name
@@ -41,13 +46,22 @@ class FakeELM:
     def close(self):
         pass
 
+    @staticmethod
+    def timestamps():
+        return (10.0, 1000.0, 10.5, 1000.5)
+
     def send_and_parse(self, cmd):
         # stow this, so we can check that the API made the right request
         print(cmd)
         self._last_command = cmd
+        self._sent.append(cmd)
+
+        # AT commands get the ELM's acknowledgement
+        if cmd.startswith(b"AT"):
+            return [Message([Frame("OK")])]
 
         # all commands succeed
-        message = Message([])
+        message = Message([Frame("")])  # one frame, as a single-frame CAN reply
         message.data = bytearray(b'response data')
         message.ecu = ECU.ENGINE  # picked engine so that simple commands like RPM will work
         return [message]
@@ -178,3 +192,248 @@ def test_fast():
     assert command.fast
     o.query(command, force=True)  # force since this command isn't in the tables
     # assert o.interface._test_last_command(command.command)
+
+
+"""
+    Header-aware scheduling
+"""
+
+transmission_command = OBDCommand("Test_Transmission",
+                                  "A command for another ECU",
+                                  b"0123",
+                                  0,
+                                  noop,
+                                  ECU.ALL,
+                                  True,
+                                  header=b"7E1")
+
+
+def test_schedule():
+    o = obd.OBD("/dev/null")
+    cmds = [obd.commands.RPM, transmission_command, obd.commands.SPEED, command]
+
+    # the currently set header goes first, order is otherwise kept
+    assert o.schedule(cmds) == [obd.commands.RPM, obd.commands.SPEED, command, transmission_command]
+    assert o.schedule([]) == []
+
+
+def test_query_many():
+    o = obd.OBD("/dev/null", fast=False)
+    o.interface = FakeELM("/dev/null")
+    cmds = [obd.commands.RPM, transmission_command, obd.commands.SPEED]
+
+    r = o.query_many(cmds, force=True)
+    assert set(r.keys()) == set(cmds)
+    assert all(not v.is_null() for v in r.values())
+
+    # only one header switch was needed
+    assert o.interface._sent == [b"010C", b"010D", b"AT SH 7E1 ", b"0123"]
+    assert o.header_switches.count == 1
+
+    # the next round starts on the transmission's header, avoiding a switch
+    o.interface._sent = []
+    o.query_many(cmds, force=True)
+    assert o.interface._sent == [b"0123", b"AT SH 7E0 ", b"010C", b"010D"]
+    assert o.header_switches.count == 2
+
+
+"""
+    Physical addressing
+"""
+
+
+class FakeCAN(FakeELM):
+    """
+        Fake ELM327 with an engine (7E8) and a transmission (7E9) on
+        an 11 bit CAN bus, parsed by the real protocol object
+    """
+
+    RESPONSES = {
+        # engine supports 0C (RPM) and 0D (SPEED), transmission supports 0E and 0F
+        b"0100": ["7E8 06 41 00 BE 18 00 00", "7E9 06 41 00 80 06 00 00"],
+        b"010C": ["7E8 04 41 0C 1A F8"],
+        b"010E": ["7E9 03 41 0E 80"],
+        b"03": ["7E8 02 43 00", "7E9 02 43 00"],
+    }
+
+    def __init__(self, port_name):
+        FakeELM.__init__(self, port_name)
+        self._protocol = ISO_15765_4_11bit_500k(self.RESPONSES[b"0100"])
+
+    def send_and_parse(self, cmd):
+        self._sent.append(cmd)
+        if cmd.startswith(b"AT"):
+            return [Message([Frame("OK")])]
+        if len(cmd) == 5:
+            cmd = cmd[:4]  # drop the response count
+        lines = self.RESPONSES.get(cmd, ["NO DATA"])
+        return self._protocol(lines)
+
+
+def test_ecu_supported_commands():
+    o = obd.OBD("/dev/null")
+    o.interface = FakeCAN("/dev/null")
+    o.supported_commands = set(obd.commands.base_commands())
+    o._OBD__load_commands()
+
+    assert obd.commands.RPM in o.ecu_supported_commands[0]
+    assert obd.commands.SPEED in o.ecu_supported_commands[0]
+    assert obd.commands.TIMING_ADVANCE not in o.ecu_supported_commands[0]
+    assert obd.commands.TIMING_ADVANCE in o.ecu_supported_commands[1]
+
+    # physical addressing is off, so nothing changes about the requests
+    o.interface._sent = []
+    o.query(obd.commands.RPM)
+    assert o.interface._sent == [b"010C"]
+
+
+def test_physical_addressing():
+    o = obd.OBD("/dev/null", physical_addressing=True)
+    o.interface = FakeCAN("/dev/null")
+    o.supported_commands = set(obd.commands.base_commands())
+    o._OBD__load_commands()
+
+    # the engine is the only ECU to answer RPM, so it gets a physical request
+    o.interface._sent = []
+    r = o.query(obd.commands.RPM)
+    assert not r.is_null()
+    assert o.interface._sent == [b"AT SH 7E0 ", b"AT CRA 7E8", b"010C"]
+
+    # same ECU, no more setup needed
+    o.interface._sent = []
+    o.query(obd.commands.SPEED)
+    assert o.interface._sent == [b"010D"]
+
+    # DTCs are collected from every ECU, so they are broadcast
+    o.interface._sent = []
+    r = o.query(obd.commands.GET_DTC)
+    assert o.interface._sent == [b"AT SH 7DF ", b"AT AR", b"03"]
+
+
+def test_frame_counts():
+    o = obd.OBD("/dev/null")
+    o.interface = FakeCAN("/dev/null")
+    o.supported_commands = set(obd.commands.base_commands())
+    o._OBD__load_commands()
+
+    # the first query learns the count, the second one uses it
+    o.interface._sent = []
+    o.query(obd.commands.RPM)
+    o.query(obd.commands.TIMING_ADVANCE, force=True)
+    o.query(obd.commands.RPM)
+    assert o.interface._sent == [b"010C", b"010E", b"010C1"]
+    assert o.frame_counts.hits == 1
+
+    # NO DATA isn't learned
+    o.interface._sent = []
+    o.query(obd.commands.SPEED)
+    o.query(obd.commands.SPEED)
+    assert o.interface._sent == [b"010D", b""]
+
+
+def test_cache():
+    o = obd.OBD("/dev/null", cache=True)
+    o.interface = FakeELM("/dev/null")
+
+    r = o.query(obd.commands.VIN, force=True)
+    assert o.query(obd.commands.VIN, force=True) is r
+    assert o.interface._sent == [b"0902"]
+
+    # live data always goes to the car
+    o.query(obd.commands.RPM, force=True)
+    o.query(obd.commands.RPM, force=True)
+    assert len(o.interface._sent) == 3
+
+    # clearing the DTCs empties the cache
+    o.query(obd.commands.CLEAR_DTC, force=True)
+    o.interface._sent = []
+    o.query(obd.commands.VIN, force=True)
+    assert o.interface._sent == [b"09021"]  # back to the car, with the learned frame count
+
+
+def test_timestamps():
+    o = obd.OBD("/dev/null")
+    o.interface = FakeELM("/dev/null")
+
+    r = o.query(obd.commands.RPM, force=True)
+    assert (r.sent_monotonic, r.received_monotonic) == (10.0, 10.5)
+    assert (r.sent_time, r.received_time) == (1000.0, 1000.5)
+    assert r.time == 1000.5
+    assert r.latency == 0.5
+
+    # unknown without a connection
+    assert obd.OBDResponse().latency is None
+
+
+"""
+    Thread safety
+"""
+
+
+class SlowELM(FakeELM):
+    """ Fake ELM327 that takes a while to answer, and notices overlapping requests """
+
+    def __init__(self, port_name):
+        FakeELM.__init__(self, port_name)
+        self._busy = False
+        self._overlaps = 0
+
+    def send_and_parse(self, cmd):
+        if self._busy:
+            self._overlaps += 1
+        self._busy = True
+        time.sleep(0.05)
+        self._busy = False
+        return FakeELM.send_and_parse(self, cmd)
+
+
+def run_threads(target, n):
+    barrier = threading.Barrier(n)
+
+    def run():
+        barrier.wait()  # line them up, so the requests really are concurrent
+        target()
+
+    threads = [threading.Thread(target=run) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_concurrent_queries_are_serialized():
+    o = obd.OBD("/dev/null", fast=False)
+    o.interface = SlowELM("/dev/null")
+    cmds = [obd.commands.RPM, obd.commands.SPEED, obd.commands.COOLANT_TEMP]
+
+    run_threads(lambda: [o.query(c, force=True) for c in cmds], 3)
+    assert o.interface._overlaps == 0
+
+
+def test_concurrent_queries_are_coalesced():
+    o = obd.OBD("/dev/null", fast=False)
+    o.interface = SlowELM("/dev/null")
+    responses = []
+
+    run_threads(lambda: responses.append(o.query(obd.commands.RPM, force=True)), 5)
+
+    # every transaction on the bus was shared by all of its waiters
+    assert len(responses) == 5
+    assert len(set(id(r) for r in responses)) == o.interface._sent.count(b"010C")
+    assert o.interface._sent.count(b"010C") + o.coalesced == 5
+    assert o.coalesced > 0
+
+
+def test_cached_queries_dont_wait_for_the_bus():
+    o = obd.OBD("/dev/null", fast=False, cache=True)
+    o.interface = SlowELM("/dev/null")
+    o.query(obd.commands.VIN, force=True)
+
+    slow = threading.Thread(target=lambda: o.query(obd.commands.RPM, force=True))
+    slow.start()
+    time.sleep(0.01)  # the RPM request is on the bus
+    start = time.monotonic()
+    assert not o.query(obd.commands.VIN, force=True).is_null()
+    assert time.monotonic() - start < 0.03
+    slow.join()
+    assert o.interface._sent == [b"0902", b"010C"]
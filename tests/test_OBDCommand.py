@@ -80,3 +80,27 @@ def test_pid():
 
     cmd = OBDCommand("", "", b"totally not hex", 4, noop, ECU.ENGINE)
     assert cmd.mode == None
+
+
+def test_descriptor():
+    cmd = OBDCommand("", "", b"010C", 4, noop, ECU.ENGINE, True)
+    d = cmd.descriptor
+    assert (d.mode, d.pid, d.bytes) == (0x01, 0x0C, 4)
+    assert d.request() == b"010C"
+    assert d.request(1) == b"010C1"
+    assert d.request(15) == b"010CF"
+    assert d.hash == hash(cmd) == hash(cmd.clone())
+
+    # changing the command, header or bytes makes a new descriptor
+    cmd.command = b"020C"
+    assert (cmd.mode, cmd.descriptor.request(2)) == (0x02, b"020C2")
+    cmd.header = b"7E1"
+    assert cmd.descriptor.key == (b"7E1", b"020C")
+    assert cmd.clone() == cmd
+    cmd.bytes = 0
+    assert cmd.descriptor.bytes == 0
+    assert d.request() == b"010C"  # the old one is unchanged
+
+    cmd = OBDCommand("", "", b"ATRV", 0, noop, ECU.UNKNOWN)
+    assert (cmd.descriptor.mode, cmd.descriptor.pid) == (None, None)
+    assert cmd.descriptor.request() == b"ATRV"
@@ -0,0 +1,47 @@
+"""
+    Makes sure that the benchmarks still run (without timing them)
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import harness  # noqa: E402
+
+# the end-to-end benchmarks take a second to connect, run only a few of them
+END_TO_END = ["query.1ecu", "query.254bytes", "async.1ecu"]
+
+BENCHMARKS = [(name, setup) for name, setup in harness.benchmarks()
+              if name.split(".")[0] not in ["query", "async"] or name in END_TO_END]
+
+
+@pytest.mark.parametrize("name,setup", BENCHMARKS, ids=[name for name, _ in BENCHMARKS])
+def test_benchmark(name, setup):
+    prepared = setup()
+    fn, cleanup = prepared if isinstance(prepared, tuple) else (prepared, None)
+    try:
+        fn()
+    finally:
+        if cleanup is not None:
+            cleanup()
+
+
+def test_baselines():
+    baselines = harness.load_baselines()
+    assert set(baselines) == set([name for name, _ in harness.benchmarks()])
+
+
+def test_compare():
+    results = [harness.Result("a", 2.0, 1, 1.0), harness.Result("b", 1.0, 1, 1.0)]
+    baselines = {"a": {"relative": 1.0}, "b": {"relative": 1.0}}
+    regressions = harness.compare(results, baselines, tolerance=0.5)
+    assert [(r.name, ratio) for r, ratio in regressions] == [("a", 2.0)]
+
+
+def test_measure():
+    per_op, ops = harness.measure(lambda: 10, min_time=0.001, repeat=2)
+    assert ops % 10 == 0
+    assert per_op > 0
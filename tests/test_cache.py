@@ -0,0 +1,70 @@
+"""
+    Tests for the response cache
+"""
+
+import time
+
+import obd
+from obd.cache import ResponseCache, FOREVER
+from obd.OBDResponse import OBDResponse
+
+
+def response(value="value"):
+    r = OBDResponse(None, ["message"])
+    r.value = value
+    return r
+
+
+def test_default_policies():
+    cache = ResponseCache()
+    assert cache.policy(obd.commands.VIN) == FOREVER
+    assert cache.policy(obd.commands.PIDS_A) == FOREVER
+    assert cache.policy(obd.commands.GET_DTC) > 0
+    assert cache.policy(obd.commands.RPM) is None
+
+
+def test_get_put():
+    cache = ResponseCache()
+    assert cache.get(obd.commands.VIN) is None
+
+    r = response()
+    cache.put(obd.commands.VIN, r)
+    assert cache.get(obd.commands.VIN) is r
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+    # live data is never cached
+    cache.put(obd.commands.RPM, response())
+    assert cache.get(obd.commands.RPM) is None
+    assert obd.commands.RPM not in cache
+
+    # neither are empty responses
+    cache.put(obd.commands.FUEL_TYPE, OBDResponse())
+    assert obd.commands.FUEL_TYPE not in cache
+
+
+def test_ttl():
+    cache = ResponseCache()
+    cache.set_policy(obd.commands.RPM, 0.05)
+    cache.put(obd.commands.RPM, response())
+    assert cache.get(obd.commands.RPM) is not None
+    time.sleep(0.06)
+    assert cache.get(obd.commands.RPM) is None
+
+    cache.set_policy(obd.commands.VIN, None)
+    cache.put(obd.commands.VIN, response())
+    assert cache.get(obd.commands.VIN) is None
+
+
+def test_invalidate():
+    cache = ResponseCache()
+    cache.put(obd.commands.VIN, response())
+    cache.put(obd.commands.FUEL_TYPE, response())
+    assert len(cache) == 2
+
+    cache.invalidate(obd.commands.VIN)
+    assert obd.commands.VIN not in cache
+    assert obd.commands.FUEL_TYPE in cache
+
+    cache.invalidate()
+    assert len(cache) == 0
@@ -1,5 +1,20 @@
+from binascii import unhexlify
+
 import obd
+from obd.commands import Commands
 from obd.decoders import pid
+from obd.OBDCommand import OBDCommand
+from obd.protocols import ECU
+from obd.protocols.protocol import Message
+from obd.uds import DID
+from obd.UnitsAndScaling import Unit, UAS
+
+
+def message(hex_data):
+    m = Message([])
+    m.data = bytearray(unhexlify(hex_data))
+    m.ecu = ECU.ENGINE
+    return m
 
 
 def test_list_integrity():
@@ -110,3 +125,48 @@ def test_pid_getters():
 
             if cmd.decode == pid:
                 assert cmd in pid_getters
+
+
+def test_request_index():
+    assert obd.commands.for_request(b"010C") is obd.commands.RPM
+    assert obd.commands.for_request(b"010c") is obd.commands.RPM
+    assert obd.commands.for_request(b"03") is obd.commands.GET_DTC
+    assert obd.commands.for_request(b"ATRV") is obd.commands.ELM_VOLTAGE
+    assert obd.commands.for_request(b"010C", b"7E1") is None
+    assert obd.commands.for_request(b"01FF") is None
+
+    other = obd.commands.RPM.clone()
+    other.header = b"7E1"
+    assert not obd.commands.has_command(other)
+
+
+def test_response_index():
+    for command_list in obd.commands.modes:
+        for cmd in command_list:
+            if cmd is None:
+                continue
+            response = bytearray([cmd.mode + 0x40]) + unhexlify(cmd.command[2:]) + b"\x00\x00"
+            assert obd.commands.for_response(response) is cmd, cmd.name
+
+    assert obd.commands.for_response(bytearray(b"\x7f\x01\x12")) is None  # negative response
+    assert obd.commands.for_response(bytearray(b"\x41")) is None
+    assert obd.commands.for_response(bytearray()) is None
+    assert obd.commands.for_response(bytearray(b"\x41\x0c\x1a\xf8"), b"7E1") is None
+
+
+def test_dispatch():
+    registry = Commands()
+    (soc,) = registry.add_dids([DID("BATTERY_SOC", "Battery state of charge", 0x028C, 1,
+                                    UAS(False, 0.5, Unit.percent))], header=b"7E1")
+    (boost,) = registry.add_commands([OBDCommand("BOOST", "Boost pressure", b"211940", 0,
+                                                 lambda messages: messages[0].data[3])])
+    assert registry[0x21][0x1940] is boost
+    assert registry.has_pid(0x21, 0x1940)
+
+    r = registry.dispatch(message("410C1AF8"))
+    assert r.command is registry.RPM
+    assert r.value == 1726.0 * Unit.rpm
+    assert registry.dispatch(message("62028CC8"), b"7E1").value == 100.0 * Unit.percent
+    assert registry.dispatch(message("62028CC8")) is None  # not with the default header
+    assert registry.dispatch(message("6119405A")).value == 0x5A
+    assert registry.dispatch(message("7F2231")) is None
@@ -0,0 +1,118 @@
+"""
+    Tests for the DoIP transport, against the stand-in DoIPServer
+"""
+
+import socket
+import struct
+import time
+
+import pytest
+
+import obd
+from obd import commands
+from obd.doip import DoIPServer, Stream, pack, DIAGNOSTIC_MESSAGE, DIAGNOSTIC_NACK, \
+    ROUTING_ACTIVATION_REQUEST, ROUTING_ACTIVATION_RESPONSE, ALIVE_CHECK_REQUEST, ALIVE_CHECK_RESPONSE
+from obd.emulator import EmulatedECU
+from obd.utils import OBDStatus
+
+
+@pytest.fixture
+def server():
+    s = DoIPServer()
+    yield s
+    s.close()
+
+
+def url(server, query=""):
+    return "doip://%s:%d%s" % (server.address[0], server.address[1], query)
+
+
+def test_pack():
+    assert pack(0x8001, b"\x0e\x00\xe4\x00\x01\x00") == \
+        b"\x02\xfd\x80\x01\x00\x00\x00\x06\x0e\x00\xe4\x00\x01\x00"
+
+
+def test_obd(server):
+    o = obd.OBD(url(server))
+    assert o.status() == OBDStatus.CAR_CONNECTED
+    assert o.protocol_name() == "ISO 13400 (DoIP)"
+    assert o.interface.entity_address == 0x1FFF
+    assert o.query(commands.RPM).value.magnitude == 1726.0
+    assert o.query(commands.VIN).value == b"WP0ZZZ99ZTS392124"
+    assert o.query(commands.ELM_VERSION).value == "DoIP 1FFF"
+    o.close()
+    assert o.status() == OBDStatus.NOT_CONNECTED
+
+
+def test_emulator_url():
+    o = obd.OBD("doip://emulator")
+    assert o.query(commands.SPEED).value.magnitude == 50.0
+    o.close()
+
+
+def test_physical_addressing(server):
+    o = obd.OBD(url(server), physical_addressing=True)
+    start = time.monotonic()
+    assert o.query(commands.RPM).value.magnitude == 1726.0
+    assert time.monotonic() - start < o.interface.timeout  # a single ECU, no need to wait
+    o.close()
+
+
+def test_headers(server):
+    o = obd.OBD(url(server))
+    i = o.interface
+    assert i.send_and_parse(b"AT SH 1018")[0].raw() == "OK"
+    assert [m.tx_id for m in i.send_and_parse(b"0105")] == [0x18]
+    assert i.send_and_parse(b"AT SH DA10F1")[0].raw() == "OK"
+    assert [m.tx_id for m in i.send_and_parse(b"0105")] == [0x10]
+    assert i.send_and_parse(b"AT SH 1234")[0].raw() == "OK"
+    assert i.send_and_parse(b"0105")[0].raw() == "NO DATA"  # NACK, unknown target
+    assert i.send_and_parse(b"AT SH 7DF")[0].raw() == "OK"
+    assert i.send_and_parse(b"AT CRA 18DAF118")[0].raw() == "OK"
+    assert [m.tx_id for m in i.send_and_parse(b"0105")] == [0x18]
+    o.close()
+
+
+def test_response_pending(server):
+    answers = iter(["7F0178", "4101 00 07 E5 00"])
+    server.ecus = [EmulatedECU(0x10, {"0100": "4100 00000000", "0101": lambda r: next(answers)})]
+    o = obd.OBD(url(server))
+    r = o.interface.send_and_parse(b"0101")
+    assert r[0].data[:2] == bytearray(b"\x41\x01")
+    o.close()
+
+
+def test_lost_connection(server):
+    o = obd.OBD(url(server))
+    server.close()
+    time.sleep(0.3)
+    assert not o.query(commands.RPM, force=True).value
+    assert o.status() == OBDStatus.NOT_CONNECTED
+
+
+def test_refused():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    o = obd.OBD("doip://127.0.0.1:%d?connect_timeout=0.5" % port)
+    assert o.status() == OBDStatus.NOT_CONNECTED
+
+
+def test_server(server):
+    """ the wire protocol, from a raw socket """
+    sock = socket.create_connection(server.address)
+    stream = Stream(sock)
+
+    # diagnostic messages need routing first
+    sock.sendall(pack(DIAGNOSTIC_MESSAGE, b"\x0e\x00\xe4\x00\x01\x0d"))
+    assert stream.read(1.0)[0] == DIAGNOSTIC_NACK
+
+    sock.sendall(pack(ROUTING_ACTIVATION_REQUEST, b"\x0e\x00\x00\x00\x00\x00\x00"))
+    payload_type, payload = stream.read(1.0)
+    assert payload_type == ROUTING_ACTIVATION_RESPONSE
+    assert struct.unpack("!HHB", payload[:5]) == (0x0E00, 0x1FFF, 0x10)
+
+    sock.sendall(pack(ALIVE_CHECK_REQUEST))
+    assert stream.read(1.0) == (ALIVE_CHECK_RESPONSE, b"\x1f\xff")
+    sock.close()
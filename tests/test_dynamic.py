@@ -0,0 +1,144 @@
+"""
+    Tests for dynamically defined DIDs (UDS DynamicallyDefineDataIdentifier)
+"""
+
+import pytest
+
+import obd
+from obd import OBDCommand, ECU
+from obd.decoders import raw_string
+from obd.dynamic import DynamicDIDs, DynamicDID, clear_command, compose, define_command
+from obd.emulator import Emulator, EmulatedECU
+from obd.uds import DID, UAS, read_did, text
+from obd.UnitsAndScaling import Unit
+
+
+SOC = DID("BATTERY_SOC", "Battery state of charge", 0x028C, 1, UAS(False, 0.5, Unit.percent))
+DPF = DID("DPF_LOAD", "Particulate filter load", 0x044A, 2, UAS(False, 0.01, Unit.gram))
+VIN = DID("VIN_DID", "VIN", 0xF190, 17, text)
+
+# twenty signals, of 2 bytes each
+SIGNALS = [DID("SIGNAL_%d" % i, "Signal %d" % i, 0x4000 + i, 2, UAS(False, 1, Unit.count))
+           for i in range(20)]
+
+
+def signals_ecu():
+    return EmulatedECU(0x00, dids=dict((0x4000 + i, "00 %02X" % i) for i in range(20)))
+
+
+def test_compose():
+    dynamic = compose(SIGNALS)
+    assert [(d.did, d.length, len(d.sources)) for d in dynamic] == [(0xF300, 32, 16), (0xF301, 8, 4)]
+    assert dynamic[0].decode(bytes(range(32)))["SIGNAL_1"] == 0x0203 * Unit.count
+
+    # longer than the limit, on its own
+    dynamic = compose([SOC, VIN, DPF], max_length=8)
+    assert [[s.name for s in d.sources] for d in dynamic] == [["BATTERY_SOC"], ["VIN_DID"], ["DPF_LOAD"]]
+
+    with pytest.raises(ValueError):
+        compose(SIGNALS, first=0xF3FF)
+
+
+def test_commands():
+    d = DynamicDID(0xF300, [SOC, DPF])
+    assert define_command(d).command == b"2C01F300028C0101044A0102"
+    assert clear_command(d).command == b"2C03F300"
+    assert clear_command().command == b"2C03"
+
+
+def test_emulated_ecu():
+    ecu = EmulatedECU(0x00, dids={0x028C: "C8", 0x044A: "01 F4"})
+    assert ecu.respond("2C01F300044A0201028C0101") == bytearray.fromhex("6C01F300")
+    assert ecu.respond("22F300") == bytearray.fromhex("62F300F4C8")
+    assert ecu.respond("2C01F300044A0101") == bytearray.fromhex("6C01F300")  # adds to F300
+    assert ecu.respond("22F300") == bytearray.fromhex("62F300F4C801")
+    assert ecu.respond("2C03F300") == bytearray.fromhex("6C03F300")
+    assert ecu.respond("22F300") == bytearray.fromhex("7F2231")
+
+    assert ecu.respond("2C01F300123401010") == bytearray.fromhex("7F2C13")
+    assert ecu.respond("2C01F30012340101") == bytearray.fromhex("7F2C31")  # unknown source
+    assert ecu.respond("2C01F300044A0203") == bytearray.fromhex("7F2C31")  # past the data
+    assert ecu.respond("2C01028C044A0101") == bytearray.fromhex("7F2C31")  # not a dynamic DID
+    assert ecu.respond("2C02F300") == bytearray.fromhex("7F2C12")
+
+
+def test_query():
+    e = Emulator(protocol="6", timeout=0.0, ecus=[signals_ecu()], stn="STN1110", name="dynamic")
+    o = obd.OBD("emulator://dynamic", protocol="6")
+    signals = DynamicDIDs(SIGNALS)
+    assert signals.define(o)
+    assert [c.command for c in signals.commands] == [b"22F300F301"]
+
+    responses = signals.query(o)
+    assert len(responses) == 20
+    assert responses[read_did(SIGNALS[7])].value == 7 * Unit.count
+    assert responses[read_did(SIGNALS[19])].value == 19 * Unit.count
+    assert responses[read_did(SIGNALS[19])].messages
+    o.close()
+    e.close()
+
+
+@pytest.mark.parametrize("protocol, header", [("6", b"7E0"), ("7", b"DA10F1")])
+def test_socketcan(protocol, header):
+    o = obd.OBD("socketcan://emulator?protocol=%s" % protocol)
+    signals = DynamicDIDs([SOC, DPF, VIN], header=header, max_length=8)
+    assert signals.define(o)
+    assert [c.command for c in signals.commands] == [b"22F300F301"]
+    responses = signals.query(o)
+    assert responses[read_did(SOC, header)].value == 100.0 * Unit.percent
+    assert responses[read_did(DPF, header)].value == 5.0 * Unit.gram
+    assert responses[read_did(VIN, header)].value == "WP0ZZZ99ZTS392124"
+    o.close()
+
+
+def test_round_trips():
+    e = Emulator(protocol="6", timeout=0.0, ecus=[signals_ecu()], stn="STN1110", name="dynamic_trips")
+    o = obd.OBD("emulator://dynamic_trips", protocol="6")
+    signals = DynamicDIDs(SIGNALS)
+
+    before = e.requests
+    signals.query(o)
+    assert e.requests - before == 7  # 3 DIDs per request
+
+    signals.define(o)
+    before = e.requests
+    signals.query(o)
+    assert e.requests - before == 1
+
+    # the ECU forgot them (ie: after a reset), they're defined again
+    e.ecus[0].dynamic.clear()
+    responses = signals.query(o)
+    assert signals.defined
+    assert responses[read_did(SIGNALS[3])].value == 3 * Unit.count
+
+    signals.clear(o)
+    assert not e.ecus[0].dynamic
+    o.close()
+    e.close()
+
+
+@pytest.mark.parametrize("stn", [None, "STN1110"])
+def test_broadcast_after_define(stn):
+    # defined or refused, the definitions leave the adapter broadcasting
+    transmission = EmulatedECU(0x01, {"010D": "410D 32"})
+    e = Emulator(protocol="6", timeout=0.0, ecus=[signals_ecu(), transmission], stn=stn,
+                 name="dynamic_broadcast")
+    o = obd.OBD("emulator://dynamic_broadcast", protocol="6")
+    assert DynamicDIDs(SIGNALS).define(o) == (stn is not None)
+    r = o.query(OBDCommand("PIDS", "PIDs of every ECU", b"0100", 6, raw_string, ECU.ALL, False), force=True)
+    assert sorted([m.tx_id for m in r.messages]) == [0, 1]
+    o.close()
+    e.close()
+
+
+def test_refused():
+    # a plain ELM327 can't send the definitions, longer than a frame
+    e = Emulator(protocol="6", timeout=0.0, ecus=[signals_ecu()], name="dynamic_elm")
+    o = obd.OBD("emulator://dynamic_elm", protocol="6")
+    signals = DynamicDIDs(SIGNALS[:4])
+    assert not signals.define(o)
+    assert [c.command for c in signals.commands] == [b"22400040014002", b"224003"]
+    responses = signals.query(o)
+    assert [responses[read_did(s)].value.magnitude for s in SIGNALS[:4]] == [0, 1, 2, 3]
+    o.close()
+    e.close()
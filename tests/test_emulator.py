@@ -0,0 +1,275 @@
+"""
+    Tests for the emulated ELM327 and the emulator:// ports
+"""
+
+import os
+import time
+
+import pytest
+import serial
+
+import obd
+from obd import commands
+from obd.emulator import Emulator, EmulatedECU, default_ecus, get_emulator
+
+
+def send(emulator, line):
+    """ returns the full answer to a line, and the time at which it completes """
+    chunks = emulator.feed(line + b"\r")
+    if chunks is None:
+        return None, None
+    return b"".join([c for _, c in chunks]), chunks[-1][0]
+
+
+def test_at_commands():
+    e = Emulator()
+    assert send(e, b"ATZ")[0] == b"ATZ\r\rELM327 v1.5\r\r>"
+    assert send(e, b"ATE0")[0] == b"ATE0\rOK\r\r>"  # echoed, since echo was still on
+    assert send(e, b"ATH1")[0] == b"OK\r\r>"
+    assert send(e, b"AT RV")[0] == b"12.6V\r\r>"
+    assert send(e, b"ATL1")[0] == b"OK\r\n\r\n>"
+    assert send(e, b"ATL0")[0] == b"OK\r\r>"
+    assert send(e, b"ATXYZ")[0] == b"?\r\r>"
+    assert send(e, b"\x7f\x7f")[0] == b"?\r\r>"
+    assert send(e, b"STI")[0] == b"?\r\r>"
+    assert e.at_commands == 7
+
+
+def test_stn():
+    e = Emulator(stn="STN1110 v4.2.0")
+    assert send(e, b"STI")[0] == b"STI\rSTN1110 v4.2.0\r\r>"
+
+
+def test_protocol_selection():
+    e = Emulator(protocol="6", timeout=0.0)
+    send(e, b"ATE0")
+    send(e, b"ATH1")
+    assert send(e, b"0100")[0].startswith(b"SEARCHING...\r7E8 06 41 00")
+    assert send(e, b"ATDPN")[0] == b"A6\r\r>"
+    assert send(e, b"ATDP")[0] == b"AUTO, ISO 15765-4 (CAN 11/500)\r\r>"
+
+    send(e, b"ATSP7")
+    assert send(e, b"0100")[0] == b"UNABLE TO CONNECT\r\r>"
+    assert send(e, b"ATDPN")[0] == b"7\r\r>"
+
+    send(e, b"ATSP6")
+    assert send(e, b"0100")[0].startswith(b"7E8 06 41 00")
+
+
+def test_can_formatting():
+    e = Emulator(protocol="6", timeout=0.0)
+    send(e, b"ATE0")
+    send(e, b"ATH1")
+    assert send(e, b"010C")[0] == b"SEARCHING...\r7E8 04 41 0C 1A F8 00 00 00\r\r>"
+    assert send(e, b"0902")[0] == b"7E8 10 14 49 02 01 57 50 30\r" \
+                                  b"7E8 21 5A 5A 5A 39 39 5A 54\r" \
+                                  b"7E8 22 53 33 39 32 31 32 34\r\r>"
+
+    send(e, b"ATS0")
+    assert send(e, b"010D")[0] == b"7E803410D3200000000\r7E903410D3200000000\r\r>"
+
+    send(e, b"ATH0")
+    send(e, b"ATS1")
+    assert send(e, b"010C")[0] == b"41 0C 1A F8\r\r>"
+    assert send(e, b"0902")[0] == b"014\r0: 49 02 01 57 50 30\r1: 5A 5A 5A 39 39 5A 54\r" \
+                                  b"2: 53 33 39 32 31 32 34\r\r>"
+
+
+def test_29bit_and_legacy_formatting():
+    e = Emulator(protocol="7", timeout=0.0)
+    send(e, b"ATE0")
+    send(e, b"ATH1")
+    assert send(e, b"010C")[0] == b"SEARCHING...\r18 DA F1 10 04 41 0C 1A F8 00 00 00\r\r>"
+
+    e = Emulator(protocol="2", timeout=0.0)
+    send(e, b"ATE0")
+    send(e, b"ATH1")
+    send(e, b"0100")
+    assert send(e, b"010C")[0] == b"48 6B 10 41 0C 1A F8 22\r\r>"  # with checksum
+    assert send(e, b"03")[0] == b"48 6B 10 43 00 00 00 00 00 00 06\r\r>"
+    assert send(e, b"0902")[0].count(b"48 6B 10 49 02 0") == 5
+
+
+def test_pid_lists():
+    ecu = EmulatedECU(0, {"010C": "410C0000", "0151": "415101", "0902": "4902"})
+    assert ecu.respond("0100") == bytearray.fromhex("4100 00100001")
+    assert ecu.respond("0120") == bytearray.fromhex("4120 00000001")
+    assert ecu.respond("0140") == bytearray.fromhex("4140 00008000")
+    assert ecu.respond("0160") is None
+    assert ecu.respond("0900") == bytearray.fromhex("4900 40000000")
+    assert ecu.respond("0600") is None
+
+    ecu = EmulatedECU(0, {"0105": lambda request: None})
+    assert ecu.respond("0105") is None
+
+    assert len(default_ecus("6", count=4)) == 4
+    with pytest.raises(ValueError):
+        default_ecus("6", count=0)
+
+
+def test_timing():
+    e = Emulator(protocol="6", latency=0.05, timeout=0.2)
+    send(e, b"ATE0")
+
+    # waits for the timeout after the last frame
+    assert send(e, b"010C")[1] == pytest.approx(0.25)
+
+    # unless the expected number of frames arrived
+    assert send(e, b"010C1")[1] == pytest.approx(0.05)
+    assert send(e, b"010D2")[1] == pytest.approx(0.05)
+
+    # or the AT ST timeout was changed
+    send(e, b"ATST0A")
+    assert send(e, b"010C")[1] == pytest.approx(0.09)
+
+    e = Emulator(jitter=0.1, timeout=0.0, seed=1)
+    send(e, b"ATE0")
+    delays = set([send(e, b"010C")[1] for _ in range(10)])
+    assert len(delays) > 1
+    assert all([0.0 <= d <= 0.1 for d in delays])
+
+
+def test_addressing():
+    e = Emulator(protocol="6", timeout=0.0)
+    send(e, b"ATE0")
+    send(e, b"ATH1")
+    send(e, b"ATSP6")
+    assert send(e, b"0105")[0].count(b"\r7") == 1  # two ECUs
+
+    send(e, b"ATSH7E1")
+    assert send(e, b"0105")[0] == b"7E9 03 41 05 7A 00 00 00 00\r\r>"
+
+    send(e, b"ATSH7DF")
+    send(e, b"ATCRA7E8")
+    assert send(e, b"0105")[0] == b"7E8 03 41 05 7B 00 00 00 00\r\r>"
+
+    send(e, b"ATAR")
+    assert send(e, b"0105")[0].count(b"\r7") == 1
+
+
+def test_faults():
+    e = Emulator(timeout=0.0, no_data_rate=1.0)
+    send(e, b"ATE0")
+    assert send(e, b"010C")[0] == b"SEARCHING...\rNO DATA\r\r>"
+    assert send(e, b"0142")[0] == b"NO DATA\r\r>"
+
+    e = Emulator(timeout=0.0, disconnect_after=2)
+    send(e, b"ATE0")
+    assert send(e, b"010C")[0] is not None
+    assert send(e, b"010C")[0] is not None
+    assert send(e, b"010C")[0] is None
+    assert e.offline
+    assert send(e, b"ATI")[0] is None
+
+    e.reconnect()
+    assert send(e, b"ATI")[0] == b"ATI\rELM327 v1.5\r\r>"
+    assert send(e, b"010C")[0] is not None
+
+
+def test_low_power():
+    e = Emulator()
+    send(e, b"ATE0")
+    assert send(e, b"ATLP")[0] == b"OK\r"
+    assert e.sleeping
+    assert send(e, b" ")[0] == b"\rELM327 v1.5\r\r>"
+    assert not e.sleeping
+
+
+def test_url():
+    port = serial.serial_for_url("emulator://?protocol=7&timeout=0", timeout=0.1)
+    assert port.emulator.protocol == "7"
+    assert get_emulator("") is None
+    port.write(b"ATI\r")
+    assert port.read(100) == b"ATI\rELM327 v1.5\r\r>"
+    port.close()
+
+    with pytest.raises(serial.SerialException):
+        serial.serial_for_url("emulator://?bogus=1")
+
+    with Emulator(name="test-url") as e:
+        port = serial.serial_for_url("emulator://test-url")
+        assert port.emulator is e
+        e.disconnect()
+        with pytest.raises(serial.SerialException):
+            port.write(b"ATI\r")
+        with pytest.raises(serial.SerialException):
+            serial.serial_for_url("emulator://test-url")
+    assert get_emulator("test-url") is None
+
+
+@pytest.mark.parametrize("protocol", ["6", "7", "3"])
+def test_obd(protocol):
+    url = "emulator://?protocol=%s&timeout=0.01" % protocol
+    o = obd.OBD(url, protocol=protocol)
+    assert o.status() == obd.OBDStatus.CAR_CONNECTED
+    assert o.protocol_id() == protocol
+    assert o.supports(commands.RPM)
+    assert o.supports(commands.VIN)
+    assert o.query(commands.RPM).value.magnitude == 1726.0
+    assert o.query(commands.RPM).value.magnitude == 1726.0  # repeated with a CR
+    assert o.query(commands.VIN).value == b"WP0ZZZ99ZTS392124"
+    assert o.query(commands.GET_DTC).value == []
+
+    assert o.low_power() == ["OK"]
+    o.normal_power()
+    assert o.query(commands.RPM).value.magnitude == 1726.0
+    o.close()
+
+
+def test_obd_reconnect():
+    with Emulator(name="test-reconnect", timeout=0.0) as e:
+        o = obd.OBD("emulator://test-reconnect", protocol="6", reconnect=True)
+        o.supervisor.initial_delay = 0.01
+        assert o.is_connected()
+
+        e.disconnect()
+        assert o.query(commands.RPM).is_null()
+        assert not o.is_connected()
+
+        e.reconnect()
+        assert o.query(commands.RPM).value.magnitude == 1726.0
+        assert o.supervisor.outages.count == 1
+        o.close()
+
+
+def test_async_gives_up():
+    with Emulator(name="test-async-gives-up", timeout=0.0) as e:
+        a = obd.Async("emulator://test-async-gives-up", protocol="6", delay_cmds=0)
+        a.supervisor = obd.Supervisor(a, initial_delay=0.01, max_delay=0.01, max_attempts=3)
+        a.watch(commands.RPM)
+        a.start()
+        e.disconnect()
+
+        deadline = time.monotonic() + 10.0
+        while a.running and (time.monotonic() < deadline):
+            time.sleep(0.01)
+        assert not a.running  # the loop ended on its own, without stop()
+        assert a.supervisor.attempts == 3
+        a.close()
+
+
+def test_async_timestamps():
+    responses = []
+    a = obd.Async("emulator://?timeout=0&latency=0.02", protocol="6", delay_cmds=0)
+    a.watch(commands.RPM, callback=responses.append)
+    a.start()
+    while len(responses) < 3:
+        time.sleep(0.01)
+    a.stop()
+    a.close()
+
+    for r in responses:
+        assert r.sent_monotonic < r.received_monotonic
+        assert r.latency > 0.015  # the emulator schedules its reply from the write, before the flush
+        assert r.sent_time <= r.received_time == r.time
+    assert responses[0].received_monotonic < responses[1].sent_monotonic
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="needs a pseudo-terminal")
+def test_pty():
+    with Emulator(protocol="6", timeout=0.0) as e:
+        port = e.serve_pty()
+        o = obd.OBD(port, protocol="6")
+        assert o.status() == obd.OBDStatus.CAR_CONNECTED
+        assert o.query(commands.SPEED).value.magnitude == 50.0
+        o.close()
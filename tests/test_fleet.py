@@ -0,0 +1,156 @@
+"""
+    Tests for the FleetPoller, against emulated adapters
+"""
+
+import threading
+import time
+
+import pytest
+
+import obd
+from obd import commands
+from obd.emulator import Emulator, get_emulator
+from obd.fleet import FleetPoller, IDLE, DOWN
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def connections():
+    opened = []
+
+    def connect(url):
+        o = obd.OBD(url, protocol="6")
+        assert o.is_connected()
+        opened.append(o)
+        return o
+
+    yield connect
+    for o in opened:
+        o.close()
+
+
+def test_single_thread(connections):
+    fleet = [connections("emulator://?timeout=0&latency=0.05") for _ in range(4)]
+    poller = FleetPoller(delay_cmds=0)
+    received = []
+    for o in fleet:
+        poller.watch(o, commands.RPM, received.append)
+        poller.watch(o, commands.SPEED)
+
+    threads = threading.active_count()
+    start = time.monotonic()
+    poller.start()
+    assert threading.active_count() == threads + 1
+    wait_for(lambda: all(a.rounds >= 1 for a in poller.adapters))
+    # the adapters are waited on together, not one after the other
+    assert time.monotonic() - start < 4 * 2 * 0.05
+    poller.stop()
+
+    for o in fleet:
+        assert poller.query(o, commands.RPM).value.magnitude == 1726.0
+        assert poller.query(o, commands.SPEED).value.magnitude == 50.0
+        assert poller.query(o, commands.SPEED).received_monotonic is not None
+    assert len(received) >= 4
+    assert all(a.state == IDLE for a in poller.adapters)
+    assert poller.query(fleet[0], commands.COOLANT_TEMP).is_null()
+
+
+def test_file_descriptors(connections):
+    emulators = [Emulator(protocol="6", timeout=0.0) for _ in range(3)]
+    try:
+        fleet = [connections("tcp://%s:%d" % e.serve_tcp()) for e in emulators]
+        poller = FleetPoller(delay_cmds=0)
+        for o in fleet:
+            poller.watch(o, commands.RPM)
+        assert all(a.fd is not None for a in poller.adapters)
+
+        for _ in range(100):
+            poller.poll(0.1)
+        assert all(a.rounds > 10 for a in poller.adapters)
+        for o in fleet:
+            assert poller.query(o, commands.RPM).value.magnitude == 1726.0
+        poller.close()
+        for o in fleet:
+            o.close()
+    finally:
+        for e in emulators:
+            e.close()
+
+
+def test_headers(connections):
+    o = connections("emulator://fleet-headers?timeout=0")
+    emulator = get_emulator("fleet-headers")
+    pids = obd.OBDCommand("PIDS_A", "Supported PIDs [01-20], from the transmission", b"0100", 6,
+                          commands.PIDS_A.decode, header=b"7E1")
+    poller = FleetPoller(delay_cmds=0)
+    poller.watch(o, commands.RPM)
+    poller.watch(o, pids, force=True)
+    for _ in range(20):
+        poller.poll(0.1)
+    assert poller.adapter(o).rounds > 2
+    assert poller.query(o, pids).value is not None
+    poller.close()
+    assert emulator.header == "7E1"
+
+    # the connection is handed back, and sets its header again
+    assert poller.adapter(o) is None
+    assert o.query(commands.RPM).value.magnitude == 1726.0
+    assert emulator.header == "7E0"
+    emulator.close()
+
+
+def test_header_rejected(connections):
+    o = connections("emulator://?timeout=0")
+    rpm = obd.OBDCommand("RPM_7E", "Engine RPM, behind a header the adapter rejects", b"010C", 4,
+                         commands.RPM.decode, header=b"7E")
+    poller = FleetPoller(delay_cmds=0)
+    poller.watch(o, commands.SPEED)
+    poller.watch(o, rpm, force=True)
+    for _ in range(20):
+        poller.poll(0.1)
+    assert poller.adapter(o).rounds > 2
+    assert poller.query(o, rpm).is_null()  # not the engine's answer, on the previous header
+    assert poller.query(o, commands.SPEED).value.magnitude == 50.0
+    poller.close()
+
+
+def test_timeout(connections):
+    o = connections("emulator://?timeout=0&latency=0.3")
+    poller = FleetPoller(delay_cmds=0, timeout=0.1)
+    poller.watch(o, commands.RPM)
+    deadline = time.monotonic() + 0.5
+    while time.monotonic() < deadline:
+        poller.poll(0.05)
+    adapter = poller.adapter(o)
+    assert adapter.timeouts >= 1
+    assert poller.query(o, commands.RPM).is_null()
+
+
+def test_disconnect(connections):
+    a = connections("emulator://fleet-down?timeout=0")
+    b = connections("emulator://?timeout=0")
+    poller = FleetPoller(delay_cmds=0)
+    poller.watch(a, commands.RPM)
+    poller.watch(b, commands.RPM)
+    get_emulator("fleet-down").disconnect()
+    for _ in range(20):
+        poller.poll(0.1)
+    assert poller.adapter(a).state == DOWN
+    assert poller.adapter(b).rounds > 2
+    get_emulator("fleet-down").close()
+
+
+def test_rejected(connections):
+    poller = FleetPoller()
+    with pytest.raises(ValueError):
+        poller.add(obd.OBD("socketcan://emulator"))
+    o = connections("emulator://?timeout=0")
+    o.close()
+    with pytest.raises(ValueError):
+        poller.add(o)
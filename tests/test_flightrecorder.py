@@ -0,0 +1,145 @@
+"""
+    Tests for the flight recorder
+"""
+
+import os
+import time
+
+import pytest
+
+import obd
+from obd import Unit
+from obd.OBDResponse import OBDResponse, Status
+from obd.protocols.protocol import Frame, Message
+from obd.flightrecorder import FlightRecorder, FlightLog, NewDTC, MILChange, Threshold, \
+    decode, FRAME, SAMPLE, TRIGGER, SLOT_DATA
+
+
+def response(command, value, received, raw=None):
+    messages = [Message([Frame(raw)])] if raw else []
+    r = OBDResponse(command, messages)
+    r.value = value
+    r.received_monotonic = received
+    return r
+
+
+def rpm(v, t):
+    return response(obd.commands.RPM, Unit.Quantity(v, Unit.rpm), t, raw="7E8 04 41 0C 00 00")
+
+
+def test_ring(tmpdir):
+    path = str(tmpdir.join("obd.ring"))
+    t = time.monotonic()
+    with FlightRecorder(path, size=64 * 101, frames=False) as recorder:
+        for i in range(250):
+            recorder(rpm(i, t + i))
+        records = recorder.records()
+
+    # only the newest records are kept
+    assert len(records) == 100
+    assert decode(records[0]) == ("RPM", 150.0)
+    assert decode(records[-1]) == ("RPM", 249.0)
+
+    # the ring is readable, and continues where it left off
+    with FlightLog(path) as log:
+        assert log.trigger_time is None
+        assert [v for _, _, v in log.samples("RPM")][-1] == 249.0
+    with FlightRecorder(path, size=64 * 101, frames=False) as recorder:
+        recorder(rpm(1000, t + 300))
+        assert decode(recorder.records()[-1]) == ("RPM", 1000.0)
+        assert decode(recorder.records()[-2]) == ("RPM", 249.0)
+
+
+def test_long_records(tmpdir):
+    path = str(tmpdir.join("obd.ring"))
+    dtcs = [("P%04d" % i, "x" * 20) for i in range(10)]
+    with FlightRecorder(path, size=64 * 100) as recorder:
+        recorder(response(obd.commands.GET_DTC, dtcs, time.monotonic()))
+        records = recorder.records()
+    assert len(records) == 1
+    assert len(records[0].data) > SLOT_DATA
+    assert decode(records[0]) == ("GET_DTC", [list(d) for d in dtcs])
+
+
+def test_frames(tmpdir):
+    path = str(tmpdir.join("obd.ring"))
+    with FlightRecorder(path, size=64 * 100) as recorder:
+        recorder(rpm(800, time.monotonic()))
+        recorder(response(obd.commands.SPEED, None, time.monotonic()))
+        records = recorder.records()
+    assert [r.kind for r in records] == [FRAME, SAMPLE, SAMPLE]
+    assert decode(records[0]) == "7E8 04 41 0C 00 00"
+    assert decode(records[2]) == ("SPEED", None)
+
+
+def test_capture(tmpdir):
+    path = str(tmpdir.join("obd.ring"))
+    t = time.monotonic()
+    trigger = Threshold(obd.commands.RPM, above=5000)
+    with FlightRecorder(path, pre=10, post=5, triggers=[trigger], frames=False) as recorder:
+        for i in range(60):
+            recorder(rpm(6000 if 30 <= i < 33 else 1000, t + i))
+            if i == 34:
+                assert recorder.captures == []  # still in the post window
+        assert len(recorder.captures) == 1  # fired once, on the way up
+
+    with FlightLog(recorder.captures[0]) as log:
+        assert log.trigger_time is not None
+        records = log.records()
+        triggers = [decode(r) for r in records if r.kind == TRIGGER]
+        assert triggers == ["RPM = 6000"]
+        samples = log.samples()
+        assert len(samples) == 16  # 10 s before, 5 s after
+        assert samples[0][2] == 1000.0 and samples[0][0] == pytest.approx(log.trigger_time - 10)
+        assert samples[-1][0] == pytest.approx(log.trigger_time + 5)
+
+
+def test_capture_on_close(tmpdir):
+    path = str(tmpdir.join("obd.ring"))
+    with FlightRecorder(path, post=60, capture_dir=str(tmpdir.mkdir("captures"))) as recorder:
+        recorder(rpm(800, time.monotonic()))
+        recorder.trigger("button")
+    assert len(recorder.captures) == 1
+    assert os.path.dirname(recorder.captures[0]).endswith("captures")
+    with FlightLog(recorder.captures[0]) as log:
+        assert [decode(r) for r in log.records() if r.kind == TRIGGER] == ["button"]
+
+
+def test_capture_names(tmpdir):
+    path = str(tmpdir.join("obd.ring"))
+    triggers = [lambda r: "first", lambda r: "second"]  # fire on the same response
+    with FlightRecorder(path, post=0, triggers=triggers) as recorder:
+        recorder(rpm(800, time.monotonic()))
+    assert len(set(recorder.captures)) == 2
+    assert recorder.captures[1] == recorder.captures[0].replace(".obdflt", "-1.obdflt")
+    for capture, reason in zip(recorder.captures, ["first", "second"]):
+        with FlightLog(capture) as log:
+            assert reason in [decode(r) for r in log.records() if r.kind == TRIGGER]
+
+
+def test_triggers():
+    dtc = NewDTC()
+    assert dtc(response(obd.commands.GET_DTC, [("P0104", "")], 0)) is None  # baseline
+    assert dtc(response(obd.commands.GET_DTC, [("P0104", "")], 1)) is None
+    assert dtc(response(obd.commands.GET_DTC, [("P0104", ""), ("P0300", "")], 2)) == "new DTC: P0300"
+    assert dtc(response(obd.commands.RPM, None, 3)) is None
+
+    mil = MILChange()
+    off, on = Status(), Status()
+    on.MIL = True
+    assert mil(response(obd.commands.STATUS, off, 0)) is None
+    assert mil(response(obd.commands.STATUS, off, 1)) is None
+    assert mil(response(obd.commands.STATUS, on, 2)) == "MIL on"
+    assert mil(response(obd.commands.STATUS, off, 3)) == "MIL off"
+
+    low = Threshold(obd.commands.ELM_VOLTAGE, below=11.5)
+    assert low(response(obd.commands.ELM_VOLTAGE, Unit.Quantity(12.6, Unit.volt), 0)) is None
+    assert low(response(obd.commands.ELM_VOLTAGE, Unit.Quantity(11.0, Unit.volt), 1)) == "ELM_VOLTAGE = 11.0"
+    assert low(response(obd.commands.ELM_VOLTAGE, Unit.Quantity(10.0, Unit.volt), 2)) is None
+
+
+def test_bad_file(tmpdir):
+    path = tmpdir.join("garbage")
+    path.write(b"not a flight recorder file" * 4, mode="wb")
+    with pytest.raises(ValueError):
+        FlightLog(str(path))
@@ -0,0 +1,123 @@
+"""
+    Tests for the declarative command definitions (Torque-style formulas)
+"""
+
+import json
+from binascii import unhexlify
+
+import pytest
+
+import obd
+from obd import commands
+from obd.commands import Commands
+from obd.formulas import bit_field, compile_formula, define, load_definitions, translate
+from obd.protocols import ECU
+from obd.protocols.protocol import Message
+from obd.UnitsAndScaling import Unit
+
+
+def m(hex_data, ecu=ECU.ENGINE):
+    message = Message([])
+    message.data = bytearray(unhexlify(hex_data))
+    message.ecu = ecu
+    return [message]
+
+
+def test_translate():
+    expression, used = translate("((A*256)+B)/4", "d", 2)
+    assert expression == "( ( d[2] * 256 ) + d[3] ) / 4"
+    assert used == set([0, 1])
+    assert translate("AA + {B:7}")[0] == "d[26] + ((d[1] >> 7) & 1)"
+
+
+@pytest.mark.parametrize("formula", ["A**B", "__import__('os')", "A +", "{A:8}", "foo(A)", "a",
+                                     "A.real", "A[0]", "lambda: A", "Signed(A, B)", "1 if A else 2"])
+def test_invalid(formula):
+    with pytest.raises(ValueError):
+        translate(formula)
+
+
+def test_builtin_equivalence():
+    rpm = compile_formula("((A*256)+B)/4", 2, Unit.rpm)
+    for data in ["410C0000", "410C1AF8", "410CFFFF"]:
+        assert rpm(m(data)) == commands.RPM.decode(m(data))
+
+    # a single byte: looked up in a table
+    temp = compile_formula("A-40", 2, Unit.celsius)
+    for x in range(256):
+        data = "4105%02X" % x
+        assert temp(m(data)).magnitude == commands.COOLANT_TEMP.decode(m(data)).magnitude
+
+
+def test_values():
+    assert compile_formula("Signed(A)", 3)(m("621940FF")) == -1
+    assert compile_formula("{B:3}", 2)(m("41010008")) == 1
+    assert compile_formula("100/A", 2)(m("410100")) is None  # division by zero
+    assert compile_formula("A/B", 2)(m("41010100")) is None
+    assert compile_formula("A+B", 2)(m("410101")) is None  # too short
+    assert compile_formula("0x10 * A", 2)(m("410102")) == 32
+
+
+def test_bit_field():
+    assert compile_formula(bit_field("A", 4, 4), 2)(m("4101A5")) == 10
+    assert compile_formula(bit_field(0, 0, 12, True, 0.5), 2)(m("4101FFFF")) == -0.5
+    assert compile_formula(bit_field("B", 1, 3, False, 2, -1), 2)(m("4101000E")) == 13
+
+
+def test_define():
+    c = define({"name": "BOOST", "description": "Boost pressure", "command": "22 19 40",
+                "header": "7e1", "ecu": "transmission", "formula": "((A*256)+B)/4 - 100",
+                "unit": "kilopascal"})
+    assert (c.command, c.header, c.ecu) == (b"221940", b"7E1", ECU.TRANSMISSION)
+    assert c.desc == "Boost pressure"
+    assert c(m("62194001F4", ECU.TRANSMISSION)).value == 25.0 * Unit.kilopascal
+
+    c = define({"name": "GEAR", "command": "221A20", "byte": "A", "bit": 4, "length": 4})
+    assert c(m("621A2035")).value == 3
+
+    for bad in [{"name": "boost", "command": "221940", "formula": "A"},
+                {"name": "BOOST", "command": "22194", "formula": "A"},
+                {"name": "BOOST", "command": "221940", "formula": "A +"}]:
+        with pytest.raises(ValueError):
+            define(bad)
+
+
+def test_load(tmp_path):
+    definitions = [
+        {"name": "BOOST", "description": "Boost pressure", "command": "221940",
+         "formula": "((A*256)+B)/4 - 100", "unit": "kilopascal"},
+        {"name": "GEAR", "description": "Selected gear", "command": "221A20",
+         "byte": "A", "bit": 4, "length": 4},
+    ]
+    path = tmp_path / "oem.json"
+    path.write_text(json.dumps({"commands": definitions}))
+    boost, gear = load_definitions(str(path))
+    assert boost.name == "BOOST"
+    assert gear(m("621A2035")).value == 3
+
+    path = tmp_path / "oem.csv"
+    path.write_text("name, description, command, formula, unit, byte, bit, length, signed, scale, offset\n"
+                    "BOOST, Boost pressure, 221940, ((A*256)+B)/4 - 100, kilopascal, , , , , ,\n"
+                    "TILT, Tilt, 221A21, , degree, B, 0, 8, 1, 0.5, 0\n")
+    boost, tilt = load_definitions(str(path))
+    assert boost(m("62194001F4")).value == 25.0 * Unit.kilopascal
+    assert tilt(m("621A2100FE")).value == -1.0 * Unit.degree
+
+    yaml = pytest.importorskip("yaml")
+    path = tmp_path / "oem.yaml"
+    path.write_text(yaml.safe_dump(definitions))
+    assert [c.name for c in load_definitions(str(path))] == ["BOOST", "GEAR"]
+
+
+def test_registry():
+    registry = Commands()
+    count = len(registry)
+    (c,) = registry.add_commands([define({"name": "DPF_LOAD", "command": "22044A",
+                                          "formula": "((A*256)+B)/100", "unit": "gram"})])
+    assert len(registry) == count + 1
+    assert registry.DPF_LOAD is c
+    assert registry[0x22][0x044A] is c
+
+    o = obd.OBD("emulator://?timeout=0", protocol="6")
+    assert o.query(c, force=True).value == 5.0 * Unit.gram
+    o.close()
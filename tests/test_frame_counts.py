@@ -0,0 +1,94 @@
+"""
+    Tests for the learned frame count model
+"""
+
+from obd.frame_counts import FrameCounts
+from obd.protocols.protocol import Frame, Message
+
+
+def message(tx_id, n_frames=1, parsed=True):
+    m = Message([Frame("") for _ in range(n_frames)])
+    for f in m.frames:
+        f.tx_id = tx_id
+    if parsed:
+        m.data = bytearray(b"\x41\x0C\x1A\xF8")
+    return m
+
+
+KEY = ("cmd", b"7E0", "6")
+
+
+def test_learn():
+    fc = FrameCounts()
+    assert fc.get(KEY) is None
+
+    fc.observe(KEY, [message(0), message(1, 2)], None)
+    assert fc.get(KEY) == 3
+    assert fc.learned == 1
+
+    fc.observe(KEY, [message(0), message(1, 2)], 3)
+    assert fc.hits == 1
+    assert fc.misses == 0
+
+
+def test_dont_learn_from_errors():
+    fc = FrameCounts()
+
+    fc.observe(KEY, [], None)
+    assert fc.get(KEY) is None
+
+    fc.observe(KEY, None, None)
+    assert fc.get(KEY) is None
+
+    # NO DATA, or anything else that the protocol couldn't parse
+    fc.observe(KEY, [message(0), message(None, parsed=False)], None)
+    assert fc.get(KEY) is None
+    assert fc.learned == 0
+
+
+def test_mismatch_relearns():
+    fc = FrameCounts()
+    fc.observe(KEY, [message(0), message(1)], None)
+    assert fc.get(KEY) == 2
+
+    # an ECU went missing (or its multi-frame message was truncated)
+    fc.observe(KEY, [message(0)], 2)
+    assert fc.misses == 1
+    assert fc.get(KEY) is None
+
+    fc.observe(KEY, [message(0)], None)
+    assert fc.get(KEY) == 1
+
+    # same frame count, but from a different ECU
+    fc.observe(KEY, [message(1)], 1)
+    assert fc.misses == 2
+    assert fc.get(KEY) is None
+
+
+def test_keys_are_separate():
+    fc = FrameCounts()
+    other = ("cmd", b"7E1", "6")
+    fc.observe(KEY, [message(0)], None)
+    assert fc.get(KEY) == 1
+    assert fc.get(other) is None
+
+
+def test_verify():
+    fc = FrameCounts(verify_every=2)
+    fc.observe(KEY, [message(0)], None)
+
+    for _ in range(2):
+        assert fc.get(KEY) == 1
+        fc.observe(KEY, [message(0)], 1)
+
+    # time to send one without a count
+    assert fc.get(KEY) is None
+    fc.observe(KEY, [message(0), message(1)], None)
+    assert fc.relearned == 1
+    assert fc.get(KEY) == 2
+
+
+def test_max_count():
+    fc = FrameCounts()
+    fc.observe(KEY, [message(0, 16)], None)
+    assert fc.get(KEY) is None
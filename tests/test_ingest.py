@@ -0,0 +1,106 @@
+"""
+    Tests for the offline ingestion of transcripts
+"""
+
+import os
+
+import pytest
+
+from obd.ingest import ingest, parse_transcript, find_transcripts
+from obd.recording import RecordWriter, WRITE, READ
+from obd.triplog import TripLog, NUMBER
+
+
+def write_transcript(path, session):
+    with RecordWriter(path) as w:
+        t = w._RecordWriter__start
+        for cmd, response in session:
+            t += 0.1
+            w.write(WRITE, cmd, t)
+            t += 0.1
+            w.write(READ, response, t)
+
+
+CAN_SESSION = [
+    (b"ATZ\r", b"\r\rELM327 v1.5\r\r>"),
+    (b"ATE0\r", b"ATE0\rOK\r\r>"),
+    (b"ATH1\r", b"OK\r\r>"),
+    (b"ATSP0\r", b"OK\r\r>"),
+    (b"0100\r", b"SEARCHING...\r7E8 06 41 00 BE 3F B8 13 \r\r>"),
+    (b"ATDPN\r", b"A6\r\r>"),
+    (b"010C\r", b"7E8 04 41 0C 1A F8 \r\r>"),
+    (b"010D1\r", b"7E8 03 41 0D 32 \r\r>"),  # with the number of frames
+    (b"\r", b"7E8 03 41 0D 33 \r\r>"),  # repeats the previous command
+    (b"010D1\r", b"NO DATA\r\r>"),
+    (b"0902\r", b"7E8 10 14 49 02 01 57 50 30 \r7E8 21 5A 5A 5A 39 39 5A 54 \r7E8 22 53 33 39 32 31 32 34 \r\r>"),
+    (b"22F190\r", b"7E8 03 7F 22 11 \r\r>"),  # not a known command
+]
+
+LEGACY_SESSION = [
+    (b"ATZ\r", b"\r\rELM327 v1.5\r\r>"),
+    (b"ATTP3\r", b"OK\r\r>"),
+    (b"0100\r", b"48 6B 10 41 00 BE 3F B8 13 FF \r\r>"),
+    (b"010D\r", b"48 6B 10 41 0D 50 FF \r\r>"),
+]
+
+
+@pytest.fixture
+def fleet(tmpdir):
+    uploads = tmpdir.mkdir("uploads")
+    write_transcript(str(uploads.mkdir("car1").join("a.obdrec")), CAN_SESSION)
+    write_transcript(str(uploads.join("car1").mkdir("later").join("b.obdrec")), CAN_SESSION)
+    write_transcript(str(uploads.mkdir("car2").join("a.obdrec")), LEGACY_SESSION)
+    uploads.join("car2").join("notes.txt").write("not a transcript")
+    uploads.join("car2").join("broken.obdrec").write(b"garbage", mode="wb")
+    return uploads
+
+
+def test_parse_transcript(tmpdir):
+    path = str(tmpdir.join("a.obdrec"))
+    write_transcript(path, CAN_SESSION)
+    result = parse_transcript(path)
+    assert result.error is None
+    assert (result.requests, result.samples, result.unparsed) == (7, 5, 2)  # 0100 came before ATDPN
+
+    type_, unit, times, values = result.columns["SPEED"]
+    assert type_ == NUMBER
+    assert unit == "kilometer_per_hour"
+    assert list(values[:2]) == [50.0, 51.0]
+    assert values[2] != values[2]  # NO DATA is NaN
+    assert times[1] - times[0] == pytest.approx(0.2)
+
+    assert result.columns["RPM"][3][0] == 1726.0
+    assert result.columns["VIN"][3] == [bytearray(b"WP0ZZZ99ZTS392124")]
+
+
+def test_forced_protocol(tmpdir):
+    path = str(tmpdir.join("a.obdrec"))
+    write_transcript(path, LEGACY_SESSION[2:])  # no ATTP
+    assert parse_transcript(path).samples == 0
+    assert list(parse_transcript(path, protocol="3").columns["SPEED"][3]) == [80.0]
+
+
+def test_find_transcripts(fleet):
+    found = find_transcripts([str(fleet)])
+    assert [(v, os.path.basename(p)) for v, p in found] == \
+        [("car1", "a.obdrec"), ("car1", "b.obdrec"), ("car2", "a.obdrec"), ("car2", "broken.obdrec")]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_ingest(fleet, tmpdir, workers):
+    out = str(tmpdir.join("trips"))
+    summaries = ingest([str(fleet)], out, workers=workers, chunksize=1)
+    assert list(summaries) == ["car1", "car2"]
+    assert summaries["car1"]["files"] == 2
+    assert summaries["car1"]["samples"] == 10
+    assert summaries["car2"]["errors"] == 1
+
+    with TripLog(os.path.join(out, "car1.obdtrip")) as log:
+        assert log.columns == ["RPM", "SPEED", "VIN"]
+        times, values = log["RPM"]
+        assert list(values) == [1726.0, 1726.0]
+        assert times[0] < times[1]
+        assert log["VIN"][1] == ["WP0ZZZ99ZTS392124"] * 2
+    with TripLog(os.path.join(out, "car2.obdtrip")) as log:
+        assert log.columns == ["PIDS_A", "SPEED"]
+        assert list(log["SPEED"][1]) == [80.0]
@@ -0,0 +1,172 @@
+"""
+    Tests for periodic DID streaming (UDS ReadDataByPeriodicIdentifier)
+"""
+
+import threading
+import time
+
+import pytest
+
+import obd
+from obd import commands, Unit
+from obd.emulator import Emulator
+from obd.OBDResponse import OBDResponse
+from obd.periodic import PeriodicStream, FAST, MEDIUM
+from obd.uds import DID, UAS
+from obd.utils import OBDStatus
+
+
+RPM = DID("PERIODIC_RPM", "Engine speed", 0xF201, 2, UAS(False, 0.25, Unit.rpm))
+SOC = DID("PERIODIC_SOC", "Battery state of charge", 0xF202, 1, UAS(False, 0.5, Unit.percent))
+
+
+def stream(o, seconds, rate=FAST, **kwargs):
+    received = []
+    s = PeriodicStream(o, rate=rate, **kwargs)
+    s.watch(RPM, received.append)
+    s.watch(SOC)
+    assert s.start()
+    time.sleep(seconds)
+    s.stop()
+    return s, received
+
+
+@pytest.mark.parametrize("url", ["emulator://?timeout=0", "emulator://?timeout=0&protocol=7",
+                                 "socketcan://emulator", "socketcan://emulator?protocol=7"])
+def test_stream(url):
+    o = obd.OBD(url, protocol="7" if "protocol=7" in url else "6")
+    s, received = stream(o, 0.5)
+    assert 5 <= len(received) <= 15  # 20 per second
+    assert s.messages >= 2 * len(received) - 2
+    assert received[-1].value == 1726.0 * Unit.rpm
+    assert received[-1].command.command == b"22F201"
+    assert received[-1].received_monotonic is not None
+    assert s.query(SOC).value == 100.0 * Unit.percent
+
+    # the adapter is back to answering requests
+    assert o.query(commands.RPM).value.magnitude == 1726.0
+    o.close()
+
+
+def test_rates():
+    o = obd.OBD("emulator://?timeout=0", protocol="6")
+    s, received = stream(o, 0.5, rate=MEDIUM)
+    assert 1 <= len(received) <= 4  # 5 per second
+    o.close()
+
+
+def test_exclusive():
+    o = obd.OBD("emulator://?timeout=0", protocol="6")
+    s, received = stream(o, 0.0)  # stopped right away, for the DIDs to be watched
+    assert s.start()
+
+    # other threads' queries wait for the end of the stream
+    answers = []
+    t = threading.Thread(target=lambda: answers.append(o.query(commands.RPM)))
+    t.start()
+    time.sleep(0.3)
+    assert t.is_alive() and not answers
+    s.stop()
+    t.join()
+    assert answers[0].value.magnitude == 1726.0
+
+    # a command per DID, not per message
+    assert len(received) > 1
+    assert len(set([id(r.command) for r in received])) == 1
+    o.close()
+
+
+def test_tcp():
+    e = Emulator(protocol="6", timeout=0.0)
+    o = obd.OBD("tcp://%s:%d" % e.serve_tcp(), protocol="6")
+    s, received = stream(o, 0.5, rx_header="5E8")
+    assert len(received) >= 5
+    o.close()
+    e.close()
+
+
+def test_refused():
+    o = obd.OBD("emulator://?timeout=0", protocol="6")
+    s = PeriodicStream(o)
+    s.watch(DID("UNKNOWN", "Not a DID of the ECU", 0xF2FF, 1))
+    assert not s.start()
+    assert not s.running
+    with pytest.raises(ValueError):
+        s.watch(DID("NOT_PERIODIC", "", 0x028C, 1))
+    o.close()
+
+
+class FakeInterface(object):
+    """ prints the given lines in monitor mode """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.stopped = False
+
+    def monitor_start(self, cmd):
+        return True
+
+    def monitor_read(self, timeout):
+        time.sleep(0.01)
+        lines, self.lines = self.lines, []
+        return lines
+
+    def monitor_stop(self):
+        self.stopped = True
+
+
+class FakeConnection(object):
+    header = b"7E0"
+
+    def __init__(self, interface):
+        self.interface = interface
+        self.queries = []
+
+    def status(self):
+        return OBDStatus.CAR_CONNECTED
+
+    def protocol_id(self):
+        return "6"
+
+    def query(self, cmd, force=False):
+        self.queries.append(cmd.command)
+        r = OBDResponse(cmd)
+        r.value = True
+        return r
+
+    def forget_adapter_state(self, header=None):
+        pass
+
+    def exclusive(self):
+        return threading.RLock()
+
+
+def test_formats():
+    lines = [
+        "6E8 01 00 00",           # another ECU's traffic
+        "5E8 01 1A F8",           # the periodic DID, then the data
+        "7E8 04 6A 02 C8 00 00",  # a single frame, with the response SID
+        "BUFFER FULL",
+        "5E8 02",                 # truncated
+    ]
+    connection = FakeConnection(FakeInterface(lines))
+    s = PeriodicStream(connection, rx_header=None)
+    s.watch(RPM)
+    s.watch(SOC)
+    assert s.start()
+    time.sleep(0.1)
+    s.stop()
+    assert connection.queries == [b"2A030102", b"2A040102"]
+    assert connection.interface.stopped
+    assert s.query(RPM).value == 1726.0 * Unit.rpm
+    assert s.query(SOC).value == 100.0 * Unit.percent
+    assert s.messages == 3  # without a header filter, 6E8 passes too
+
+    connection = FakeConnection(FakeInterface(lines))
+    s = PeriodicStream(connection, rx_header="5e8")
+    s.watch(RPM)
+    s.watch(SOC)
+    s.start()
+    time.sleep(0.1)
+    s.stop()
+    assert s.messages == 1
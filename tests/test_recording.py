@@ -0,0 +1,116 @@
+"""
+    Tests for the record:// and replay:// ports
+"""
+
+import time
+
+import pytest
+import serial
+
+import obd
+from obd.recording import RecordWriter, read_records, transactions, WRITE, READ
+
+
+ELM_SESSION = [
+    (b"ATZ\r", b"\r\rELM327 v1.5\r\r>"),
+    (b"ATE0\r", b"ATE0\rOK\r\r>"),
+    (b"ATH1\r", b"OK\r\r>"),
+    (b"ATL0\r", b"OK\r\r>"),
+    (b"ATTP6\r", b"OK\r\r>"),
+    (b"0100\r", b"7E8 06 41 00 00 18 00 00 \r\r>"),
+    (b"0100\r", b"7E8 06 41 00 00 18 00 00 \r\r>"),
+    (b"0600\r", b"NO DATA\r\r>"),
+    (b"0900\r", b"NO DATA\r\r>"),
+    (b"010C\r", b"7E8 04 41 0C 1A F8 \r\r>"),
+]
+
+
+def write_session(path, session, gap=0.0):
+    with RecordWriter(path) as w:
+        t = time.monotonic()
+        for cmd, response in session:
+            w.write(WRITE, cmd, t)
+            t += gap
+            w.write(READ, response, t)
+
+
+def test_roundtrip(tmpdir):
+    path = str(tmpdir.join("session.obdrec"))
+    write_session(path, ELM_SESSION[:2], gap=0.25)
+
+    start, records = read_records(path)
+    assert abs(start - time.time()) < 60
+    assert [r.kind for r in records] == [WRITE, READ, WRITE, READ]
+    assert records[0].data == b"ATZ\r"
+    assert records[3].data == b"ATE0\rOK\r\r>"
+    assert abs((records[1].time - records[0].time) - 0.25) < 1e-5
+
+    t = transactions(records)
+    assert len(t) == 2
+    assert t[1][0].data == b"ATE0\r"
+    assert [r.data for r in t[1][1]] == [b"ATE0\rOK\r\r>"]
+
+
+def test_bad_file(tmpdir):
+    path = tmpdir.join("garbage")
+    path.write(b"not a transcript", mode="wb")
+    with pytest.raises(ValueError):
+        read_records(str(path))
+
+
+def test_record(tmpdir):
+    path = str(tmpdir.join("loop.obdrec"))
+    port = serial.serial_for_url("record://%s?port=loop://" % path, timeout=0.1)
+    port.write(b"ATZ\r")
+    assert port.read(4) == b"ATZ\r"
+    port.close()
+
+    _, records = read_records(path)
+    assert [(r.kind, r.data) for r in records] == [(WRITE, b"ATZ\r"), (READ, b"ATZ\r")]
+
+
+def test_replay_port(tmpdir):
+    path = str(tmpdir.join("session.obdrec"))
+    write_session(path, ELM_SESSION[:3])
+
+    port = serial.serial_for_url("replay://%s" % path, timeout=0.1)
+    assert port.read(1) == b""  # nothing written yet
+
+    # out of order writes are found further along
+    port.write(b"ATE0\r")
+    assert port.in_waiting == 10
+    assert port.read(100) == b"ATE0\rOK\r\r>"
+    assert port.remaining == 1
+
+    port.write(b"0100\r")  # not in the transcript
+    assert port.read(100) == b""
+    port.close()
+
+    port = serial.serial_for_url("replay://%s?strict=1" % path, timeout=0.1)
+    with pytest.raises(serial.SerialException):
+        port.write(b"ATE0\r")
+
+
+def test_replay_timing(tmpdir):
+    path = str(tmpdir.join("session.obdrec"))
+    write_session(path, ELM_SESSION[:1], gap=0.2)
+
+    port = serial.serial_for_url("replay://%s?timing=original" % path, timeout=1)
+    port.write(b"ATZ\r")
+    assert port.in_waiting == 0
+    t = time.monotonic()
+    assert port.read(100) == b"\r\rELM327 v1.5\r\r>"
+    assert time.monotonic() - t > 0.15
+
+
+def test_replay_obd(tmpdir):
+    """ plays a session back through the unmodified OBD/ELM327 stack """
+    path = str(tmpdir.join("session.obdrec"))
+    write_session(path, ELM_SESSION)
+
+    o = obd.OBD("replay://%s" % path, baudrate=38400, protocol="6", check_voltage=False)
+    assert o.is_connected()
+    assert o.supports(obd.commands.RPM)
+
+    r = o.query(obd.commands.RPM)
+    assert r.value == 1726 * obd.Unit.rpm
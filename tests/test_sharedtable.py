@@ -0,0 +1,83 @@
+"""
+    Tests for the shared memory table of latest values
+"""
+
+import multiprocessing
+import struct
+
+import pytest
+
+import obd
+from obd import Unit
+from obd.OBDResponse import OBDResponse
+from obd.sharedtable import TablePublisher, SharedTable
+
+
+def response(command, value, received_time=1000.0):
+    r = OBDResponse(command, [])
+    r.value = value
+    r.received_time = received_time
+    return r
+
+
+def test_publish():
+    with TablePublisher() as publisher:
+        with SharedTable(publisher.name) as table:
+            assert table.read("RPM") is None
+            assert table.snapshot() == {}
+
+            publisher(response(obd.commands.RPM, Unit.Quantity(800, Unit.rpm)))
+            assert table["RPM"] == (800.0, "revolutions_per_minute", 1000.0, 1)
+
+            publisher(response(obd.commands.RPM, Unit.Quantity(900, Unit.rpm), 1001.0))
+            publisher(response(obd.commands.SPEED, None))
+            publisher(response(obd.commands.GET_DTC, [("P0104", "")]))
+
+            assert table.names() == ["RPM", "SPEED", "GET_DTC"]
+            snapshot = table.snapshot()
+            assert snapshot["RPM"] == (900.0, "revolutions_per_minute", 1001.0, 2)
+            assert snapshot["SPEED"].value is None
+            assert snapshot["GET_DTC"].value == [["P0104", ""]]
+            with pytest.raises(KeyError):
+                table["NOPE"]
+
+
+def test_full():
+    with TablePublisher(slots=1) as publisher:
+        publisher(response(obd.commands.RPM, Unit.Quantity(800, Unit.rpm)))
+        publisher(response(obd.commands.SPEED, Unit.Quantity(50, Unit.kph)))
+        with SharedTable(publisher.name) as table:
+            assert table.names() == ["RPM"]
+
+
+def test_locked_slot():
+    with TablePublisher() as publisher:
+        publisher(response(obd.commands.RPM, Unit.Quantity(800, Unit.rpm)))
+        with SharedTable(publisher.name, retries=20) as table:
+            assert table["RPM"].value == 800.0
+            buf = publisher._TablePublisher__shm.buf
+            seq = struct.unpack_from("<Q", buf, 64)[0]
+            struct.pack_into("<Q", buf, 64, seq + 1)  # a writer in the middle of an update
+            assert table.read("RPM") is None
+            struct.pack_into("<Q", buf, 64, seq + 2)
+            assert table["RPM"].value == 800.0
+
+
+def read_rpm(name, queue):
+    with SharedTable(name) as table:
+        queue.put(tuple(table["RPM"]))
+
+
+def test_other_process():
+    with TablePublisher() as publisher:
+        publisher(response(obd.commands.RPM, Unit.Quantity(800, Unit.rpm)))
+        queue = multiprocessing.Queue()
+        p = multiprocessing.Process(target=read_rpm, args=(publisher.name, queue))
+        p.start()
+        assert queue.get(timeout=10) == (800.0, "revolutions_per_minute", 1000.0, 1)
+        p.join()
+        assert p.exitcode == 0
+
+        # the segment outlives its readers
+        with SharedTable(publisher.name) as table:
+            assert table["RPM"].value == 800.0
@@ -0,0 +1,214 @@
+"""
+    Tests for the SocketCAN transport, on the emulated CAN bus
+    (and on vcan0, when it exists)
+"""
+
+import socket
+import time
+
+import pytest
+
+import obd
+from obd import commands
+from obd.emulator import EmulatedECU
+from obd.interfaces import interface_class
+from obd.protocols.protocol_can import isotp_segment
+from obd.elm327 import ELM327
+from obd.socketcan import SocketCAN
+from obd.utils import OBDStatus
+
+
+def bus_of(interface):
+    return interface._SocketCAN__bus
+
+
+def test_interface_class():
+    assert interface_class("socketcan://can0") is SocketCAN
+    assert interface_class("/dev/ttyUSB0") is ELM327
+    assert interface_class("socket://192.168.0.10:35000") is ELM327
+    assert interface_class(None) is ELM327
+
+
+def test_isotp_segment():
+    assert isotp_segment(bytearray(b"\x41\x0D\x32")) == [bytearray(b"\x03\x41\x0D\x32\x00\x00\x00\x00")]
+    frames = isotp_segment(bytearray(range(20)))
+    assert [f[0] for f in frames] == [0x10, 0x21, 0x22]
+    assert frames[0][1] == 20
+
+
+@pytest.mark.parametrize("protocol", ["6", "7"])
+def test_obd(protocol):
+    o = obd.OBD("socketcan://emulator?protocol=%s" % protocol)
+    assert o.status() == OBDStatus.CAR_CONNECTED
+    assert o.protocol_id() == protocol
+    assert o.port_name() == "socketcan://emulator?protocol=%s" % protocol
+    assert o.query(commands.RPM).value.magnitude == 1726.0
+    assert o.query(commands.VIN).value == b"WP0ZZZ99ZTS392124"  # multi-frame, with flow control
+    assert o.query(commands.ELM_VOLTAGE).is_null()
+    o.close()
+    assert o.status() == OBDStatus.NOT_CONNECTED
+
+
+def test_detect_protocol():
+    o = obd.OBD("socketcan://emulator")
+    assert o.protocol_id() == "6"
+    assert commands.SPEED in o.supported_commands
+    o.close()
+
+
+def test_frames_sent():
+    o = obd.OBD("socketcan://emulator?protocol=6")
+    bus = bus_of(o.interface)
+    del bus.sent[:]
+    o.query(commands.VIN)
+    # request (functional), flow control (to the engine)
+    assert bus.sent == [(0x7DF, b"\x02\x09\x02\x00\x00\x00\x00\x00"),
+                        (0x7E0, b"\x30\x00\x00\x00\x00\x00\x00\x00")]
+    o.close()
+
+
+def test_frame_counts():
+    o = obd.OBD("socketcan://emulator?protocol=6")
+    o.query(commands.SPEED)
+    start = time.monotonic()
+    r = o.query(commands.SPEED)  # two ECUs answer, and the count is now known
+    assert time.monotonic() - start < o.interface.timeout
+    assert r.value.magnitude == 50.0
+    o.close()
+
+
+def test_physical_addressing():
+    o = obd.OBD("socketcan://emulator?protocol=6", physical_addressing=True)
+    bus = bus_of(o.interface)
+    del bus.sent[:]
+    start = time.monotonic()
+    assert o.query(commands.RPM).value.magnitude == 1726.0
+    assert time.monotonic() - start < o.interface.timeout  # a single ECU, no need to wait
+    assert bus.sent[-1][0] == 0x7E0
+    o.close()
+
+
+def test_at_commands():
+    o = obd.OBD("socketcan://emulator?protocol=6")
+    i = o.interface
+    assert i.send_and_parse(b"AT SH 7E1 ")[0].raw() == "OK"
+    assert [m.tx_id for m in i.send_and_parse(b"010D")] == [1]
+    assert i.send_and_parse(b"AT SH 7DF ")[0].raw() == "OK"
+    assert i.send_and_parse(b"AT CRA 7E9")[0].raw() == "OK"
+    assert [m.tx_id for m in i.send_and_parse(b"010D")] == [1]
+    assert i.send_and_parse(b"AT AR")[0].raw() == "OK"
+    assert [m.tx_id for m in i.send_and_parse(b"")] == [0, 1]  # repeats 010D
+    assert i.send_and_parse(b"ATI")[0].raw() == "SocketCAN emulator"
+    assert i.send_and_parse(b"ATXYZ")[0].raw() == "?"
+    o.close()
+
+
+def test_multi_frame_request():
+    ecu = EmulatedECU(0, {"0100": "4100 00000000", "2EF19001020304050607": "6EF190"})
+    o = obd.OBD("socketcan://emulator?protocol=6")
+    bus = bus_of(o.interface)
+    bus.ecus = [ecu]
+    i = o.interface
+    i.send_and_parse(b"AT SH 7E0")
+    messages = i.send_and_parse(b"2EF19001020304050607")
+    assert messages[0].data == bytearray(b"\x6E\xF1\x90")
+    assert [f[1][0] & 0xF0 for f in bus.sent[-3:]] == [0x00, 0x10, 0x20]
+    o.close()
+
+
+def test_timestamps():
+    o = obd.OBD("socketcan://emulator?protocol=6")
+    r = o.query(commands.RPM)
+    assert r.sent_monotonic <= r.received_monotonic
+    assert r.time == r.received_time
+    o.close()
+
+
+def test_trace():
+    o = obd.OBD("socketcan://emulator?protocol=6", trace=True)
+    o.query(commands.RPM)
+    assert o.tracer.histogram(commands.RPM, "total").count == 1
+    assert o.tracer.histogram(commands.RPM, "adapter").count == 1
+    o.close()
+
+
+def test_async():
+    responses = []
+    a = obd.Async("socketcan://emulator?protocol=6", delay_cmds=0)
+    a.watch(commands.RPM, callback=responses.append)
+    a.start()
+    deadline = time.monotonic() + 5
+    while len(responses) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    a.stop()
+    a.close()
+    assert len(responses) >= 3
+    assert all([r.value.magnitude == 1726.0 for r in responses])
+
+
+def test_no_interface():
+    o = obd.OBD("socketcan://does-not-exist0")
+    assert o.status() == OBDStatus.NOT_CONNECTED
+
+
+def test_raw_bus_drain():
+    """ recv(0) reads the frames already queued on the socket, without waiting """
+    from obd.socketcan import RawBus, _CAN_FRAME
+
+    car, tester = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)  # keeps the frames apart, like CAN_RAW
+    bus = RawBus.__new__(RawBus)
+    bus.sock = tester
+    try:
+        for i in range(3):
+            car.send(_CAN_FRAME.pack(0x5E8, 3, bytes([0x01, i, 0x00])))
+        time.sleep(0.01)
+        assert [bus.recv(0) for i in range(4)] == [(0x5E8, bytes([0x01, i, 0x00])) for i in range(3)] + [None]
+
+        start = time.monotonic()
+        assert bus.recv(0.05) is None
+        assert time.monotonic() - start >= 0.04
+    finally:
+        car.close()
+        bus.close()
+
+
+def has_vcan():
+    try:
+        s = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+        s.bind(("vcan0",))
+        s.close()
+        return True
+    except (AttributeError, OSError):
+        return False
+
+
+@pytest.mark.skipif(not has_vcan(), reason="needs a vcan0 interface")
+def test_vcan():
+    """ an ECU answering on vcan0, from a second raw socket """
+    import threading
+    from obd.socketcan import RawBus
+
+    ecu_bus = RawBus("vcan0")
+    stop = threading.Event()
+    ecu = EmulatedECU(0, {"010D": "410D 32"})
+
+    def serve():
+        while not stop.is_set():
+            frame = ecu_bus.recv(0.05)
+            if frame and frame[0] in (0x7DF, 0x7E0) and frame[1][0] < 0x10:
+                payload = frame[1][1:1 + frame[1][0]]
+                response = ecu.respond(payload.hex().upper())
+                if response:
+                    for f in isotp_segment(response):
+                        ecu_bus.send(0x7E8, f)
+
+    t = threading.Thread(target=serve)
+    t.start()
+    try:
+        o = obd.OBD("socketcan://vcan0?protocol=6")
+        assert o.query(commands.SPEED).value.magnitude == 50.0
+        o.close()
+    finally:
+        stop.set()
+        t.join()
+        ecu_bus.close()
@@ -0,0 +1,72 @@
+"""
+    Tests for the reconnection supervisor
+"""
+
+from obd.supervisor import Supervisor
+
+
+class FakeConnection:
+    """ a connection that comes back after a given number of resume() calls """
+
+    def __init__(self, fail_count):
+        self.fail_count = fail_count
+        self.connected = False
+        self.resumes = 0
+
+    def is_connected(self):
+        return self.connected
+
+    def resume(self):
+        self.resumes += 1
+        if self.resumes > self.fail_count:
+            self.connected = True
+        return self.connected
+
+
+def test_already_connected():
+    c = FakeConnection(0)
+    c.connected = True
+    s = Supervisor(c)
+    assert s.recover()
+    assert c.resumes == 0
+    assert s.outages.count == 0
+
+
+def test_recover_with_backoff():
+    c = FakeConnection(2)
+    s = Supervisor(c, initial_delay=0.01, max_delay=0.02)
+    assert s.recover()
+    assert c.resumes == 3
+    assert s.attempts == 3
+    assert s.failed_attempts == 2
+    assert s.outages.count == 1
+    assert s.outages.last >= 0.03  # 0.01 + 0.02 of backoff
+    assert s.down_since is None
+    assert s.outage_duration() == 0.0
+
+
+def test_max_attempts():
+    c = FakeConnection(100)
+    s = Supervisor(c, initial_delay=0.0, max_attempts=3)
+    assert not s.recover()
+    assert c.resumes == 3
+    assert s.outages.count == 0
+
+    # the outage carries over to the next call
+    assert s.down_since is not None
+    c.fail_count = 0
+    assert s.recover()
+    assert s.outages.count == 1
+
+
+def test_keep_going():
+    c = FakeConnection(100)
+    s = Supervisor(c, initial_delay=10.0, max_attempts=None)
+    calls = []
+
+    def keep_going():
+        calls.append(None)
+        return len(calls) < 3
+
+    assert not s.recover(keep_going)  # must not wait for the 10 second backoff
+    assert c.resumes == 1
@@ -0,0 +1,111 @@
+"""
+    Tests for the tcp:// transport, against the emulator served on a TCP port
+"""
+
+import socket
+import time
+
+import pytest
+import serial
+
+import obd
+from obd import commands
+from obd.emulator import Emulator
+from obd.urlhandler import protocol_tcp
+from obd.utils import OBDStatus
+
+
+@pytest.fixture
+def emulator():
+    e = Emulator(protocol="6", timeout=0.0)
+    yield e
+    e.close()
+
+
+@pytest.fixture
+def events():
+    log = []
+
+    def listener(event, port):
+        log.append(event)
+
+    protocol_tcp.add_listener(listener)
+    yield log
+    protocol_tcp.remove_listener(listener)
+
+
+def url(emulator, query=""):
+    return "tcp://%s:%d%s" % (emulator.serve_tcp() + (query,))
+
+
+def test_obd(emulator, events):
+    o = obd.OBD(url(emulator, "?read_timeout=1"), protocol="6")
+    assert o.status() == OBDStatus.CAR_CONNECTED
+    assert o.query(commands.RPM).value is not None
+    assert o.interface.timeout == 0.1
+    o.close()
+    assert events == ["connect"]
+
+
+def test_socket_options(emulator):
+    port = protocol_tcp.Serial(url(emulator, "?rcvbuf=8192"))
+    sock = socket.socket(fileno=port.fileno())
+    try:
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE) == 2
+            assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT) == 3
+        if hasattr(socket, "TCP_USER_TIMEOUT"):
+            assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT) == 5000
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= 8192
+    finally:
+        sock.detach()
+        port.close()
+
+
+def test_bad_urls():
+    for bad in ["tcp://localhost", "tcp://:35000", "tcp://localhost:35000?bogus=1",
+                "tcp://localhost:35000?rcvbuf=lots"]:
+        with pytest.raises(serial.SerialException):
+            protocol_tcp.Serial.from_url(bad)
+    assert protocol_tcp.Serial.from_url("tcp://10.0.0.1:35000?read_timeout=0.5&nodelay=0") == \
+        (("10.0.0.1", 35000), {"read_timeout": 0.5, "nodelay": 0})
+
+
+def test_read_timeout(emulator):
+    port = protocol_tcp.Serial(url(emulator, "?read_timeout=0.1"), timeout=10)
+    start = time.monotonic()
+    assert port.read(1) == b""
+    assert time.monotonic() - start < 1
+    port.write(b"ATI\r")
+    assert port.read(4) == b"ATI\r"  # echo
+    port.close()
+
+
+def test_refused():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    o = obd.OBD("tcp://127.0.0.1:%d?connect_timeout=0.5" % port)
+    assert o.status() == OBDStatus.NOT_CONNECTED
+
+
+def test_lost_connection(emulator, events):
+    o = obd.OBD(url(emulator), protocol="6")
+    emulator.drop_client()
+    time.sleep(0.2)
+    assert o.query(commands.RPM, force=True).is_null()
+    assert o.status() == OBDStatus.NOT_CONNECTED
+    assert events == ["connect", "disconnect"]
+
+
+def test_reconnect(emulator, events):
+    o = obd.OBD(url(emulator, "?reconnect=3"), protocol="6")
+    emulator.drop_client()
+    time.sleep(0.2)
+    assert o.query(commands.RPM, force=True).value is not None
+    assert o.status() == OBDStatus.CAR_CONNECTED
+    assert events == ["connect", "disconnect", "reconnect"]
+    o.close()
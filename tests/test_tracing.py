@@ -0,0 +1,84 @@
+"""
+    Tests for the per-stage latency traces
+"""
+
+from urllib.request import urlopen
+
+import obd
+from obd import commands
+from obd.metrics import Histogram
+from obd.tracing import QueryTrace, Tracer, STAGES
+
+
+def test_histogram():
+    h = Histogram(buckets=[0.01, 0.1, 1.0])
+    assert h.quantile(0.5) is None
+
+    for value in [0.005, 0.005, 0.05, 0.5, 2.0]:
+        h.add(value)
+
+    assert h.counts == [2, 1, 1, 1]
+    assert h.count == 5
+    assert h.quantile(0.4) == 0.01
+    assert h.quantile(0.5) == 0.1
+    assert h.quantile(1.0) == 2.0
+    assert h.cumulative() == [(0.01, 2), (0.1, 3), (1.0, 4), (float("inf"), 5)]
+    assert h.as_dict()["max"] == 2.0
+
+
+def test_trace_durations():
+    t = QueryTrace(commands.RPM)
+    t.marks.update({"start": 1.0, "header_set": 1.5, "write_start": 2.0, "write_flushed": 3.0})
+    assert t.durations() == {"header": 0.5, "write": 1.0, "total": 2.0}
+
+
+def test_tracer():
+    tracer = Tracer()
+    exported = []
+    tracer.add_exporter(exported.append)
+    tracer.add_exporter(lambda t: 1 / 0)  # errors don't stop the recording
+
+    t = QueryTrace(commands.RPM)
+    t.mark("decoded")
+    t.ecus = (0, 1)
+    tracer.record(t)
+
+    assert exported == [t]
+    assert tracer.traces == 1
+    assert tracer.histogram(commands.RPM).count == 1
+    assert tracer.histogram("RPM", "decode") is None
+    assert tracer.ecu_histogram(1).count == 1
+    assert set(tracer.stats()["ecus"]) == set([0, 1])
+
+    text = tracer.text()
+    assert 'obd_query_seconds_count{command="RPM",segment="total"} 1' in text
+    assert 'obd_ecu_seconds_bucket{ecu="0",segment="total",le="+Inf"} 1' in text
+
+    tracer.reset()
+    assert tracer.histogram(commands.RPM) is None
+
+
+def test_obd_traces():
+    o = obd.OBD("emulator://?timeout=0", protocol="6", trace=True)
+    o.tracer.reset()  # forget the supported commands queries
+
+    traces = []
+    o.tracer.add_exporter(traces.append)
+    assert not o.query(commands.SPEED).is_null()
+
+    assert len(traces) == 1
+    marks = traces[0].marks
+    assert [s for s in STAGES if s in marks] == STAGES
+    assert sorted(marks.values()) == [marks[s] for s in STAGES]
+    assert traces[0].ecus == (0, 1)
+
+    assert o.tracer.histogram(commands.SPEED, "adapter").count == 1
+    assert o.tracer.ecu_histogram(1, "total").count == 1
+
+    host, port = o.tracer.serve()
+    try:
+        body = urlopen("http://%s:%d/metrics" % (host, port)).read().decode()
+    finally:
+        o.tracer.stop()
+    assert 'obd_query_seconds_count{command="SPEED",segment="parse"} 1' in body
+    o.close()
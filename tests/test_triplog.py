@@ -0,0 +1,136 @@
+"""
+    Tests for the columnar trip logs
+"""
+
+import math
+import time
+
+import pytest
+
+import obd
+from obd import Unit
+from obd.OBDResponse import OBDResponse
+from obd.triplog import TripLogWriter, TripLog
+
+
+def response(command, value, received=None):
+    r = OBDResponse(command, [])
+    r.value = value
+    r.received_monotonic = received
+    return r
+
+
+def test_roundtrip(tmpdir):
+    path = str(tmpdir.join("trip.obdtrip"))
+    t = time.monotonic()
+    with TripLogWriter(path, chunk_size=3) as log:
+        for i in range(10):
+            log(response(obd.commands.RPM, Unit.Quantity(800 + i, Unit.rpm), t + i))
+            log(response(obd.commands.SPEED, Unit.Quantity(i, Unit.kph), t + i + 0.5))
+        log(response(obd.commands.SPEED, None, t + 20))  # null response
+        log(response(obd.commands.GET_DTC, [("P0104", "Mass or Volume Air Flow Circuit Range/Performance")], t + 21))
+        assert log.samples == 22
+
+    with TripLog(path) as log:
+        assert log.columns == ["RPM", "SPEED", "GET_DTC"]
+        assert log.unit("RPM") == "revolutions_per_minute"
+        assert log.count("RPM") == 10
+        assert len(log.chunks("RPM")) == 4  # 3 + 3 + 3 + 1
+
+        times, values = log["RPM"]
+        assert list(values) == [800.0 + i for i in range(10)]
+        assert abs(times[0] - log.start_time - (t - log.start_monotonic)) < 1e-3
+        assert abs((times[9] - times[0]) - 9) < 1e-5
+
+        times, values = log["SPEED"]
+        assert len(values) == 11
+        assert math.isnan(values[-1])
+
+        times, values = log["GET_DTC"]
+        assert values == [[["P0104", "Mass or Volume Air Flow Circuit Range/Performance"]]]
+
+        assert len(log.chunks("RPM", start=times[0])) == 0
+        with pytest.raises(KeyError):
+            log["NOPE"]
+
+
+def test_unclosed(tmpdir):
+    path = str(tmpdir.join("trip.obdtrip"))
+    log = TripLogWriter(path, chunk_size=2)
+    for i in range(5):
+        log(response(obd.commands.RPM, Unit.Quantity(i, Unit.rpm)))
+    log.flush()  # no index written
+
+    with TripLog(path) as trip:
+        assert list(trip["RPM"][1]) == [0.0, 1.0, 2.0, 3.0, 4.0]
+    log.close()
+
+
+def test_append(tmpdir):
+    path = str(tmpdir.join("trip.obdtrip"))
+    with TripLogWriter(path) as log:
+        log(response(obd.commands.RPM, Unit.Quantity(1, Unit.rpm)))
+    with TripLogWriter(path, append=True) as log:
+        log(response(obd.commands.SPEED, Unit.Quantity(2, Unit.kph)))
+        log(response(obd.commands.RPM, Unit.Quantity(3, Unit.rpm)))
+
+    with TripLog(path) as log:
+        assert log.columns == ["RPM", "SPEED"]
+        assert list(log["RPM"][1]) == [1.0, 3.0]
+        assert list(log["SPEED"][1]) == [2.0]
+
+
+def test_bad_file(tmpdir):
+    path = tmpdir.join("garbage")
+    path.write(b"not a trip log", mode="wb")
+    with pytest.raises(ValueError):
+        TripLog(str(path))
+
+
+def test_numpy(tmpdir):
+    np = pytest.importorskip("numpy")
+    path = str(tmpdir.join("trip.obdtrip"))
+    with TripLogWriter(path, chunk_size=4) as log:
+        for i in range(10):
+            log(response(obd.commands.RPM, Unit.Quantity(i, Unit.rpm)))
+        log(response(obd.commands.GET_DTC, []))
+
+    with TripLog(path) as log:
+        arrays = log.to_numpy()
+        times, values = arrays["RPM"]
+        assert values.dtype == np.float64
+        assert np.array_equal(values, np.arange(10.0))
+        assert np.all(np.diff(times) >= 0)
+        assert list(arrays["GET_DTC"][1]) == [[]]
+
+
+def test_pandas(tmpdir):
+    pytest.importorskip("pandas")
+    path = str(tmpdir.join("trip.obdtrip"))
+    t = time.monotonic()
+    with TripLogWriter(path) as log:
+        log(response(obd.commands.RPM, Unit.Quantity(800, Unit.rpm), t))
+        log(response(obd.commands.SPEED, Unit.Quantity(10, Unit.kph), t + 1))
+
+    with TripLog(path) as log:
+        df = log.to_pandas()
+        assert list(df.columns) == ["RPM", "SPEED"]
+        assert len(df) == 2
+        assert df["RPM"].iloc[0] == 800
+
+
+def test_async(tmpdir):
+    path = str(tmpdir.join("trip.obdtrip"))
+    connection = obd.Async("emulator://", fast=False)
+    assert connection.is_connected()
+    with TripLogWriter(path) as log:
+        log.watch(connection, [obd.commands.RPM, obd.commands.SPEED])
+        connection.start()
+        time.sleep(0.5)
+        connection.stop()
+    connection.close()
+
+    with TripLog(path) as log:
+        assert set(log.columns) == set(["RPM", "SPEED"])
+        assert log.count("RPM") > 0
+        assert set(log["RPM"][1]) == set([1726.0])
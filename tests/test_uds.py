@@ -0,0 +1,115 @@
+"""
+    Tests for UDS ReadDataByIdentifier (Mode 22) commands
+"""
+
+from binascii import unhexlify
+
+import pytest
+
+import obd
+from obd.commands import Commands
+from obd.protocols import ECU
+from obd.protocols.protocol import Message
+from obd.uds import DID, ReadDataByIdentifier, batch, load_dids, read_did, split_response, text
+from obd.UnitsAndScaling import Unit, UAS
+
+
+SOC = DID("BATTERY_SOC", "Battery state of charge", 0x028C, 1, UAS(False, 0.5, Unit.percent))
+DPF = DID("DPF_LOAD", "Particulate filter load", 0x044A, 2, UAS(False, 0.01, Unit.gram))
+GEARBOX = DID("GEARBOX_TEMP", "Gearbox oil temperature", 0x1A10, 1, UAS(False, 1, Unit.celsius, -40))
+VIN = DID("VIN_DID", "VIN", 0xF190, 17, text)
+MISSING = DID("MISSING", "Not answered by the emulator", 0x1234, 2)
+
+
+def m(hex_data):
+    message = Message([])
+    message.data = bytearray(unhexlify(hex_data))
+    message.ecu = ECU.ENGINE
+    return message
+
+
+def test_command():
+    c = read_did(SOC)
+    assert c.command == b"22028C"
+    assert c.mode == 0x22
+    assert c.pid == 0x028C
+    assert c.name == "BATTERY_SOC"
+    assert c.clone() == c
+    assert c([m("62028CC8")]).value == 100.0 * Unit.percent
+
+    c = ReadDataByIdentifier([SOC, DPF])
+    assert c.command == b"22028C044A"
+    assert c.name == "BATTERY_SOC_DPF_LOAD"
+
+
+def test_split():
+    # answered out of order, with an unknown DID left out
+    data = unhexlify("62044A01F4028CC8")
+    assert split_response(data, [SOC, DPF, MISSING]) == {0x028C: b"\xc8", 0x044A: b"\x01\xf4"}
+    # truncated
+    assert split_response(unhexlify("62044A01"), [DPF]) == {}
+
+    c = ReadDataByIdentifier([SOC, DPF, MISSING])
+    r = c([m("62044A01F4028CC8")])
+    assert r.value == {"BATTERY_SOC": 100.0 * Unit.percent, "DPF_LOAD": 5.0 * Unit.gram}
+
+    responses = c.split(r)
+    assert responses[read_did(SOC)].value == 100.0 * Unit.percent
+    assert responses[read_did(DPF)].value == 5.0 * Unit.gram
+    assert responses[read_did(MISSING)].is_null()
+
+
+def test_negative_response():
+    assert read_did(SOC)([m("7F2231")]).value is None
+    # a response pending answer, then the response
+    assert read_did(SOC)([m("7F2278"), m("62028CC8")]).value == 100.0 * Unit.percent
+
+
+def test_batch():
+    transmission = read_did(GEARBOX, header=b"7E1", ecu=ECU.TRANSMISSION)
+    commands = batch([SOC, DPF, VIN, MISSING, transmission])
+    assert [c.command for c in commands] == [b"22028C044AF190", b"221234", b"221A10"]
+    assert commands[2].header == b"7E1"
+    assert commands[2].ecu == ECU.TRANSMISSION
+    assert [c.command for c in batch([SOC, DPF, VIN], max_dids=2)] == [b"22028C044A", b"22F190"]
+
+
+def test_registry():
+    commands = Commands()
+    count = len(commands)
+    added = commands.add_dids([SOC, DPF])
+    assert len(commands) == count + 2
+    assert commands.BATTERY_SOC is added[0]
+    assert commands["DPF_LOAD"] is added[1]
+    assert commands[0x22][0x028C] is added[0]
+    assert commands.has_pid(0x22, 0x044A)
+    assert not commands.has_pid(0x22, 0x1234)
+    assert commands.has_command(added[0])
+
+
+def test_load_dids(tmp_path):
+    path = tmp_path / "dids.csv"
+    path.write_text("name, description, did, bytes, signed, scale, offset, unit\n"
+                    "BATTERY_SOC, Battery state of charge, 028C, 1, 0, 0.5, 0, percent\n"
+                    "GEARBOX_TEMP, Gearbox oil temperature, 1A10, 1, 1, 1, -40, degC\n"
+                    "VIN_DID, VIN, F190, 17, , , , text\n")
+    soc, gearbox, vin = load_dids(str(path))
+    assert (soc.name, soc.did, soc.length) == ("BATTERY_SOC", 0x028C, 1)
+    assert soc.decode(b"\xc8") == 100.0 * Unit.percent
+    assert gearbox.decode(b"\xff").magnitude == -41
+    assert vin.decode(b"WP0ZZZ99ZTS392124") == "WP0ZZZ99ZTS392124"
+
+
+@pytest.mark.parametrize("protocol", ["6", "8"])
+def test_emulator(protocol):
+    o = obd.OBD("emulator://?timeout=0&protocol=%s" % protocol, protocol=protocol)
+    (c,) = batch([SOC, DPF, GEARBOX])
+    assert o.query(c, force=True).value == {
+        "BATTERY_SOC": 100.0 * Unit.percent,
+        "DPF_LOAD": 5.0 * Unit.gram,
+        "GEARBOX_TEMP": Unit.Quantity(50, Unit.celsius),
+    }
+    # a multi-frame response
+    assert o.query(read_did(VIN), force=True).value == "WP0ZZZ99ZTS392124"
+    assert o.query(read_did(MISSING), force=True).is_null()
+    o.close()